@@ -2,16 +2,16 @@ import re, sqlparse
 from collections import Counter
 import pandas as pd
 import logging
+from Lexer import normalize_query
 
 # Oracle SQL Parsing Basic Approach - Removes Comments for Uniformity
 
-COMMENT_REGEX = re.compile(r"(?s)/\*.*?\*/|--.*?\n")
 CTE_REGEX = re.compile(r"WITH\s+([\w]+)\s+AS\s*\((.*?)\)", re.I | re.DOTALL)
 TABLE_REGEX = re.compile(r"(?<![\.\w])([\w]+(?:\.[\w]+)?)", re.I)
 HINT_REGEX = re.compile(r"/\*\+\s*(.*?)\s*\*/", re.DOTALL)
 
 def norm_strip(sql):
-    return re.sub(r"\s+", " ", re.sub(COMMENT_REGEX, "", sql)).strip()
+    return normalize_query(sql)[0]
 
 def extract_tables(stmt):
     return [t.get_real_name() for t in stmt.flatten() if isinstance(t, sqlparse.sql.Identifier)]
@@ -34,8 +34,7 @@ def parse_oracle_sql(sql):
 # df['parsed_query'] = df['table_query'].astype(str).apply(parse_oracle_sql)
 
 def clean_query(sql):
-    sql = re.sub(COMMENT_REGEX, "", sql)
-    sql = re.sub(r"\s+", " ", sql).strip()
+    sql = norm_strip(sql)
     keywords = ["SELECT", "FROM", "WHERE", "GROUP BY", "ORDER BY", "HAVING", "JOIN", "ON"]
     for kw in keywords:
         sql = re.sub(fr"\b{kw}\b", f"\n{kw}", sql, flags=re.I)
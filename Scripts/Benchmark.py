@@ -0,0 +1,319 @@
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple, Any, Callable, Optional
+import pandas as pd
+import sqlglot
+from Readers import QUERY_COLUMN, read_queries
+
+# Reproducible throughput benchmark: every analyzer script runs as its own process over the same materialized corpora
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLES_DIR = os.path.join(os.path.dirname(SCRIPTS_DIR), "src", "Samples")
+SAMPLE_CORPORA = {
+    "sql_tester": "SQL_Tester.csv",
+    "table_data": "Table_Data_Sample.csv",
+    "custom_sql_json": "Custom_SQL_Queries_Sample.json",
+}
+TARGETS = ("sqlglot", "sqlparse", "base_level", "spark")
+RESULTS_FILE = "benchmark_results.json"
+BASELINE_FILE = "benchmark_baseline.json"
+# Relative drop in queries/sec (or growth in peak RSS) beyond which a result counts as a regression
+REGRESSION_TOLERANCE = 0.10
+SYNTHETIC_QUERIES = 50
+REPEATS = 3
+SEED = 42
+# SQLParse.py only reads Excel, whose cells hold at most this many characters
+EXCEL_CELL_LIMIT = 32767
+# Interval between memory samples of a running benchmark process; each sample scans /proc, so it is kept coarse
+RSS_SAMPLE_SECONDS = 0.1
+
+# Base_Level.py has no command line, so its parse_oracle_sql is driven over the corpus by this snippet
+BASE_LEVEL_RUNNER = """
+import sys
+from Base_Level import parse_oracle_sql
+from Readers import QUERY_COLUMN, read_queries
+for record in read_queries(sys.argv[1]):
+    try:
+        parse_oracle_sql(record[QUERY_COLUMN])
+    except Exception:
+        pass
+"""
+
+
+def _names(rng: random.Random, prefix: str, count: int) -> List[str]:
+    return [f"{prefix}_{rng.randrange(10 ** 6)}" for _ in range(count)]
+
+
+def deep_nesting_query(rng: random.Random, depth: int = 12) -> str:
+    """A column selected through `depth` levels of derived tables."""
+    table = f"CLARITY.{_names(rng, 'T', 1)[0]}"
+    sql = f"SELECT id, val FROM {table} WHERE status = {rng.randrange(9)}"
+    for level in range(depth):
+        sql = f"SELECT s{level}.id, s{level}.val + {level} AS val FROM ({sql}) s{level} WHERE s{level}.id > {rng.randrange(100)}"
+    return sql
+
+
+def many_ctes_query(rng: random.Random, ctes: int = 30) -> str:
+    """A chain of CTEs, each joining the previous one to another table."""
+    tables = _names(rng, "T", ctes)
+    definitions = [f"c0 AS (SELECT id, val FROM CLARITY.{tables[0]} WHERE val IS NOT NULL)"]
+    for index in range(1, ctes):
+        definitions.append(f"c{index} AS (SELECT p.id, p.val + t.val AS val FROM c{index - 1} p JOIN CLARITY.{tables[index]} t ON t.id = p.id)")
+    return f"WITH {', '.join(definitions)} SELECT id, SUM(val) AS total FROM c{ctes - 1} GROUP BY id"
+
+
+def wide_select_query(rng: random.Random, columns: int = 300) -> str:
+    """One SELECT with hundreds of plain, aliased and wrapped columns."""
+    names = _names(rng, "COL", columns)
+    items = [f"t.{name}" if index % 3 == 0 else f"NVL(t.{name}, 0) AS {name}_V" if index % 3 == 1 else f"u.{name} AS {name}_U"
+             for index, name in enumerate(names)]
+    table, other = _names(rng, "T", 2)
+    return f"SELECT {', '.join(items)} FROM CLARITY.{table} t LEFT JOIN CLARITY.{other} u ON u.id = t.id WHERE t.{names[0]} IS NOT NULL"
+
+
+def dblink_heavy_query(rng: random.Random, tables: int = 15) -> str:
+    """Oracle joins across many remote tables reached through DB links, with hints."""
+    names = _names(rng, "T", tables)
+    links = [f"LINK_{rng.randrange(4)}.WORLD" for _ in names]
+    joins = " ".join(f"JOIN REMOTE.{name}@{link} r{index} ON r{index}.id = r0.id" for index, (name, link) in enumerate(zip(names, links)) if index)
+    return f"SELECT /*+ PARALLEL(r0, 4) */ r0.id, r1.val FROM REMOTE.{names[0]}@{links[0]} r0 {joins} WHERE r0.created > DATE '2024-01-01'"
+
+
+SYNTHETIC_CORPORA: Dict[str, Callable[[random.Random], str]] = {
+    "deep_nesting": deep_nesting_query,
+    "many_ctes": many_ctes_query,
+    "wide_select": wide_select_query,
+    "dblink_heavy": dblink_heavy_query,
+}
+
+
+def load_corpus(name: str, synthetic_queries: int, seed: int) -> List[str]:
+    """The queries of one sample file, or `synthetic_queries` generated ones (the same for the same seed)."""
+    if name in SAMPLE_CORPORA:
+        return [record[QUERY_COLUMN] for record in read_queries(os.path.join(SAMPLES_DIR, SAMPLE_CORPORA[name]))]
+    rng = random.Random(f"{seed}:{name}")
+    return [SYNTHETIC_CORPORA[name](rng) for _ in range(synthetic_queries)]
+
+
+def materialize(queries: List[str], directory: str) -> Tuple[str, str, int]:
+    """Write the corpus as CSV (read by SQLGlot/PySpark/Base_Level) and as an Excel "Queries" sheet (read by SQLParse).
+
+    Returns both paths and how many queries had to be truncated to fit an Excel cell.
+    """
+    frame = pd.DataFrame({QUERY_COLUMN: queries})
+    csv_path = os.path.join(directory, "corpus.csv")
+    xlsx_path = os.path.join(directory, "corpus.xlsx")
+    frame.to_csv(csv_path, index=False)
+    truncated = sum(1 for query in queries if isinstance(query, str) and len(query) > EXCEL_CELL_LIMIT)
+    frame[QUERY_COLUMN] = frame[QUERY_COLUMN].map(lambda query: query[:EXCEL_CELL_LIMIT] if isinstance(query, str) else query)
+    frame.to_excel(xlsx_path, sheet_name="Queries", index=False)
+    return csv_path, xlsx_path, truncated
+
+
+def target_command(target: str, csv_path: str, xlsx_path: str, output_file: str, workers: int) -> List[str]:
+    script = lambda name: os.path.join(SCRIPTS_DIR, name)
+    if target == "sqlglot":
+        # Every query is analyzed: duplicates are not folded and no result cache is read
+        return [sys.executable, script("SQLGlot.py"), "--file_path", csv_path, "--output_file", output_file, "--dedup", "none", "--workers", str(workers)]
+    if target == "sqlparse":
+        return [sys.executable, script("SQLParse.py"), "--file_path", xlsx_path, "--sheet_name", "Queries", "--output_file", output_file]
+    if target == "base_level":
+        return [sys.executable, "-c", BASE_LEVEL_RUNNER, csv_path]
+    return [sys.executable, script("PySpark.py"), "--file_path", csv_path, "--output_file", output_file]
+
+
+def _process_tree_rss(root: int) -> Tuple[float, float]:
+    """Current resident MB of a process plus all its descendants, and the root's own high-water mark, from /proc."""
+    children: Dict[int, List[int]] = {}
+    resident: Dict[int, int] = {}
+    root_peak = 0
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/status", encoding="utf-8") as handle:
+                fields = dict(line.split(":", 1) for line in handle if ":" in line)
+        except OSError:
+            continue
+        pid = int(entry)
+        children.setdefault(int(fields.get("PPid", "0")), []).append(pid)
+        resident[pid] = int(fields.get("VmRSS", "0 kB").split()[0])
+        if pid == root:
+            root_peak = int(fields.get("VmHWM", "0 kB").split()[0])
+    total = 0
+    pending = [root]
+    while pending:
+        pid = pending.pop()
+        total += resident.get(pid, 0)
+        pending.extend(children.get(pid, []))
+    return total / 1024, root_peak / 1024
+
+
+def run_measured(command: List[str], cwd: str) -> Tuple[float, Optional[float], int, str]:
+    """Run a command to completion; return wall seconds, peak RSS in MB of it and its worker processes, exit code and output tail.
+
+    On Linux the process tree is sampled from /proc every RSS_SAMPLE_SECONDS, since a child's ru_maxrss starts from the
+    parent's own peak (it survives fork and exec) and would report this harness's memory rather than the script's.
+    The peak is None where neither /proc nor the POSIX resource module is available (Windows).
+    """
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [SCRIPTS_DIR, os.environ.get("PYTHONPATH")]))}
+    sample_tree = os.path.isdir("/proc")
+    peak_mb = 0.0
+    with tempfile.TemporaryFile(dir=cwd) as log:
+        started = time.perf_counter()
+        process = subprocess.Popen(command, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+        while sample_tree and process.poll() is None:
+            peak_mb = max(peak_mb, *_process_tree_rss(process.pid))
+            try:
+                # Wakes as soon as the process exits, so the sampling interval does not pad the measured time
+                process.wait(timeout=RSS_SAMPLE_SECONDS)
+            except subprocess.TimeoutExpired:
+                pass
+        returncode = process.wait()
+        seconds = time.perf_counter() - started
+        if not sample_tree:
+            try:
+                import resource
+            except ImportError:
+                peak_mb = None
+            else:
+                # ru_maxrss is in kilobytes on Linux and bytes on macOS
+                peak_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+        log.seek(0)
+        output = log.read().decode("utf-8", "replace")[-2000:]
+    return seconds, peak_mb, returncode, output
+
+
+def read_phases(output_file: str) -> Dict[str, Dict[str, float]]:
+    """Per-phase latency from the Phase Profile sheet SQLGlot.py writes with each run."""
+    try:
+        profile = pd.read_excel(output_file, sheet_name="Phase Profile")
+    except (FileNotFoundError, ValueError):
+        return {}
+    return {row["Phase"]: {"queries": int(row["Queries"]), "total_seconds": float(row["Total Seconds"]), "p50_ms": float(row["p50 ms"]),
+                           "p95_ms": float(row["p95 ms"]), "max_ms": float(row["Max ms"])} for _, row in profile.iterrows()}
+
+
+def benchmark(target: str, corpus: str, queries: List[str], repeats: int, workers: int) -> Dict[str, Any]:
+    """Median wall time, throughput and peak RSS of one target over one corpus."""
+    result = {"target": target, "corpus": corpus, "queries": len(queries)}
+    if target == "spark" and importlib.util.find_spec("pyspark") is None:
+        return {**result, "status": "skipped", "reason": "pyspark is not installed"}
+    with tempfile.TemporaryDirectory(prefix="sql_benchmark_") as directory:
+        csv_path, xlsx_path, truncated = materialize(queries, directory)
+        if target == "sqlparse" and truncated:
+            result["truncated_queries"] = truncated
+        output_file = os.path.join(directory, "results.xlsx")
+        command = target_command(target, csv_path, xlsx_path, output_file, workers)
+        runs = []
+        for _ in range(repeats):
+            seconds, peak_mb, returncode, output = run_measured(command, directory)
+            if returncode != 0:
+                logging.error("benchmark: %s on %s exited with %s: %s", target, corpus, returncode, output)
+                return {**result, "status": "failed", "returncode": returncode, "output": output}
+            runs.append((seconds, peak_mb))
+        phases = read_phases(output_file) if target == "sqlglot" else {}
+    seconds = statistics.median(run[0] for run in runs)
+    peaks = [run[1] for run in runs if run[1] is not None]
+    result.update({"status": "ok", "seconds": seconds, "seconds_all": [run[0] for run in runs], "queries_per_sec": len(queries) / seconds if seconds else 0.0,
+                   "peak_rss_mb": max(peaks) if peaks else None})
+    if phases:
+        # Throughput of the analysis itself, without interpreter start-up, imports and output writing
+        result["phases"] = phases
+        analysis_seconds = phases.get("total", {}).get("total_seconds", 0.0)
+        result["analysis_queries_per_sec"] = phases["total"]["queries"] / analysis_seconds if analysis_seconds else 0.0
+    return result
+
+
+def environment() -> Dict[str, Any]:
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(), "sqlglot": sqlglot.__version__,
+            "pandas": pd.__version__, "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], tolerance: float = REGRESSION_TOLERANCE) -> List[Dict[str, Any]]:
+    """Match results to the baseline by target and corpus, flagging throughput drops and memory growth beyond tolerance."""
+    previous = {(entry["target"], entry["corpus"]): entry for entry in baseline.get("results", []) if entry.get("status") == "ok"}
+    comparison = []
+    for entry in results:
+        before = previous.get((entry["target"], entry["corpus"]))
+        if entry.get("status") != "ok" or before is None:
+            continue
+        speedup = entry["queries_per_sec"] / before["queries_per_sec"] if before["queries_per_sec"] else 0.0
+        memory = entry["peak_rss_mb"] / before["peak_rss_mb"] if entry["peak_rss_mb"] and before["peak_rss_mb"] else 0.0
+        comparison.append({"target": entry["target"], "corpus": entry["corpus"], "queries_per_sec": entry["queries_per_sec"],
+                           "baseline_queries_per_sec": before["queries_per_sec"], "speedup": speedup, "peak_rss_ratio": memory,
+                           "regression": speedup < 1 - tolerance or memory > 1 + tolerance})
+    return comparison
+
+
+def format_results(results: List[Dict[str, Any]], comparison: List[Dict[str, Any]]) -> str:
+    """Render one line per target and corpus, with the change against the baseline where there is one."""
+    changes = {(entry["target"], entry["corpus"]): entry for entry in comparison}
+    lines = []
+    for entry in results:
+        label = f"{entry['target']:<10} {entry['corpus']:<16}"
+        if entry["status"] != "ok":
+            lines.append(f"{label} {entry['status']}: {entry.get('reason', entry.get('returncode'))}")
+            continue
+        peak = f"{entry['peak_rss_mb']:8.1f} MB" if entry["peak_rss_mb"] is not None else "unavailable"
+        line = f"{label} {entry['queries']:>6} queries  {entry['seconds']:8.2f}s  {entry['queries_per_sec']:9.1f} q/s  peak {peak}"
+        change = changes.get((entry["target"], entry["corpus"]))
+        if change is not None:
+            line += f"  {change['speedup']:.2f}x vs baseline{'  REGRESSION' if change['regression'] else ''}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the SQL analyzers over the sample corpora and synthetic worst cases.")
+    parser.add_argument("--targets", type=str, default=",".join(TARGETS), help="Comma-separated scripts to run: sqlglot, sqlparse, base_level, spark (default: all).")
+    parser.add_argument("--corpora", type=str, default=",".join([*SAMPLE_CORPORA, *SYNTHETIC_CORPORA]), help="Comma-separated corpora (default: every sample file and synthetic generator).")
+    parser.add_argument("--synthetic_queries", type=int, default=SYNTHETIC_QUERIES, help="Queries generated per synthetic corpus (default: 50).")
+    parser.add_argument("--seed", type=int, default=SEED, help="Seed for the synthetic corpora (default: 42).")
+    parser.add_argument("--repeats", type=int, default=REPEATS, help="Runs per target and corpus; the median time is reported (default: 3).")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for SQLGlot.py (default: 1).")
+    parser.add_argument("--output_file", type=str, default=RESULTS_FILE, help="JSON file the results are written to (default: benchmark_results.json).")
+    parser.add_argument("--baseline", type=str, default=BASELINE_FILE, help="Earlier results to compare against, if the file exists (default: benchmark_baseline.json).")
+    parser.add_argument("--save_baseline", action="store_true", help="Also store these results as the new baseline.")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE, help="Relative slowdown or memory growth reported as a regression (default: 0.10).")
+    parser.add_argument("--fail_on_regression", action="store_true", help="Exit with status 1 if any result regressed against the baseline.")
+    args = parser.parse_args()
+
+    targets = [target.strip() for target in args.targets.split(",") if target.strip()]
+    corpora = [corpus.strip() for corpus in args.corpora.split(",") if corpus.strip()]
+    unknown = [name for name in targets if name not in TARGETS] + [name for name in corpora if name not in SAMPLE_CORPORA and name not in SYNTHETIC_CORPORA]
+    if unknown:
+        parser.error(f"unknown targets or corpora: {', '.join(unknown)}")
+
+    results = []
+    for corpus in corpora:
+        queries = load_corpus(corpus, args.synthetic_queries, args.seed)
+        for target in targets:
+            results.append(benchmark(target, corpus, queries, args.repeats, args.workers))
+
+    baseline = None
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as handle:
+            baseline = json.load(handle)
+    comparison = compare(results, baseline, args.tolerance) if baseline else []
+    report = {"environment": environment(), "settings": vars(args), "results": results, "comparison": comparison}
+    with open(args.output_file, "w", encoding="utf-8") as handle:
+        json.dump(report, handle, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2)
+
+    print(format_results(results, comparison))
+    print(f"Benchmark results saved to {args.output_file}")
+    if args.fail_on_regression and any(entry["regression"] for entry in comparison):
+        sys.exit(1)
@@ -0,0 +1,240 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, Any, Optional, Callable, Sequence, Set, Tuple
+
+# Caches for parse trees (in-process, bounded) and per-query analysis results (on-disk, shared across runs)
+
+CACHE_FILE_NAME = "analysis_cache.sqlite"
+DEFAULT_MAX_MB = 512
+PARSE_CACHE_MAX_ENTRIES = 1024
+PARSE_CACHE_MAX_MB = 256
+PARSE_FAILURES_MAX_ENTRIES = 100000
+# Result stores and hit timestamps buffered per process before they are written in one transaction
+RESULT_FLUSH_ENTRIES = 256
+# Measured sqlglot AST footprint is roughly 60-100 bytes per character of normalized SQL
+AST_BYTES_PER_CHAR = 100
+
+
+def query_fingerprint(query: str) -> bytes:
+    """Return a 16-byte digest of the query text, used as a compact cache key."""
+    return hashlib.blake2b(query.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+
+def result_key(normalized_query: str, parser_version: str, dialect: Optional[str], analysis_version: int, hints: Sequence[str] = ()) -> str:
+    """Hash the normalized SQL together with everything that can change its analysis, including the hints removed from it."""
+    digest = hashlib.sha256()
+    for part in (parser_version, dialect or "", str(analysis_version), normalized_query, *hints):
+        digest.update(part.encode("utf-8", "surrogatepass"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """SQLite-backed cache of analysis results, evicted least-recently-used down to a size budget.
+
+    New results and the last-used times of hits are buffered and written in one transaction per RESULT_FLUSH_ENTRIES,
+    per chunk (flush) and before eviction, so lookups never take SQLite's write lock. Buffered writes are lost if the
+    process is killed, which only costs re-analysis on a later run.
+    """
+
+    def __init__(self, cache_dir: str, max_mb: int = DEFAULT_MAX_MB):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, CACHE_FILE_NAME)
+        self.max_bytes = max_mb * 1024 * 1024
+        self.stats = Counter()
+        # WAL lets pool workers read while another process writes
+        self.connection = sqlite3.connect(self.path, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE TABLE IF NOT EXISTS parse_failures (key TEXT NOT NULL, tier TEXT NOT NULL, PRIMARY KEY (key, tier))")
+        self.connection.commit()
+        # Key -> (encoded result, time stored) and key -> time of last hit, not yet written
+        self._stores: Dict[str, Tuple[bytes, float]] = {}
+        self._touched: Dict[str, float] = {}
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached result for key, or None on a miss."""
+        stored = self._stores.get(key)
+        if stored is not None:
+            self.stats["Result Hits"] += 1
+            return json.loads(stored[0])
+        row = self.connection.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.stats["Result Misses"] += 1
+            return None
+        self.stats["Result Hits"] += 1
+        self._touched[key] = time.time()
+        self._flush_if_full()
+        return json.loads(row[0])
+
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        """Store a result under key."""
+        value = json.dumps(result, separators=(",", ":")).encode("utf-8", "surrogatepass")
+        self._stores[key] = (value, time.time())
+        self._touched.pop(key, None)
+        self.stats["Result Stores"] += 1
+        self._flush_if_full()
+
+    def _flush_if_full(self) -> None:
+        if len(self._stores) + len(self._touched) >= RESULT_FLUSH_ENTRIES:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the buffered results and last-used times in a single transaction."""
+        if not self._stores and not self._touched:
+            return
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO results (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+            [(key, value, len(value), stored) for key, (value, stored) in self._stores.items()],
+        )
+        self.connection.executemany("UPDATE results SET last_used = ? WHERE key = ?", [(used, key) for key, used in self._touched.items()])
+        self.connection.commit()
+        self._stores.clear()
+        self._touched.clear()
+
+    def failed_tiers(self, key: str) -> Set[str]:
+        """Parser tiers recorded as failing for a query fingerprint."""
+        return {row[0] for row in self.connection.execute("SELECT tier FROM parse_failures WHERE key = ?", (key,))}
+
+    def record_failure(self, key: str, tier: str) -> None:
+        """Remember that a parser tier failed for a query fingerprint."""
+        self.connection.execute("INSERT OR IGNORE INTO parse_failures (key, tier) VALUES (?, ?)", (key, tier))
+        self.connection.commit()
+
+    def take_stats(self) -> Counter:
+        """Return the counts gathered since the last call and reset them."""
+        stats, self.stats = self.stats, Counter()
+        return stats
+
+    def evict(self) -> int:
+        """Drop least-recently-used entries until the cache fits its size budget; return how many were dropped."""
+        self.flush()
+        total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return 0
+        evicted = 0
+        rows = self.connection.execute("SELECT key, size FROM results ORDER BY last_used ASC").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self.connection.execute("DELETE FROM results WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        self.connection.commit()
+        self.stats["Result Evictions"] += evicted
+        logging.info(f"ResultCache: evicted {evicted} entries from {self.path}")
+        return evicted
+
+    def close(self) -> None:
+        """Write any buffered entries and close the underlying database connection."""
+        self.flush()
+        self.connection.close()
+
+
+class ParseCache:
+    """In-process LRU cache of parse trees bounded by entry count and an estimated memory budget."""
+
+    def __init__(self, max_entries: int = PARSE_CACHE_MAX_ENTRIES, max_mb: int = PARSE_CACHE_MAX_MB):
+        self.max_entries = max_entries
+        self.max_bytes = max_mb * 1024 * 1024
+        self.entries: "OrderedDict[bytes, Tuple[Any, int]]" = OrderedDict()
+        self.total_bytes = 0
+        self.stats = Counter()
+
+    def get_or_parse(self, query: str, parse: Callable[[str], Any], namespace: str = "") -> Any:
+        """Return the cached tree for query, parsing and storing it on a miss; namespace separates trees of different dialects."""
+        key = query_fingerprint(f"{namespace}\0{query}" if namespace else query)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.stats["Parse Hits"] += 1
+            return entry[0]
+        self.stats["Parse Misses"] += 1
+        tree = parse(query)
+        cost = len(query) * AST_BYTES_PER_CHAR
+        if self.max_entries > 0 and cost <= self.max_bytes:
+            self.entries[key] = (tree, cost)
+            self.total_bytes += cost
+            self._evict()
+        return tree
+
+    def _evict(self) -> None:
+        """Drop least-recently-used trees until both limits hold."""
+        while self.entries and (len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes):
+            _, (_, cost) = self.entries.popitem(last=False)
+            self.total_bytes -= cost
+            self.stats["Parse Evictions"] += 1
+
+    def clear(self) -> None:
+        """Release every cached tree."""
+        self.entries.clear()
+        self.total_bytes = 0
+
+    def take_stats(self) -> Counter:
+        """Return the counts gathered since the last call and reset them."""
+        stats, self.stats = self.stats, Counter()
+        return stats
+
+
+class ParseFailures:
+    """Negative cache of parser tiers known to fail per query fingerprint, optionally persisted in a ResultCache."""
+
+    def __init__(self, max_entries: int = PARSE_FAILURES_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, Set[str]]" = OrderedDict()
+        self.stats = Counter()
+
+    def failed_tiers(self, key: str, store: Optional[ResultCache] = None) -> Set[str]:
+        """Tiers to skip for key, loading them from store on first sight."""
+        tiers = self.entries.get(key)
+        if tiers is None:
+            tiers = store.failed_tiers(key) if store is not None else set()
+            self.entries[key] = tiers
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        else:
+            self.entries.move_to_end(key)
+        self.stats["Tier Skips"] += len(tiers)
+        return tiers
+
+    def record_failure(self, key: str, tier: str, store: Optional[ResultCache] = None) -> None:
+        """Remember a failed tier in memory and, when given, in store for later runs."""
+        self.entries.setdefault(key, set()).add(tier)
+        self.stats["Tier Failures"] += 1
+        if store is not None:
+            store.record_failure(key, tier)
+
+    def take_stats(self) -> Counter:
+        """Return the counts gathered since the last call and reset them."""
+        stats, self.stats = self.stats, Counter()
+        return stats
+
+
+_open_caches: Dict[str, ResultCache] = {}
+
+
+def open_cache(cache_dir: Optional[str], max_mb: int = DEFAULT_MAX_MB) -> Optional[ResultCache]:
+    """Return this process's cache for cache_dir, opening it on first use; None when caching is off."""
+    if not cache_dir:
+        return None
+    if cache_dir not in _open_caches:
+        _open_caches[cache_dir] = ResultCache(cache_dir, max_mb)
+    return _open_caches[cache_dir]
+
+
+def format_stats(stats: Counter, kind: str = "Result") -> str:
+    """Render the statistics of one cache kind ("Result" or "Parse") as a one-line summary."""
+    hits, misses = stats[f"{kind} Hits"], stats[f"{kind} Misses"]
+    lookups = hits + misses
+    hit_rate = (100.0 * hits / lookups) if lookups else 0.0
+    summary = f"{kind} cache: {hits} hits, {misses} misses ({hit_rate:.1f}% hit rate), "
+    if kind == "Result":
+        summary += f"{stats['Result Stores']} stored, "
+    return summary + f"{stats[f'{kind} Evictions']} evicted"
@@ -0,0 +1,192 @@
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Dict, List, Tuple, Any, Iterable, Iterator, Optional
+from Lexer import normalize_query
+from Readers import QUERY_COLUMN
+from Scheduler import estimate_cost
+
+# Packed query corpus: normalized SQL as one UTF-8 payload with an offsets index, memory-mapped by every process that reads it
+#
+# Layout: header | payload | offsets (int64, count + 1) | costs (float64) | null flags (uint8) | hints (JSON, one list per query)
+#         | metadata (JSON, one list per column)
+# The arrays are in native byte order; the header records which, and a pack is only opened on a machine of the same order.
+
+PACK_EXTENSION = ".sqlpack"
+PACK_MAGIC = b"SQLPACK\x00"
+PACK_VERSION = 2
+# magic, version, little-endian flag, query count, then the file offsets of the offsets/costs/flags/hints/metadata sections
+HEADER = struct.Struct("<8sIIQQQQQQ")
+
+
+def _align(handle: Any, boundary: int = 8) -> int:
+    """Pad the file to the next multiple of boundary so the array sections can be viewed in place."""
+    position = handle.tell()
+    padding = -position % boundary
+    handle.write(b"\x00" * padding)
+    return position + padding
+
+
+def pack_corpus(records: Iterable[Dict[str, Any]], path: str) -> int:
+    """Normalize every record's query and write them, with the other input columns as metadata, to a pack at path.
+
+    Each query's scheduling cost is estimated from its raw text here, and the hints normalization removes are kept beside
+    it, so runs over the pack never normalize or re-scan it.
+    The pack is written to a temporary file and renamed into place. Returns the number of queries packed.
+    """
+    offsets = array("q", [0])
+    costs = array("d")
+    nulls = array("B")
+    hints: List[List[str]] = []
+    metadata: Dict[str, List[Any]] = {}
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as handle:
+        handle.write(b"\x00" * HEADER.size)
+        for count, record in enumerate(records):
+            query = record.get(QUERY_COLUMN)
+            costs.append(estimate_cost(query))
+            if isinstance(query, str):
+                text, query_hints = normalize_query(query)
+                data = text.encode("utf-8", "surrogatepass")
+                handle.write(data)
+                nulls.append(0)
+            else:
+                data, query_hints = b"", []
+                nulls.append(1)
+            hints.append(query_hints)
+            offsets.append(offsets[-1] + len(data))
+            for column, value in record.items():
+                if column != QUERY_COLUMN:
+                    # Columns first seen part-way through are back-filled for the records before them
+                    metadata.setdefault(column, [None] * count).append(value)
+            for column, values in metadata.items():
+                if len(values) <= count:
+                    values.append(None)
+        sections = []
+        for values in (offsets, costs, nulls):
+            sections.append(_align(handle))
+            values.tofile(handle)
+        sections.append(handle.tell())
+        handle.write(json.dumps(hints).encode("utf-8"))
+        sections.append(handle.tell())
+        handle.write(json.dumps(metadata, default=str).encode("utf-8"))
+        handle.seek(0)
+        handle.write(HEADER.pack(PACK_MAGIC, PACK_VERSION, sys.byteorder == "little", len(costs), *sections))
+    os.replace(temporary, path)
+    logging.info(f"pack_corpus: packed {len(costs)} queries ({offsets[-1]} bytes of SQL) into {path}")
+    return len(costs)
+
+
+class PackedCorpus:
+    """Read-only, memory-mapped view of a pack: queries and their costs by position, without reading the file into memory.
+
+    The index arrays are views straight onto the mapping, and processes mapping the same pack share its pages, so a
+    worker reads a query by position at the cost of decoding its bytes. Hints are parsed on first use of hints(), and
+    metadata only when records() is used.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as handle:
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, little, count, offsets_at, costs_at, nulls_at, self._hints_at, self._metadata_at = HEADER.unpack_from(self._map)
+        if magic != PACK_MAGIC or version != PACK_VERSION:
+            self._map.close()
+            raise ValueError(f"{path} is not a version {PACK_VERSION} query pack")
+        if bool(little) != (sys.byteorder == "little"):
+            self._map.close()
+            raise ValueError(f"{path} was packed on a machine of the other byte order; pack it again from the original input")
+        self._view = memoryview(self._map)
+        self.offsets = self._view[offsets_at:offsets_at + 8 * (count + 1)].cast("q")
+        self.costs = self._view[costs_at:costs_at + 8 * count].cast("d")
+        self.nulls = self._view[nulls_at:nulls_at + count]
+        self._hints: Optional[List[List[str]]] = None
+
+    def __len__(self) -> int:
+        return len(self.costs)
+
+    def text(self, position: int) -> Optional[str]:
+        """The normalized query at a position, or None where the input had no query text."""
+        if self.nulls[position]:
+            return None
+        start = HEADER.size + self.offsets[position]
+        return str(self._view[start:HEADER.size + self.offsets[position + 1]], "utf-8", "surrogatepass")
+
+    def hints(self, position: int) -> List[str]:
+        """The optimizer hints normalization removed from the query at a position."""
+        if self._hints is None:
+            self._hints = json.loads(bytes(self._view[self._hints_at:self._metadata_at]))
+        return self._hints[position]
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        """Yield one record per query, shaped like the readers' records, with the normalized SQL under 'table_query'."""
+        metadata = json.loads(bytes(self._view[self._metadata_at:]))
+        for position in range(len(self)):
+            record = {column: values[position] for column, values in metadata.items()}
+            record[QUERY_COLUMN] = self.text(position)
+            yield record
+
+    def close(self) -> None:
+        for view in (self.offsets, self.costs, self.nulls, self._view):
+            view.release()
+        self._map.close()
+
+
+class PackedQuery:
+    """Stand-in for a query in a pack, sent to workers in its place: a position to read it from and its estimated cost."""
+
+    __slots__ = ("position", "cost")
+
+    def __init__(self, position: int, cost: float):
+        self.position = position
+        self.cost = cost
+
+    def __getstate__(self) -> Tuple[int, float]:
+        return self.position, self.cost
+
+    def __setstate__(self, state: Tuple[int, float]) -> None:
+        self.position, self.cost = state
+
+
+# The pack open in this process, if any; each worker maps it once and keeps it for the life of the process
+CORPUS: Optional[PackedCorpus] = None
+
+
+def configure_corpus(path: Optional[str]) -> None:
+    """Map the pack at path in this process, replacing any other pack mapped before."""
+    global CORPUS
+    if CORPUS is not None and CORPUS.path != path:
+        CORPUS.close()
+        CORPUS = None
+    if path is not None and CORPUS is None:
+        CORPUS = PackedCorpus(path)
+
+
+def resolve_query(query: Any) -> Any:
+    """The SQL text behind a PackedQuery, read from this process's pack; any other query is returned unchanged."""
+    return CORPUS.text(query.position) if isinstance(query, PackedQuery) else query
+
+
+def resolve_hints(query: Any) -> Optional[List[str]]:
+    """The hints removed from a PackedQuery's text when it was packed; None for any other query."""
+    return CORPUS.hints(query.position) if isinstance(query, PackedQuery) else None
+
+
+def packed_queries(path: str) -> Iterator[Tuple[int, PackedQuery]]:
+    """Yield (index, PackedQuery) pairs for every query of a pack, numbered from 1 like the other inputs."""
+    configure_corpus(path)
+    for position, cost in enumerate(CORPUS.costs):
+        yield position + 1, PackedQuery(position, cost)
+
+
+def read_packed(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield the records of a pack, for callers that want query text and metadata rather than positions."""
+    corpus = PackedCorpus(path)
+    try:
+        yield from corpus.records()
+    finally:
+        corpus.close()
@@ -0,0 +1,134 @@
+import logging
+from typing import Dict, List, Optional, Tuple
+from sqlglot.dialects.oracle import Oracle
+from sqlglot.tokens import Token, TokenType
+from Identifiers import canonical_identifier, split_db_link
+
+# Lexer-only inventory: table, CTE, DB link and hint names from the token stream, without building an AST
+
+# Keywords that end a FROM list at the current parenthesis depth
+FROM_LIST_END = {
+    TokenType.WHERE, TokenType.GROUP_BY, TokenType.HAVING, TokenType.ORDER_BY, TokenType.CONNECT_BY, TokenType.START_WITH,
+    TokenType.UNION, TokenType.INTERSECT, TokenType.EXCEPT, TokenType.FETCH, TokenType.ON, TokenType.USING, TokenType.JOIN,
+    TokenType.LEFT, TokenType.RIGHT, TokenType.FULL, TokenType.INNER, TokenType.CROSS, TokenType.NATURAL, TokenType.OUTER,
+    TokenType.SELECT, TokenType.LIMIT,
+}
+CTE_BODY_START = {TokenType.SELECT, TokenType.WITH, TokenType.L_PAREN}
+# Functions whose arguments use FROM without naming a table, e.g. EXTRACT(YEAR FROM d)
+FROM_FUNCTIONS = {"EXTRACT", "TRIM", "SUBSTRING", "OVERLAY"}
+
+_TOKENIZER = None
+
+
+def _tokenize(query: str) -> List[Token]:
+    """Tokenize with one Oracle tokenizer per process."""
+    global _TOKENIZER
+    if _TOKENIZER is None:
+        _TOKENIZER = Oracle().tokenizer
+    return _TOKENIZER.tokenize(query)
+
+
+def _matching_paren(tokens: List[Token], start: int) -> int:
+    """Index of the R_PAREN closing the L_PAREN at start, or len(tokens) if it is never closed."""
+    depth = 0
+    for position in range(start, len(tokens)):
+        if tokens[position].token_type == TokenType.L_PAREN:
+            depth += 1
+        elif tokens[position].token_type == TokenType.R_PAREN:
+            depth -= 1
+            if depth == 0:
+                return position
+    return len(tokens)
+
+
+def _cte_name(tokens: List[Token], position: int) -> Optional[str]:
+    """Name defined at position if it starts `name [(columns)] AS (` right after WITH or a comma."""
+    if position == 0 or tokens[position - 1].token_type not in (TokenType.WITH, TokenType.COMMA):
+        return None
+    if tokens[position].token_type not in (TokenType.VAR, TokenType.IDENTIFIER):
+        return None
+    after = position + 1
+    if after < len(tokens) and tokens[after].token_type == TokenType.L_PAREN:
+        after = _matching_paren(tokens, after) + 1
+    if after + 2 < len(tokens) and tokens[after].token_type == TokenType.ALIAS and tokens[after + 1].token_type == TokenType.L_PAREN \
+            and tokens[after + 2].token_type in CTE_BODY_START:
+        return canonical_identifier(tokens[position].text, tokens[position].token_type == TokenType.IDENTIFIER)
+    return None
+
+
+def _name_part(tokens: List[Token], position: int) -> Tuple[str, int]:
+    """Canonical text of one name part and the index of its last token; [bracketed] T-SQL names span several tokens."""
+    if tokens[position].token_type != TokenType.L_BRACKET:
+        return canonical_identifier(tokens[position].text, tokens[position].token_type == TokenType.IDENTIFIER), position
+    end = position + 1
+    while end < len(tokens) and tokens[end].token_type != TokenType.R_BRACKET:
+        end += 1
+    return " ".join(token.text for token in tokens[position + 1:end]), min(end, len(tokens) - 1)
+
+
+def _table_reference(tokens: List[Token], position: int) -> Optional[str]:
+    """Canonical dotted name starting at position, or None for a sub-query or table function."""
+    if position >= len(tokens) or tokens[position].token_type in (TokenType.L_PAREN, TokenType.R_PAREN, TokenType.COMMA):
+        return None
+    name, position = _name_part(tokens, position)
+    parts = [name]
+    while position + 2 < len(tokens) and tokens[position + 1].token_type == TokenType.DOT:
+        name, position = _name_part(tokens, position + 2)
+        parts.append(name)
+    if position + 1 < len(tokens) and tokens[position + 1].token_type == TokenType.L_PAREN:
+        return None
+    return ".".join(parts)
+
+
+def scan_query(query: str) -> Dict[str, List[str]]:
+    """Scan one query's tokens for FROM/JOIN targets, CTE definitions, DB links and optimizer hints."""
+    tokens = _tokenize(query)
+    tables: List[str] = []
+    ctes: List[str] = []
+    db_links: List[str] = []
+    hints: List[str] = []
+
+    depth = 0
+    # Name of the function (or keyword) opening each parenthesis level
+    paren_owners: List[str] = []
+    # Parenthesis depths whose FROM list is still open, so a comma there introduces another table
+    from_depths = set()
+    for position, token in enumerate(tokens):
+        token_type = token.token_type
+        target = None
+        if token_type == TokenType.HINT:
+            hints.extend(comment.strip() for comment in token.comments)
+        elif token_type == TokenType.L_PAREN:
+            depth += 1
+            paren_owners.append(tokens[position - 1].text.upper() if position else "")
+        elif token_type == TokenType.R_PAREN:
+            from_depths.discard(depth)
+            depth -= 1
+            if paren_owners:
+                paren_owners.pop()
+        elif token_type == TokenType.FROM:
+            if paren_owners and paren_owners[-1] in FROM_FUNCTIONS:
+                continue
+            from_depths.add(depth)
+            target = _table_reference(tokens, position + 1)
+        elif token_type == TokenType.JOIN:
+            from_depths.discard(depth)
+            target = _table_reference(tokens, position + 1)
+        elif token_type == TokenType.COMMA:
+            if depth in from_depths:
+                target = _table_reference(tokens, position + 1)
+        elif token_type in FROM_LIST_END:
+            from_depths.discard(depth)
+        else:
+            cte = _cte_name(tokens, position)
+            if cte:
+                ctes.append(cte)
+
+        if target:
+            tables.append(target)
+            db_link = split_db_link(target)[1]
+            if db_link:
+                db_links.append(db_link)
+
+    logging.debug("scan_query: tables=%s, ctes=%s, db_links=%s", tables, ctes, db_links)
+    return {"Tables": tables, "CTEs": ctes, "DB Links": db_links, "Hints": hints}
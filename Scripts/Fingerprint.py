@@ -0,0 +1,50 @@
+import hashlib
+import re
+from typing import Dict, List, Tuple, Any, Sequence
+
+# Query fingerprints used to analyze each distinct query once
+
+DEDUP_MODES = ("none", "exact", "literal")
+
+# String literals (with '' escapes) and stand-alone numeric literals, as Oracle FORCE_MATCHING replaces them
+STRING_LITERAL_REGEX = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL_REGEX = re.compile(r"(?<![\w.:$#])[-+]?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?(?![\w.])")
+BIND_PLACEHOLDER = ":b"
+
+
+def _digest(text: str) -> str:
+    """Return a short hex digest of text."""
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).hexdigest()
+
+
+def exact_hash(normalized_query: str) -> str:
+    """Fingerprint of the normalized query text itself."""
+    return _digest(normalized_query)
+
+
+def strip_literals(normalized_query: str) -> str:
+    """Replace string and numeric literals with a bind placeholder."""
+    query = STRING_LITERAL_REGEX.sub(BIND_PLACEHOLDER, normalized_query)
+    return NUMBER_LITERAL_REGEX.sub(BIND_PLACEHOLDER, query)
+
+
+def literal_fingerprint(normalized_query: str) -> str:
+    """Fingerprint that treats queries differing only in literals as the same query."""
+    return _digest(strip_literals(normalized_query))
+
+
+def fingerprint(normalized_query: str, mode: str, hints: Sequence[str] = ()) -> str:
+    """Fingerprint a normalized query for the given de-duplication mode.
+
+    Hints are removed from the normalized text but are part of a query's result, so they are fingerprinted with it.
+    """
+    if hints:
+        normalized_query = "\0".join((normalized_query, *hints))
+    if mode == "literal":
+        return literal_fingerprint(normalized_query)
+    return exact_hash(normalized_query)
+
+
+def fan_out(query_result: Dict[str, Any], members: List[Tuple[int, str]]) -> List[Dict[str, Any]]:
+    """Copy a representative's result to every member, keeping each member's own index and query text."""
+    return [{**query_result, "Query Index": idx, "Query": query} for idx, query in members]
@@ -0,0 +1,148 @@
+import json
+import logging
+from collections import Counter
+from typing import Dict, List, Tuple, Any, Iterable, Iterator, Optional
+from sqlglot import exp
+
+# Canonical table/column names (Oracle case folding, schema kept, DB link split off) and integer interning for counting
+
+# Canonical name -> canonical name it stands for, applied when table names are counted
+SYNONYMS: Dict[str, str] = {}
+_SYNONYMS_PATH: Optional[str] = None
+
+
+def canonical_identifier(text: str, quoted: bool = False) -> str:
+    """Oracle folding: unquoted identifiers are case-insensitive and stored upper-case, quoted ones are kept exactly."""
+    return text if quoted else text.upper()
+
+
+def canonical_reference(text: str) -> str:
+    """Canonical form of a [schema.]name[@dblink] reference written as SQL text, e.g. from the regex tier."""
+    parts = []
+    for part in text.split("."):
+        part = part.strip()
+        if len(part) > 1 and part[0] == part[-1] == '"':
+            parts.append(part[1:-1])
+        else:
+            parts.append(part.upper())
+    return ".".join(parts)
+
+
+def canonical_table(table: exp.Table) -> str:
+    """Canonical SCHEMA.NAME[@DBLINK] of a table node, keeping every qualifier the query wrote."""
+    parts = []
+    for key in ("catalog", "db", "this"):
+        identifier = table.args.get(key)
+        if isinstance(identifier, exp.Identifier):
+            parts.append(canonical_identifier(identifier.this, identifier.quoted))
+        elif identifier is not None:
+            parts.append(canonical_identifier(identifier.name))
+    # sqlglot reads s.t@link.domain as catalog.db.name, so joining the parts restores the reference as written, link included;
+    # split_db_link separates the link from it
+    return ".".join(part for part in parts if part)
+
+
+def canonical_column(column: exp.Column) -> str:
+    """Canonical name of a column reference, without its table qualifier."""
+    return canonical_identifier(column.name, getattr(column.this, "quoted", False))
+
+
+def canonical_cte_name(cte: exp.CTE) -> str:
+    """Canonical name a CTE is defined under."""
+    alias = cte.args.get("alias")
+    return canonical_identifier(cte.alias, getattr(alias.this, "quoted", False) if alias is not None else False)
+
+
+def split_db_link(name: str) -> Tuple[str, Optional[str]]:
+    """Separate a canonical reference into the object name and its DB link (None for local objects)."""
+    if "@" not in name:
+        return name, None
+    object_name, db_link = name.split("@", 1)
+    return object_name, db_link
+
+
+def db_links(names: Iterable[str]) -> List[str]:
+    """The DB link of every remote reference among canonical names, in order."""
+    return [db_link for db_link in (split_db_link(name)[1] for name in names) if db_link]
+
+
+def load_synonyms(path: Optional[str]) -> Dict[str, str]:
+    """Read a JSON object of synonym -> target references (e.g. {"PATIENT": "CLARITY.PATIENT"}), canonicalizing both sides."""
+    if not path:
+        return {}
+    with open(path, encoding="utf-8") as handle:
+        mapping = json.load(handle)
+    return {canonical_reference(synonym): canonical_reference(target) for synonym, target in mapping.items()}
+
+
+def configure_synonyms(path: Optional[str]) -> None:
+    """Load this process's synonym mapping, once per file."""
+    global SYNONYMS, _SYNONYMS_PATH
+    if path != _SYNONYMS_PATH:
+        SYNONYMS = load_synonyms(path)
+        _SYNONYMS_PATH = path
+        logging.info(f"configure_synonyms: {len(SYNONYMS)} synonyms from {path}")
+
+
+class Interner:
+    """Two-way mapping between canonical names and dense integer IDs, so each distinct name is stored once."""
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.names: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def intern(self, name: str) -> int:
+        """ID of name, assigning the next one on first sight."""
+        identifier = self.ids.get(name)
+        if identifier is None:
+            identifier = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return identifier
+
+    def name(self, identifier: int) -> str:
+        return self.names[identifier]
+
+
+class IdentifierCounter:
+    """Frequency counter keyed by interned integer IDs that reads and writes canonical names.
+
+    With resolve_synonyms, names are mapped through SYNONYMS before counting, so a synonym and its target rank as one.
+    """
+
+    def __init__(self, interner: Optional[Interner] = None, resolve_synonyms: bool = False):
+        self.interner = interner if interner is not None else Interner()
+        self.resolve_synonyms = resolve_synonyms
+        self.counts: Counter = Counter()
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def __getitem__(self, name: str) -> int:
+        identifier = self.interner.ids.get(SYNONYMS.get(name, name) if self.resolve_synonyms else name)
+        return self.counts[identifier] if identifier is not None else 0
+
+    def _id(self, name: str) -> int:
+        if self.resolve_synonyms:
+            name = SYNONYMS.get(name, name)
+        return self.interner.intern(name)
+
+    def update(self, names: Any) -> None:
+        """Count an iterable of names, or add the counts of a mapping or another IdentifierCounter."""
+        if isinstance(names, IdentifierCounter) or hasattr(names, "items"):
+            for name, count in names.items():
+                self.counts[self._id(name)] += count
+            return
+        self.counts.update(map(self._id, names))
+
+    def items(self) -> List[Tuple[str, int]]:
+        """(name, count) pairs in first-counted order."""
+        return [(self.interner.names[identifier], count) for identifier, count in self.counts.items()]
+
+    def most_common(self, n: Optional[int] = None) -> List[Tuple[str, int]]:
+        return [(self.interner.names[identifier], count) for identifier, count in self.counts.most_common(n)]
+
+    def __iter__(self) -> Iterator[str]:
+        return (self.interner.names[identifier] for identifier in self.counts)
@@ -0,0 +1,72 @@
+import re
+from typing import Any, Iterable, Iterator, List, Tuple
+
+# Quote-aware lexical passes over SQL text, shared by the scanners and the normalizer that must not look inside strings or comments
+
+# Alternatives are tried left to right, so hints win over comments and strings/identifiers swallow any -- or /* inside them
+TOKEN_REGEX = re.compile(r"""
+    (?P<hint>/\*\+.*?\*/)
+  | (?P<comment>/\*.*?\*/|--[^\n]*)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<quoted>"(?:[^"]|"")*")
+  | (?P<bracket>\[[^\]\n]*\])
+  | (?P<word>[A-Za-z_][\w$#]*)
+  | (?P<number>\d+(?:\.\d+)?)
+  | (?P<space>\s+)
+  | (?P<punct>.)
+""", re.DOTALL | re.VERBOSE)
+
+# Only the spans whose inside must not be touched by whitespace folding: literals, quoted identifiers and comments.
+# Every alternative starts with a fixed character, so the regex engine skips ordinary SQL text without trying it.
+LITERAL_OR_COMMENT_REGEX = re.compile(r"""'(?:[^']|'')*'|"(?:[^"]|"")*"|/\*.*?\*/|--[^\n]*""", re.DOTALL)
+
+
+def iter_tokens(query: str) -> Iterator[Tuple[str, str]]:
+    """Yield (kind, text) for every token of query; kinds are the TOKEN_REGEX group names."""
+    for match in TOKEN_REGEX.finditer(query):
+        yield match.lastgroup, match.group()
+
+
+def _fold_whitespace(code: str) -> str:
+    """Collapse whitespace runs in code outside literals to single spaces, keeping one space at either edge if there was any."""
+    folded = " ".join(code.split())
+    if not folded:
+        return " " if code else ""
+    return (" " if code[0].isspace() else "") + folded + (" " if code[-1].isspace() else "")
+
+
+def normalize_query(query: str) -> Tuple[str, List[str]]:
+    """Strip comments and fold whitespace outside string literals and quoted identifiers, in one pass over the text.
+
+    Returns the normalized query and the bodies of its optimizer hints (/*+ ... */), which are removed like comments.
+    Comments become whitespace so the tokens around them stay apart, and _x000D_ export artifacts become line breaks.
+    """
+    if "_x000D_" in query:
+        query = query.replace("_x000D_", "\n")
+    pieces = []
+    hints = []
+    # Code between literals, with comments already replaced by spaces, waiting to be folded
+    code = []
+    position = 0
+    for match in LITERAL_OR_COMMENT_REGEX.finditer(query):
+        code.append(query[position:match.start()])
+        position = match.end()
+        text = match.group()
+        if text[0] in "'\"":
+            pieces.append(_fold_whitespace("".join(code)))
+            pieces.append(text)
+            code = []
+            continue
+        if text.startswith("/*+"):
+            hints.append(text[3:-2].strip())
+        code.append(" ")
+    code.append(query[position:])
+    pieces.append(_fold_whitespace("".join(code)))
+    return "".join(pieces).strip(), hints
+
+
+def normalize_queries(queries: Iterable[Any]) -> List[Tuple[Any, List[str]]]:
+    """normalize_query over a whole column (pandas Series, pyarrow array or any iterable); non-strings pass through unchanged."""
+    if hasattr(queries, "to_pylist"):
+        queries = queries.to_pylist()
+    return [normalize_query(query) if isinstance(query, str) else (query, []) for query in queries]
@@ -0,0 +1,182 @@
+import heapq
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Tuple, Any, Iterable, Iterator, Optional
+
+import pandas as pd
+
+# Optional memory profiling: peak traced allocations and RSS per pipeline stage, top allocation sites, and memory-heavy queries
+
+try:
+    import resource
+except ImportError:
+    # POSIX only; where neither it nor /proc is available, RSS is reported as unavailable
+    resource = None
+
+# Stack frames kept per traced allocation; more frames attribute better but make tracing slower
+TRACE_FRAMES = 1
+TOP_ALLOCATION_SITES = 15
+TOP_MEMORY_QUERIES = 20
+# Interval of the background RSS sampler while a stage runs
+RSS_SAMPLE_SECONDS = 0.05
+MB = 1024 * 1024
+
+
+def current_rss() -> Optional[int]:
+    """Resident set size of this process in bytes (the lifetime peak where /proc is unavailable, None where neither is)."""
+    try:
+        with open("/proc/self/statm", encoding="utf-8") as handle:
+            return int(handle.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        if resource is None:
+            return None
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+def _megabytes(size: Optional[int]) -> Optional[float]:
+    return None if size is None else size / MB
+
+
+class _RssSampler(threading.Thread):
+    """Background thread recording the highest RSS seen until stopped; not started where RSS is unavailable."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak = current_rss()
+        self._done = threading.Event()
+
+    def run(self) -> None:
+        while not self._done.wait(RSS_SAMPLE_SECONDS):
+            self.peak = max(self.peak, current_rss())
+
+    def stop(self) -> Optional[int]:
+        self._done.set()
+        if self.peak is None:
+            return None
+        self.join()
+        self.peak = max(self.peak, current_rss())
+        return self.peak
+
+
+class MemoryTracker:
+    """Per-process tracemalloc bookkeeping: peak traced memory of each query and of each named stage of the run."""
+
+    def __init__(self):
+        self.enabled = False
+        self.samples: List[Tuple[int, int, int]] = []
+        self.stages: List[Dict[str, Any]] = []
+        self.sites: List[Dict[str, Any]] = []
+        self._query: Optional[Tuple[int, int]] = None
+        # Highest traced peak seen by per-query tracking since the current stage began (they reset the global peak)
+        self._stage_peak = 0
+
+    def begin(self, idx: int) -> None:
+        if self.enabled:
+            tracemalloc.reset_peak()
+            self._query = (idx, tracemalloc.get_traced_memory()[0])
+
+    def end(self) -> None:
+        if self._query is None:
+            return
+        idx, baseline = self._query
+        current, peak = tracemalloc.get_traced_memory()
+        self._stage_peak = max(self._stage_peak, peak)
+        # Peak is what analyzing the query needed on top of what was already held; retained is what it left behind (e.g. cache entries)
+        self.samples.append((idx, peak - baseline, current - baseline))
+        self._query = None
+
+    def take(self) -> List[Tuple[int, int, int]]:
+        """Return the (query index, peak bytes, retained bytes) samples recorded since the last call, and reset."""
+        samples, self.samples = self.samples, []
+        return samples
+
+    @contextmanager
+    def _stage(self, name: str) -> Iterator[None]:
+        tracemalloc.reset_peak()
+        self._stage_peak = 0
+        started_traced = tracemalloc.get_traced_memory()[0]
+        started_rss = current_rss()
+        sampler = _RssSampler()
+        if started_rss is not None:
+            sampler.start()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            peak_rss = sampler.stop()
+            current, peak = tracemalloc.get_traced_memory()
+            self.stages.append({"Stage": name, "Seconds": seconds, "Peak Traced MB": max(peak, self._stage_peak) / MB,
+                                "Retained MB": (current - started_traced) / MB, "Start RSS MB": _megabytes(started_rss), "Peak RSS MB": _megabytes(peak_rss)})
+            self._record_sites(name)
+
+    def stage(self, name: str) -> Any:
+        """Context manager measuring one stage of the run; a no-op while memory profiling is off."""
+        return self._stage(name) if self.enabled else nullcontext()
+
+    def _record_sites(self, stage: str) -> None:
+        """Largest live allocation sites at the end of a stage, excluding the profiler's own bookkeeping."""
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")])
+        for statistic in snapshot.statistics("lineno")[:TOP_ALLOCATION_SITES]:
+            frame = statistic.traceback[0]
+            self.sites.append({"Stage": stage, "Site": f"{frame.filename}:{frame.lineno}", "Size MB": statistic.size / MB, "Blocks": statistic.count})
+
+
+MEMORY = MemoryTracker()
+
+
+def configure_memory_profiling(enabled: bool) -> None:
+    """Start or stop allocation tracing in this process."""
+    if enabled and not tracemalloc.is_tracing():
+        tracemalloc.start(TRACE_FRAMES)
+    elif not enabled and MEMORY.enabled and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    MEMORY.enabled = enabled
+
+
+class MemoryReport:
+    """Run-wide memory results: the parent's stage measurements and allocation sites, and the most memory-hungry queries from any process."""
+
+    def __init__(self, top_queries: int = TOP_MEMORY_QUERIES):
+        self.top_queries = top_queries
+        self.queries = 0
+        self._heap: List[Tuple[int, int, int]] = []
+
+    def add(self, samples: Iterable[Tuple[int, int, int]]) -> None:
+        for idx, peak, retained in samples:
+            self.queries += 1
+            entry = (peak, idx, retained)
+            if len(self._heap) < self.top_queries:
+                heapq.heappush(self._heap, entry)
+            elif peak > self._heap[0][0]:
+                heapq.heapreplace(self._heap, entry)
+
+    def query_frame(self) -> pd.DataFrame:
+        rows = [(idx, peak / 1024, retained / 1024) for peak, idx, retained in sorted(self._heap, reverse=True)]
+        return pd.DataFrame(rows, columns=["Query Index", "Peak KB", "Retained KB"])
+
+    @staticmethod
+    def stage_frame() -> pd.DataFrame:
+        return pd.DataFrame(MEMORY.stages, columns=["Stage", "Seconds", "Peak Traced MB", "Retained MB", "Start RSS MB", "Peak RSS MB"])
+
+    @staticmethod
+    def site_frame() -> pd.DataFrame:
+        return pd.DataFrame(MEMORY.sites, columns=["Stage", "Site", "Size MB", "Blocks"])
+
+
+def format_memory(report: MemoryReport) -> str:
+    """Render the stage table and the heaviest query as a few summary lines."""
+    lines = [f"Memory: {report.queries} queries traced"]
+    for stage in MEMORY.stages:
+        peak_rss = f"{stage['Peak RSS MB']:8.1f} MB" if stage["Peak RSS MB"] is not None else "unavailable"
+        lines.append(f"  {stage['Stage']:<16} peak traced {stage['Peak Traced MB']:8.1f} MB  retained {stage['Retained MB']:8.1f} MB  peak RSS {peak_rss}")
+    heaviest = report.query_frame().head(1)
+    if not heaviest.empty:
+        lines.append(f"  heaviest query: {int(heaviest['Query Index'].iloc[0])} ({heaviest['Peak KB'].iloc[0]:.0f} KB peak)")
+    return "\n".join(lines)
@@ -0,0 +1,158 @@
+import logging
+import re
+from typing import Dict, List, Any, Iterable
+import pandas as pd
+from Lexer import iter_tokens
+
+# Per-query lexical metrics (the Summary_Data_Sample columns), computed in one pass over each query's tokens
+
+METRIC_COLUMNS = ("CTE Count", "DBLink Count", "Table Count", "Column Count", "Asterisk Count", "Parallel Hint Count",
+                  "Materialize Hint Count", "Hard Coded Date Count", "Line Count", "Columns in Final SELECT")
+
+# Keywords that end a FROM list at the current depth, after which a comma no longer introduces a table
+FROM_LIST_END = {"WHERE", "GROUP", "HAVING", "ORDER", "CONNECT", "START", "UNION", "INTERSECT", "MINUS", "EXCEPT", "FETCH",
+                 "ON", "USING", "JOIN", "LEFT", "RIGHT", "FULL", "INNER", "CROSS", "NATURAL", "OUTER", "SELECT", "LIMIT"}
+# Keywords that close a SELECT list at its own depth
+SELECT_LIST_END = {"FROM", "INTO", "UNION", "INTERSECT", "MINUS", "EXCEPT", "WHERE", "GROUP", "ORDER", "HAVING", "FETCH", "LIMIT"}
+SELECT_QUANTIFIERS = {"DISTINCT", "ALL", "UNIQUE"}
+# Functions whose arguments use FROM without naming a table, e.g. EXTRACT(YEAR FROM d)
+FROM_FUNCTIONS = {"EXTRACT", "TRIM", "SUBSTRING", "OVERLAY"}
+# A '*' after one of these is a wildcard (SELECT *, t.*, COUNT(*)) rather than a multiplication
+ASTERISK_PREFIXES = {"SELECT", "DISTINCT", "ALL", "UNIQUE", ",", ".", "("}
+# String literals that are dates by context: DATE '...', TO_DATE('...'), TIMESTAMP '...'
+DATE_KEYWORDS = {"DATE", "TIMESTAMP"}
+DATE_FUNCTIONS = {"TO_DATE", "TO_TIMESTAMP"}
+MONTHS = "JAN|FEB|MAR|APR|MAY|JUN|JUL|AUG|SEP|OCT|NOV|DEC"
+# Checked against single string literals only, never against the whole query
+DATE_LITERAL_REGEX = re.compile(rf"^\s*(?:\d{{4}}[-/.]\d{{1,2}}[-/.]\d{{1,2}}|\d{{1,2}}[-/.]\d{{1,2}}[-/.]\d{{2,4}}|\d{{1,2}}[-/ ](?:{MONTHS})[A-Z]*[-/ ]\d{{2,4}})", re.IGNORECASE)
+
+
+def _close_item(current: List[str], items: List[str]) -> None:
+    """Add the SELECT-list item gathered so far to items; a bare * is counted as an asterisk, not a column."""
+    text = "".join(current).strip()
+    if text and text != "*":
+        items.append(text)
+    current.clear()
+
+
+def scan_metrics(query: Any) -> Dict[str, Any]:
+    """Count CTEs, DB links, tables, wildcards, hints, hard-coded dates and lines, and list the final SELECT's columns."""
+    if not isinstance(query, str):
+        return {column: ([] if column == "Columns in Final SELECT" else 0) for column in METRIC_COLUMNS}
+    query = query.replace("_x000D_", "\n")
+    counts = dict.fromkeys(METRIC_COLUMNS[:-1], 0)
+    stripped = query.strip()
+    counts["Line Count"] = stripped.count("\n") + 1 if stripped else 0
+
+    depth = 0
+    # Last two significant tokens, upper-cased, for one-token lookbehind
+    previous = before_previous = ""
+    # Function or keyword that opened each parenthesis level
+    paren_owners: List[str] = []
+    # Depths whose FROM list is still open, so a comma there introduces another table
+    from_depths = set()
+    expect_table = False
+    # CTE definition progress: 1 after `WITH name` / `, name`, 3 inside its column list, 2 after its AS; the next ( completes it
+    cte_stage = 0
+    cte_columns_depth = 0
+    select_items: List[str] = []
+    current_item: List[str] = []
+    capturing = False
+    final_columns: List[str] = []
+
+    for kind, text in iter_tokens(query):
+        if kind == "comment":
+            continue
+        if kind == "hint":
+            hint = text.upper()
+            counts["Parallel Hint Count"] += hint.count("PARALLEL")
+            counts["Materialize Hint Count"] += hint.count("MATERIALIZE")
+            continue
+
+        word = text.upper() if kind == "word" else text
+        if capturing and depth == 0 and kind != "space":
+            if word in SELECT_LIST_END or word == ";":
+                _close_item(current_item, select_items)
+                capturing = False
+            elif word == ",":
+                _close_item(current_item, select_items)
+                continue
+            elif word in SELECT_QUANTIFIERS and not select_items and not "".join(current_item).strip():
+                current_item.clear()
+                continue
+        if capturing:
+            current_item.append(text)
+        if kind == "space":
+            continue
+
+        if kind == "string":
+            if previous in DATE_KEYWORDS or (previous == "(" and before_previous in DATE_FUNCTIONS) or DATE_LITERAL_REGEX.match(text[1:-1]):
+                counts["Hard Coded Date Count"] += 1
+        elif word == "*" and previous in ASTERISK_PREFIXES:
+            counts["Asterisk Count"] += 1
+        elif word == "@" and kind == "punct" and previous and (previous[0].isalnum() or previous[0] in "_\"]"):
+            counts["DBLink Count"] += 1
+
+        if expect_table:
+            expect_table = False
+            if kind in ("word", "quoted", "bracket") and word not in FROM_LIST_END:
+                counts["Table Count"] += 1
+
+        if cte_stage == 3:
+            if word == ")" and depth == cte_columns_depth:
+                cte_stage = 1
+        elif cte_stage == 2 and word == "(":
+            counts["CTE Count"] += 1
+            cte_stage = 0
+        elif cte_stage == 1 and word == "AS":
+            cte_stage = 2
+        elif cte_stage == 1 and word == "(":
+            cte_stage = 3
+            cte_columns_depth = depth + 1
+        elif kind in ("word", "quoted") and previous in ("WITH", ",") and word != "RECURSIVE":
+            cte_stage = 1
+        else:
+            cte_stage = 0
+
+        if word == "(":
+            depth += 1
+            paren_owners.append(previous)
+        elif word == ")":
+            from_depths.discard(depth)
+            depth = max(depth - 1, 0)
+            if paren_owners:
+                paren_owners.pop()
+        elif word == "FROM":
+            if not (paren_owners and paren_owners[-1] in FROM_FUNCTIONS):
+                from_depths.add(depth)
+                expect_table = True
+        elif word == "JOIN":
+            from_depths.discard(depth)
+            expect_table = True
+        elif word == ",":
+            expect_table = depth in from_depths
+        elif word in FROM_LIST_END:
+            from_depths.discard(depth)
+
+        if word == "SELECT" and depth == 0:
+            # The last top-level SELECT is the final one; UNION branches replace the list with their own
+            select_items = []
+            current_item = []
+            final_columns = select_items
+            capturing = True
+
+        before_previous, previous = previous, word
+
+    if capturing:
+        _close_item(current_item, select_items)
+    counts["Column Count"] = len(final_columns)
+    counts["Columns in Final SELECT"] = final_columns
+    logging.debug("scan_metrics: %s", counts)
+    return counts
+
+
+def metrics_frame(queries: Iterable[Any]) -> pd.DataFrame:
+    """Scan a column of queries (pandas Series, pyarrow array or any iterable) into one metrics row per query."""
+    if hasattr(queries, "to_pylist"):
+        queries = queries.to_pylist()
+    return pd.DataFrame([scan_metrics(query) for query in queries], columns=list(METRIC_COLUMNS))
@@ -0,0 +1,134 @@
+import heapq
+import time
+from array import array
+from contextlib import nullcontext
+from typing import Dict, List, Tuple, Any, Iterable, Optional
+
+import pandas as pd
+
+# Built-in per-phase timing of query analysis: near-free when disabled, aggregated into a profile report when enabled
+
+# Phases in pipeline order; the sqlglot tiers time parsing and the AST walk separately, the sqlparse/regex tiers as "fallback"
+PROFILE_PHASES = ("normalize", "cache", "parse", "walk", "ctes", "fallback", "fast scan", "sub-queries", "aliases", "output")
+# Slowest queries listed in the report
+SLOWEST_QUERIES = 20
+# Shared no-op context returned by phase() while profiling is off, so disabled timing allocates nothing
+_NO_PHASE = nullcontext()
+
+
+class _PhaseTimer:
+    """Context manager adding the wall time of its block to one phase of the current query."""
+
+    __slots__ = ("timings", "name", "started")
+
+    def __init__(self, timings: Dict[str, float], name: str):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        # Phases can repeat within a query (e.g. one parse per tier tried), so their times add up
+        self.timings[self.name] = self.timings.get(self.name, 0.0) + time.perf_counter() - self.started
+        return False
+
+
+class Profiler:
+    """Per-process collector of per-query phase timings, handed back to the parent with each chunk's stats."""
+
+    def __init__(self):
+        self.enabled = False
+        self.samples: List[Tuple[int, float, Dict[str, float]]] = []
+        self._current: Optional[Dict[str, float]] = None
+        self._index = 0
+        self._started = 0.0
+
+    def begin(self, idx: int) -> None:
+        if self.enabled:
+            self._current = {}
+            self._index = idx
+            self._started = time.perf_counter()
+
+    def phase(self, name: str) -> Any:
+        timings = self._current
+        return _NO_PHASE if timings is None else _PhaseTimer(timings, name)
+
+    def end(self) -> None:
+        if self._current is not None:
+            self.samples.append((self._index, time.perf_counter() - self._started, self._current))
+            self._current = None
+
+    def take(self) -> List[Tuple[int, float, Dict[str, float]]]:
+        """Return the (query index, total seconds, phase seconds) samples recorded since the last call, and reset."""
+        samples, self.samples = self.samples, []
+        return samples
+
+
+PROFILER = Profiler()
+
+
+def configure_profiling(enabled: bool) -> None:
+    """Switch this process's phase timers on or off."""
+    PROFILER.enabled = enabled
+    if not enabled:
+        PROFILER._current = None
+        PROFILER.samples = []
+
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+class ProfileReport:
+    """Run-wide aggregate of profiler samples: every phase duration (8 bytes each) plus a bounded heap of the slowest queries."""
+
+    def __init__(self, slowest: int = SLOWEST_QUERIES):
+        self.durations: Dict[str, array] = {}
+        self.totals = array("d")
+        self.slowest = slowest
+        self._heap: List[Tuple[float, int, Dict[str, float]]] = []
+
+    def __len__(self) -> int:
+        return len(self.totals)
+
+    def add(self, samples: Iterable[Tuple[int, float, Dict[str, float]]]) -> None:
+        for idx, total, timings in samples:
+            self.totals.append(total)
+            for name, seconds in timings.items():
+                self.durations.setdefault(name, array("d")).append(seconds)
+            entry = (total, idx, timings)
+            if len(self._heap) < self.slowest:
+                heapq.heappush(self._heap, entry)
+            elif total > self._heap[0][0]:
+                heapq.heapreplace(self._heap, entry)
+
+    def phase_frame(self) -> pd.DataFrame:
+        """One row per phase that ran: how many queries hit it, total seconds and p50/p95/max milliseconds per query."""
+        rows = []
+        ordered_phases = [name for name in PROFILE_PHASES if name in self.durations] + sorted(set(self.durations) - set(PROFILE_PHASES))
+        for name, durations in [(name, self.durations[name]) for name in ordered_phases] + [("total", self.totals)]:
+            ordered = sorted(durations)
+            rows.append((name, len(ordered), sum(ordered), 1000 * _percentile(ordered, 0.5), 1000 * _percentile(ordered, 0.95), 1000 * (ordered[-1] if ordered else 0.0)))
+        return pd.DataFrame(rows, columns=["Phase", "Queries", "Total Seconds", "p50 ms", "p95 ms", "Max ms"])
+
+    def slowest_frame(self) -> pd.DataFrame:
+        """The slowest queries, slowest first, with their time in each phase."""
+        phases = [name for name in PROFILE_PHASES if name in self.durations]
+        rows = [{"Query Index": idx, "Total ms": 1000 * total, **{f"{name} ms": 1000 * timings.get(name, 0.0) for name in phases}}
+                for total, idx, timings in sorted(self._heap, reverse=True)]
+        return pd.DataFrame(rows, columns=["Query Index", "Total ms", *(f"{name} ms" for name in phases)])
+
+
+def format_profile(report: ProfileReport) -> str:
+    """Render the per-phase summary as one line per phase."""
+    if not len(report):
+        return "Profile: no queries timed"
+    lines = [f"Profile: {len(report)} queries timed"]
+    for row in report.phase_frame().itertuples(index=False):
+        lines.append(f"  {row.Phase:<12} {row.Queries:>8} queries  {row[2]:9.2f}s total  p50 {row[3]:8.2f} ms  p95 {row[4]:8.2f} ms  max {row[5]:8.2f} ms")
+    return "\n".join(lines)
@@ -1,16 +1,25 @@
 import pandas as pd
 import re
-from collections import Counter
 import logging
-from typing import Dict, List, Tuple, Any, Set, Optional
-from functools import lru_cache
+from typing import Dict, List, Tuple, Any, Optional, Iterator
 import argparse
-import sqlglot
-from sqlglot import exp, parse_one
-from sqlglot.errors import ParseError
-from pyspark.sql import SparkSession
-from pyspark.sql.functions import udf, col, explode, lit, struct, map_from_entries
-from pyspark.sql.types import ArrayType, StringType, StructType, StructField
+import json
+import os
+import time
+from functools import partial
+from Cache import ParseCache, ParseFailures
+from Tiers import parse_tiered
+from Lexer import normalize_query, normalize_queries
+from Identifiers import canonical_cte_name
+from Sketches import TOP_N_MODES, SKETCH_CAPACITY, SketchCounter
+from Metrics import METRIC_COLUMNS, metrics_frame
+from Readers import QUERY_COLUMN, READ_CHUNK_SIZE, read_query_chunks
+from Watchdog import QUERY_TIMEOUT, QueryTimeout, cpu_budget
+from Scheduler import SCHEDULES, BinPacker, estimate_cost, task_summary, format_task_summary
+from pyspark import StorageLevel, TaskContext
+from pyspark.sql import DataFrame, SparkSession, Window
+from pyspark.sql.functions import udf, col, explode, lit, struct, map_keys, row_number, count, sum as sum_
+from pyspark.sql.types import ArrayType, DoubleType, IntegerType, MapType, StringType, StructType, StructField
 
 # Set DEBUG to True for verbose logging, False otherwise
 DEBUG = False
@@ -23,223 +32,71 @@ FILE_PATH = r"C:\Users\joshm\source\repos\PolyQx\data_raw\data.xlsx"
 SHEET_NAME = "Table Sample"
 OUTPUT_FILE = "oracle_sql_parsing_results.xlsx"
 TOP_N = 3 # Changed from 10 to 3
+EXECUTION_MODES = ("batch", "udf")
+BATCH_SIZE = 1000
 
 # Pre-compile regex patterns
-COMMENT_HEADER_REGEX = re.compile(r"(?s)/\*.*?\*/|--.*?\n")
-CTE_REGEX = re.compile(r"WITH\s+([a-zA-Z0-9_]+)\s+AS\s*\((.*?)\)(?=\s*[,)]|$)", re.IGNORECASE | re.DOTALL)
 TABLE_REGEX = re.compile(r"([a-zA-Z0-9_]+(\.[a-zA-Z0-9_]+)?)", re.IGNORECASE)
 ALIAS_REGEX = re.compile(r'\b(?:as\s+)?([a-zA-Z0-9_]+)\b', re.IGNORECASE)
 COLUMN_REGEX = re.compile(r'\b([a-zA-Z0-9_]+)\b', re.IGNORECASE)
-HINT_REGEX = re.compile(r"/\*\+\s*(.*?)\s*\*/", re.DOTALL)
 SPACE_REGEX = re.compile(r"\s+")
 SELECT_STATEMENT_TYPE = 'SELECT'
 FROM_KEYWORD = "FROM"
 WHERE_KEYWORD = "WHERE"
 GROUP_BY_KEYWORD = "GROUP BY"
 
-def normalize_and_strip_comments(query: str) -> str:
-    """Standardize query format and strip all comments."""
-    query = query.replace("_x000D_", "\n").strip()
-    query = re.sub(COMMENT_HEADER_REGEX, "", query)
-    return re.sub(SPACE_REGEX, " ", query)
+def normalize_and_strip_comments(query: str) -> Tuple[str, List[str]]:
+    """Standardize query format and strip all comments, leaving string literals untouched; returns the text and the hints removed."""
+    return normalize_query(query)
 
 
-@lru_cache(maxsize=None)
-def parse_sql(query: str) -> Optional[sqlglot.Expression]:
-    """Parse SQL query using sqlglot and cache results."""
-    try:
-        return parse_one(query, dialect="oracle")
-    except ParseError as e:
-       logging.error(f"sqlglot parse error: {e}, query={query}")
-       return None
-
-
-def extract_ctes(query: str) -> Dict[str, str]:
-    """Extract CTE names and bodies from the query."""
-    logging.debug(f"extract_ctes: query={query}")
-    ctes = {}
-    for match in re.finditer(CTE_REGEX, query):
-        cte_name = match.group(1).strip()
-        cte_body = match.group(2).strip()
-        ctes[cte_name] = cte_body
-    logging.debug(f"extract_ctes: ctes={ctes}")
-    return ctes
-
-def _extract_alias(token_str: str) -> Optional[str]:
-    """Extract alias from a token string using regex."""
-    match = re.search(ALIAS_REGEX, token_str)
-    return match.group(1).strip() if match else None
-
-def _process_expression(expression: Any, tables: List[str], joins: List[str], aliases: Dict[str, str], columns: List[str], processor_type: str, query:str, depth:int = 0) -> None:
-    """Process SQL expressions for table, column, and join extraction recursively."""
-    if depth > 10:
-        logging.debug(f"_process_expression: Max depth reached, stopping recursion")
-        return
-
-    if isinstance(expression, exp.Table):
-        table_name = expression.name
-        table_alias = _extract_alias(str(expression))
-        if processor_type == "table":
-            if table_name:
-                 tables.append(table_name)
-            if table_alias:
-                  aliases[table_alias] = table_name
-    elif isinstance(expression, exp.Column):
-        column_name = expression.name
-        if processor_type == "column" and column_name:
-            columns.append(column_name)
-    elif isinstance(expression, exp.Join):
-        if processor_type == "table":
-            joins.append(str(expression.kind) + " " + str(expression.this) + " ON " + str(expression.expression))
-
-    elif isinstance(expression, exp.Alias):
-         alias = str(expression.alias)
-         aliased_name = str(expression.this)
-         if alias and aliased_name and processor_type == "table":
-             aliases[alias] = aliased_name
-         _process_expression(expression.this,tables, joins, aliases, columns, processor_type, query, depth + 1)
-
-    elif isinstance(expression, exp.Identifier):
-        if processor_type == "column":
-            columns.append(str(expression.this))
-    elif isinstance(expression, exp.Func):
-        if processor_type == "column":
-             for arg in expression.args:
-                  if isinstance(arg, exp.Identifier):
-                      columns.append(str(arg.name))
-    elif isinstance(expression, exp.Window):
-        if processor_type == "column":
-             for arg in expression.args:
-                  if isinstance(arg, exp.Identifier):
-                     columns.append(str(arg.name))
-
-    elif isinstance(expression, exp.Expression):
-        for child in expression.args.values():
-                if isinstance(child, list):
-                  for c in child:
-                    _process_expression(c, tables, joins, aliases, columns, processor_type, query, depth + 1)
-                else:
-                  _process_expression(child, tables, joins, aliases, columns, processor_type, query, depth + 1)
-
-def extract_query_hints(query: str) -> str:
-    """Extract hints from SQL queries using regex."""
-    hints = re.findall(HINT_REGEX, query)
-    return ' '.join(hints) if hints else None
-
-def extract_tables_and_joins(parsed_statement: sqlglot.Expression, query: str) -> Dict[str, Any]:
-    """Extract tables and join conditions using sqlglot."""
-    logging.debug(f"extract_tables_and_joins: parsed_statement={parsed_statement}")
-    tables = []
-    joins = []
-    aliases = {}
-
-    if parsed_statement:
-      for expression in parsed_statement.find_all(exp.From):
-         for table in expression.args.values():
-             _process_expression(table, tables, joins, aliases, [],"table", query)
-    logging.debug(f"extract_tables_and_joins: returning tables={tables}, joins={joins}, aliases={aliases}")
-    return {"Base Tables": tables, "Joins": joins, "Aliases": aliases}
-
-
-def extract_where_columns(parsed_statement: sqlglot.Expression, query:str) -> List[str]:
-    """Extract columns from WHERE clause using sqlglot."""
-    logging.debug(f"extract_where_columns: parsed_statement={parsed_statement}")
-    columns = []
-
-    if parsed_statement:
-      for expression in parsed_statement.find_all(exp.Where):
-          for clause in expression.args.values():
-             _process_expression(clause, [], [], {}, columns,"column", query)
-    logging.debug(f"extract_where_columns: returning columns={columns}")
-    return columns
-
-def extract_group_by_columns(parsed_statement: sqlglot.Expression, query:str) -> List[str]:
-    """Extract columns from GROUP BY clause using sqlglot."""
-    logging.debug(f"extract_group_by_columns: parsed_statement={parsed_statement}")
-    columns = []
-
-    if parsed_statement:
-        for expression in parsed_statement.find_all(exp.Group):
-            for group in expression.args.values():
-                _process_expression(group, [], [], {}, columns,"column", query)
-
-    logging.debug(f"extract_group_by_columns: returning columns={columns}")
-    return columns
-
-def extract_sub_queries(parsed_statement: sqlglot.Expression, depth: int = 0) -> List[str]:
-    """Extract sub-queries using sqlglot."""
-    logging.debug(f"extract_sub_queries: parsed_statement={parsed_statement}, depth={depth}")
-    if depth > 10:
-        logging.debug("extract_sub_queries: max depth reached, stopping recursion")
-        return []
-    sub_queries = []
-
-    if parsed_statement:
-       for expression in parsed_statement.find_all(exp.Subquery):
-         sub_queries.append(str(expression))
-       for expression in parsed_statement.find_all(exp.Select):
-         if isinstance(expression.parent, exp.Subquery) is False and isinstance(expression.parent, exp.CTE) is False:
-           sub_queries.append(str(expression))
-    logging.debug(f"extract_sub_queries: returning sub_queries={sub_queries}")
-    return sub_queries
-
-
-def map_aliases_to_columns(parsed_statement: sqlglot.Expression, query: str, depth: int = 0) -> Dict[str, str]:
-    """Parse final SELECT and map aliases to base columns using sqlglot."""
-    logging.debug(f"map_aliases_to_columns: parsed_statement={parsed_statement}, depth={depth}")
-    if depth > 10:
-       logging.debug("map_aliases_to_columns: max depth reached, stopping recursion")
-       return {}
-    aliases = {}
-
-    if parsed_statement:
-       for expression in parsed_statement.find_all(exp.Select):
-           for select_exp in expression.expressions:
-               if isinstance(select_exp, exp.Alias):
-                  alias = str(select_exp.alias)
-                  aliased_name = str(select_exp.this)
-                  if alias and aliased_name:
-                        aliases[alias] = aliased_name
-    logging.debug(f"map_aliases_to_columns: returning aliases={aliases}")
-    return aliases
+# Bounded per-process cache of parse trees, keyed by dialect and query fingerprint
+PARSE_CACHE = ParseCache()
+# Parser tiers known to fail per query fingerprint within this worker
+PARSE_FAILURES = ParseFailures()
 
 def process_query(row):
-    """Process a single SQL query."""
-    query_id = row.get("Content ID") or row.get("Query ID") or "N/A"
-    query = row.table_query
+    """Process a single SQL query passed in as a (query id, table_query) struct."""
+    return analyze_sql(row[0] or "N/A", row.table_query)
+
+def analyze_sql(query_id: Any, query: Any, normalized: Optional[Tuple[str, List[str]]] = None) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Analyze one query within the CPU budget; returns (query_result, None) on success or (None, error_log) on failure.
+
+    normalized is the query's (text, hints) from normalize_queries when the whole batch was normalized up front.
+    """
     try:
-        logging.info(f"Processing Query ID: {query_id}")
-        query = normalize_and_strip_comments(query)
-        parsed_statement = parse_sql(query)
-        query_hints = extract_query_hints(query)
-
-        if parsed_statement:
-          # Extract metadata
-          logging.debug(f"Main loop: Before extract_tables_and_joins")
-          tables_joins = extract_tables_and_joins(parsed_statement, query)
-          tables = tables_joins["Base Tables"]
-          joins = tables_joins["Joins"]
-          aliases = tables_joins["Aliases"]
-          logging.debug(f"Main loop: Before extract_group_by_columns")
-          group_by = extract_group_by_columns(parsed_statement, query)
-          logging.debug(f"Main loop: Before extract_where_columns")
-          where_columns = extract_where_columns(parsed_statement, query)
-          logging.debug(f"Main loop: Before extract_ctes")
-          ctes = extract_ctes(query)
-
-          # Extract sub-queries
-          logging.debug(f"Main loop: Before extract_sub_queries")
-          sub_queries = extract_sub_queries(parsed_statement)
+        with cpu_budget(QUERY_TIMEOUT):
+            return _analyze_sql(query_id, query, normalized)
+    except QueryTimeout as e:
+        logging.error(f"Timed out processing query {query_id}: {e}")
+        return None, {"Query ID": query_id, "Error": str(e), "Query": query}
+
+def _analyze_sql(query_id: Any, query: Any, normalized: Optional[Tuple[str, List[str]]] = None) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    try:
+        logging.info("Processing Query ID: %s", query_id)
+        # Hints come out of the normalizer, which removes them from the text along with the comments
+        query, hints = normalized or normalize_query(query)
+        query_hints = " ".join(hints) if hints else None
+        # Extract metadata in a single pass, falling back through the parser tiers until one succeeds
+        tier, elements = parse_tiered(query, PARSE_CACHE, PARSE_FAILURES)
+
+        if tier != "none":
+          logging.debug("Main loop: Parsed with the %s tier", tier)
+          tables = elements["Base Tables"]
+          joins = elements["Joins"]
+          aliases = elements["Aliases"]
+          group_by = elements["Group By"]
+          where_columns = elements["Where Columns"]
+          ctes = elements["CTEs"]
+          sub_queries = elements["Sub-Queries"]
 
           # Analyze sub-queries
           sub_query_metadata = []
+          # Sub-queries were analyzed on their AST subtrees during the walk; text is only rendered for the output
           for sub_idx, sub_query in enumerate(sub_queries, start=1):
-              sub_parser = parse_sql(sub_query)
-              sub_tables = []
-              sub_columns = []
-              sub_ctes = extract_ctes(sub_query)
-              if sub_parser:
-                _process_expression(sub_parser, sub_tables, [], {}, sub_columns, "table", sub_query)
+              sub_tables = sub_query["Tables"]
+              sub_columns = sub_query["Columns"]
+              sub_ctes = {canonical_cte_name(cte): str(cte.this) for cte in sub_query["CTEs"]}
 
 
               sub_query_metadata.append({
@@ -247,12 +104,11 @@ def process_query(row):
                   "Tables": sub_tables,
                   "Columns": sub_columns,
                   "CTEs": sub_ctes,
-                  "Sub-Query": sub_query
+                  "Sub-Query": str(sub_query["Node"])
               })
 
           # Map aliases in main query
-          logging.debug(f"Main loop: Before map_aliases_to_columns")
-          select_aliases = map_aliases_to_columns(parsed_statement, query)
+          select_aliases = elements["Select Aliases"]
 
           # Merge aliases dictionaries. Select aliases will take preference
           merged_aliases = aliases.copy()
@@ -268,81 +124,252 @@ def process_query(row):
               "CTEs": ctes,
               "Aliases": merged_aliases,
               "Sub-Queries": sub_query_metadata,
+              "Parser Tier": tier,
               "Query": query,
                "Hints": query_hints
           }
           return query_result, None
         else:
-          return None,  {"Query ID": query_id, "Error": f"Parsing error with sqlglot.", "Query": query}
+          return None,  {"Query ID": query_id, "Error": f"Parsing error: no parser tier could read the query.", "Query": query}
     except Exception as e:
         logging.error(f"Error processing query {query_id}: {e}, query='{query}'")
         return None, {"Query ID": query_id, "Error": str(e), "Query": query}
 
+# Flat, Arrow-friendly rows produced by the batch path; failed queries carry their message in "Error"
+BATCH_RESULT_SCHEMA = StructType([
+    StructField("Query ID", StringType(), True),
+    StructField("Tables", ArrayType(StringType()), True),
+    StructField("Joins", ArrayType(StringType()), True),
+    StructField("Group By", ArrayType(StringType()), True),
+    StructField("Where Columns", ArrayType(StringType()), True),
+    StructField("CTEs", ArrayType(StringType()), True),
+    StructField("Aliases", StringType(), True),
+    StructField("Sub-Query Count", IntegerType(), True),
+    StructField("Sub-Query Tables", ArrayType(StringType()), True),
+    StructField("Sub-Query Columns", ArrayType(StringType()), True),
+    StructField("Parser Tier", StringType(), True),
+    StructField("Query", StringType(), True),
+    StructField("Hints", StringType(), True),
+    StructField("Error", StringType(), True),
+    StructField("Partition", IntegerType(), True),
+    StructField("Analysis Seconds", DoubleType(), True),
+])
+BATCH_RESULT_COLUMNS = [field.name for field in BATCH_RESULT_SCHEMA.fields]
+# Lexical metrics appended to the batch rows with --metrics, one column per Summary_Data_Sample metric
+METRIC_FIELDS = [StructField(name, ArrayType(StringType()) if name == "Columns in Final SELECT" else IntegerType(), True) for name in METRIC_COLUMNS]
+
+def flatten_result(query_id: Any, query_result: Optional[Dict[str, Any]], error_log: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Turn a process_query result into one flat row; sub-query details are reduced to flattened lists."""
+    if query_result is None:
+        query = error_log["Query"]
+        # Fill every column so Arrow never has to cast NaN into the list and integer columns
+        return {"Query ID": str(query_id), "Tables": [], "Joins": [], "Group By": [], "Where Columns": [], "CTEs": [],
+                "Aliases": None, "Sub-Query Count": 0, "Sub-Query Tables": [], "Sub-Query Columns": [], "Parser Tier": None,
+                "Query": query if isinstance(query, str) else None, "Hints": None, "Error": error_log["Error"]}
+    sub_queries = query_result["Sub-Queries"]
+    return {
+        "Query ID": str(query_id),
+        "Tables": query_result["Tables"],
+        "Joins": query_result["Joins"],
+        "Group By": query_result["Group By"],
+        "Where Columns": query_result["Where Columns"],
+        "CTEs": list(query_result["CTEs"]),
+        "Aliases": json.dumps(query_result["Aliases"]),
+        "Sub-Query Count": len(sub_queries),
+        "Sub-Query Tables": [table for sub_query in sub_queries for table in sub_query["Tables"]],
+        "Sub-Query Columns": [column for sub_query in sub_queries for column in sub_query["Columns"]],
+        "Parser Tier": query_result["Parser Tier"],
+        "Query": query_result["Query"],
+        "Hints": query_result["Hints"],
+        "Error": None,
+    }
+
+def process_batches(batches: Iterator[pd.DataFrame], metrics: bool = False) -> Iterator[pd.DataFrame]:
+    """mapInPandas entry point: analyze each Arrow batch with this Python worker's already-imported parser and warm cache.
+
+    With metrics, the batch's raw query column is also scanned for the lexical metrics, added as METRIC_FIELDS columns.
+    """
+    partition = TaskContext.get().partitionId()
+    for batch in batches:
+        rows = []
+        queries = batch["table_query"]
+        for query_id, query, normalized in zip(batch["Query ID"], queries, normalize_queries(queries)):
+            started = time.perf_counter()
+            row = flatten_result(query_id, *analyze_sql(query_id, query, normalized if isinstance(query, str) else None))
+            row["Partition"] = partition
+            row["Analysis Seconds"] = time.perf_counter() - started
+            rows.append(row)
+        frame = pd.DataFrame(rows, columns=BATCH_RESULT_COLUMNS)
+        if metrics:
+            # Scanned from the raw text, whose comments and line breaks the metrics count
+            frame = pd.concat([frame, metrics_frame(queries.reset_index(drop=True))], axis=1)
+        yield frame
+
+def critical_element_counts(results_df: DataFrame, cte_names: Any, top_n: int) -> pd.DataFrame:
+    """Top-N tables, WHERE columns and CTEs computed in one Spark job, as (Kind, Name, count) rows."""
+    elements_df = results_df.select(lit("Table").alias("Kind"), explode("Tables").alias("Name")).unionByName(
+        results_df.select(lit("Column").alias("Kind"), explode("Where Columns").alias("Name"))).unionByName(
+        results_df.select(lit("CTE").alias("Kind"), explode(cte_names).alias("Name")))
+    ranking = Window.partitionBy("Kind").orderBy(col("count").desc(), col("Name"))
+    top_df = elements_df.groupBy("Kind", "Name").count().withColumn("Rank", row_number().over(ranking)).where(col("Rank") <= top_n)
+    return top_df.orderBy("Kind", "Rank").drop("Rank").toPandas()
+
+def critical_element_sketches(results_df: DataFrame, cte_names: Any, top_n: int, capacity: int = SKETCH_CAPACITY) -> pd.DataFrame:
+    """Approximate top-N without a shuffle: one sketch per kind and partition, merged pairwise, as (Kind, Name, count, Min Count) rows."""
+    kinds = ("Table", "Column", "CTE")
+
+    def sketch_partition(rows):
+        sketches = {kind: SketchCounter(capacity) for kind in kinds}
+        for row in rows:
+            sketches["Table"].update(row["Tables"] or [])
+            sketches["Column"].update(row["Columns"] or [])
+            sketches["CTE"].update(row["CTE Names"] or [])
+        yield sketches
+
+    def merge_sketches(left, right):
+        for kind in kinds:
+            left[kind].update(right[kind])
+        return left
+
+    elements_df = results_df.select(col("Tables"), col("Where Columns").alias("Columns"), cte_names.alias("CTE Names"))
+    sketches = elements_df.rdd.mapPartitions(sketch_partition).treeReduce(merge_sketches)
+    rows = [(kind, name, upper, lower) for kind in kinds for name, upper, lower in sketches[kind].top(top_n)]
+    return pd.DataFrame(rows, columns=["Kind", "Name", "count", "Min Count"])
+
 if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description="Analyze SQL queries from an Excel file using PySpark.")
-    parser.add_argument("--file_path", type=str, default = FILE_PATH, help="Path to the Excel file.")
-    parser.add_argument("--sheet_name", type=str, default= SHEET_NAME, help="Name of the sheet containing SQL queries.")
+    parser = argparse.ArgumentParser(description="Analyze SQL queries from an Excel, CSV or Tableau JSON export, or a directory of .sql files, using PySpark.")
+    parser.add_argument("--file_path", type=str, default = FILE_PATH, help="Path to the .xlsx, .csv or .json file, or a directory of .sql files.")
+    parser.add_argument("--sheet_name", type=str, default= SHEET_NAME, help="Name of the sheet containing SQL queries (Excel only).")
+    parser.add_argument("--execution", type=str, choices=EXECUTION_MODES, default="batch", help="Analyze Arrow batches with mapInPandas, or one row at a time with a Python UDF (default: batch).")
+    parser.add_argument("--batch_size", type=int, default=BATCH_SIZE, help="Queries per Arrow batch in batch mode (default: 1000).")
+    parser.add_argument("--schedule", type=str, choices=SCHEDULES, default="balanced", help="Bin-pack queries into partitions by estimated cost, or keep Spark's default partitioning (default: balanced).")
+    parser.add_argument("--partitions", type=int, default=None, help="Partitions for the balanced schedule (default: Spark's default parallelism).")
+    parser.add_argument("--metrics", action="store_true", help="Also scan each query for the summary metrics (CTE, DB link, table, column, wildcard, hint, date and line counts); batch execution only.")
+    parser.add_argument("--query_timeout", type=float, default=QUERY_TIMEOUT, help="CPU seconds allowed per query before it is reported as timed out (default: 60, 0 disables).")
+    parser.add_argument("--top_n_mode", type=str, choices=TOP_N_MODES, default="exact", help="Rank critical elements with an exact group-by, or with mergeable per-partition sketches (default: exact).")
+    parser.add_argument("--sketch_capacity", type=int, default=SKETCH_CAPACITY, help="Candidates tracked per sketch with --top_n_mode approx (default: 1000).")
+    parser.add_argument("--query_column", type=str, default=QUERY_COLUMN, help="Column holding the SQL text (Excel and CSV only, default: table_query).")
     parser.add_argument("--output_file", type=str, default=OUTPUT_FILE, help="Output file name (default: oracle_sql_parsing_results.xlsx).")
 
     args = parser.parse_args()
     FILE_PATH = args.file_path
     SHEET_NAME = args.sheet_name
     OUTPUT_FILE = args.output_file
+    QUERY_TIMEOUT = args.query_timeout
+    if args.metrics and args.execution != "batch":
+        parser.error("--metrics needs --execution batch")
 
     # Initialize Spark session
     spark = SparkSession.builder.appName("SQLAnalyzer").getOrCreate()
+    # Ship the shared helper modules to the executors running process_query
+    for module_file in ("Visitor.py", "Cache.py", "Scheduler.py", "Watchdog.py", "Fingerprint.py", "Tiers.py", "Lexer.py", "FastScan.py", "Identifiers.py", "Sketches.py", "Profiling.py", "Metrics.py"):
+        spark.sparkContext.addPyFile(os.path.join(os.path.dirname(os.path.abspath(__file__)), module_file))
+
+    # Stream the input in chunks instead of loading the whole workbook into pandas first
+    sql_queries_df = None
+    partitions = args.partitions or spark.sparkContext.defaultParallelism
+    # Largest-first bin packing by estimated cost, one bin per partition, one read chunk at a time: the packer keeps the bin
+    # loads across chunks, so no partition collects several giant queries and the driver never holds more than a chunk
+    packer = BinPacker(partitions)
+    for chunk in read_query_chunks(FILE_PATH, READ_CHUNK_SIZE, SHEET_NAME, args.query_column):
+        chunk_columns = list(chunk[0].keys())
+        chunk_fields = [StructField(name, StringType(), True) for name in chunk_columns]
+        if args.schedule == "balanced":
+            chunk = packer.assign((record, estimate_cost(record[QUERY_COLUMN])) for record in chunk)
+            chunk_fields.append(StructField("Bin", IntegerType(), False))
+            rows = [(*(None if record.get(name) is None else str(record.get(name)) for name in chunk_columns), bin_index) for record, bin_index in chunk]
+        else:
+            rows = [tuple(None if record.get(name) is None else str(record.get(name)) for name in chunk_columns) for record in chunk]
+        chunk_df = spark.createDataFrame(rows, StructType(chunk_fields))
+        sql_queries_df = chunk_df if sql_queries_df is None else sql_queries_df.unionByName(chunk_df, allowMissingColumns=True)
 
-    # Load SQL queries from Excel to pandas, then to Spark
-    excel_data = pd.ExcelFile(FILE_PATH)
-    df = excel_data.parse(SHEET_NAME)
-    sql_queries_df = spark.createDataFrame(df)
+    if args.schedule == "balanced":
+        # Move each bin to its own partition, keyed by bin index
+        binned = sql_queries_df.rdd.map(lambda row: (row["Bin"], row)).partitionBy(partitions, lambda bin_index: bin_index).values()
+        sql_queries_df = spark.createDataFrame(binned, sql_queries_df.schema).drop("Bin")
 
     # Identify the Query ID/Content ID column
-    id_column = "Content ID" if "Content ID" in df.columns else "Query ID" if "Query ID" in df.columns else None
-
-
-    # Process each query
-    process_query_udf = udf(process_query, StructType([
-        StructField("query_result",  StructType([
-            StructField("Query ID",StringType(),True),
-            StructField("Tables", ArrayType(StringType()), True),
-            StructField("Joins", ArrayType(StringType()), True),
-            StructField("Group By", ArrayType(StringType()), True),
-            StructField("Where Columns", ArrayType(StringType()), True),
-            StructField("CTEs",  StringType(), True),
-            StructField("Aliases", StringType(),True),
-            StructField("Sub-Queries", ArrayType(StructType([
-                StructField("Sub-Query Index", StringType(),True),
-                StructField("Tables", ArrayType(StringType()), True),
-                StructField("Columns", ArrayType(StringType()), True),
-                StructField("CTEs",  StringType(), True),
-                StructField("Sub-Query", StringType(),True)])),True),
-            StructField("Query", StringType(),True),
-             StructField("Hints", StringType(), True)
-        ]),True),
-         StructField("error_log",  StructType([
-             StructField("Query ID", StringType(),True),
-             StructField("Error", StringType(),True),
-             StructField("Query", StringType(),True)]),True)
-    ]))
+    id_column = next((name for name in ("Content ID", "Query ID", "content_id", "table_id") if name in sql_queries_df.columns), None)
 
-    id_col = col(id_column) if id_column else lit("N/A").alias("Query ID")
-    processed_df = sql_queries_df.withColumn("processed_data", process_query_udf(struct(id_col, col("table_query"))))
 
-    # Split results into successful and failed queries
-    results_df = processed_df.select("processed_data.query_result").where("processed_data.query_result is not null")
-    error_df = processed_df.select("processed_data.error_log").where("processed_data.error_log is not null")
+    id_col = col(id_column) if id_column else lit("N/A").alias("Query ID")
 
-    # Flatten the results dataframe and prepare for pandas
-    flattened_results_df = results_df.select("query_result.*").toPandas()
+    if args.execution == "batch":
+        # Arrow moves whole column batches to the Python workers; each worker keeps sqlglot and its parse cache warm across batches
+        spark.conf.set("spark.sql.execution.arrow.pyspark.enabled", "true")
+        spark.conf.set("spark.sql.execution.arrow.maxRecordsPerBatch", str(args.batch_size))
+        batch_input_df = sql_queries_df.select(id_col.cast("string").alias("Query ID"), col("table_query"))
+        result_schema = StructType(BATCH_RESULT_SCHEMA.fields + METRIC_FIELDS) if args.metrics else BATCH_RESULT_SCHEMA
+        processed_df = batch_input_df.mapInPandas(partial(process_batches, metrics=args.metrics), result_schema)
+
+        # Split results into successful and failed queries
+        results_df = processed_df.where(col("Error").isNull()).drop("Error", "Partition", "Analysis Seconds")
+        error_df = processed_df.where(col("Error").isNotNull()).select("Query ID", "Error", "Query")
+        cte_names = col("CTEs")
+    else:
+        # Process each query
+        process_query_udf = udf(process_query, StructType([
+            StructField("query_result",  StructType([
+                StructField("Query ID",StringType(),True),
+                StructField("Tables", ArrayType(StringType()), True),
+                StructField("Joins", ArrayType(StringType()), True),
+                StructField("Group By", ArrayType(StringType()), True),
+                StructField("Where Columns", ArrayType(StringType()), True),
+                StructField("CTEs",  MapType(StringType(), StringType()), True),
+                StructField("Aliases", StringType(),True),
+                StructField("Sub-Queries", ArrayType(StructType([
+                    StructField("Sub-Query Index", StringType(),True),
+                    StructField("Tables", ArrayType(StringType()), True),
+                    StructField("Columns", ArrayType(StringType()), True),
+                    StructField("CTEs",  MapType(StringType(), StringType()), True),
+                    StructField("Sub-Query", StringType(),True)])),True),
+                StructField("Parser Tier", StringType(),True),
+                StructField("Query", StringType(),True),
+                 StructField("Hints", StringType(), True)
+            ]),True),
+             StructField("error_log",  StructType([
+                 StructField("Query ID", StringType(),True),
+                 StructField("Error", StringType(),True),
+                 StructField("Query", StringType(),True)]),True)
+        ]))
+
+        processed_df = sql_queries_df.withColumn("processed_data", process_query_udf(struct(id_col, col("table_query"))))
+
+        # Split results into successful and failed queries
+        results_df = processed_df.where("processed_data.query_result is not null").select("processed_data.query_result.*")
+        error_df = processed_df.where("processed_data.error_log is not null").select("processed_data.error_log.*")
+        # CTEs come back as a name -> body map; only the names are counted
+        cte_names = map_keys("CTEs")
+
+    # Parse once: every action below reads the persisted rows instead of re-running the analysis
+    processed_df = processed_df.persist(StorageLevel.MEMORY_AND_DISK)
+
+    # Prepare results for pandas; metrics go to their own sheet rather than widening the detailed results
+    flattened_results_df = results_df.toPandas()
+    metrics_df = None
+    if args.metrics:
+        metrics_df = flattened_results_df[["Query ID", *METRIC_COLUMNS]].copy()
+        metrics_df["Columns in Final SELECT"] = metrics_df["Columns in Final SELECT"].apply(list).astype(str)
+        flattened_results_df = flattened_results_df.drop(columns=list(METRIC_COLUMNS))
 
     #Collect and format error logs
-    error_logs = error_df.select("error_log.*").toPandas() if not error_df.rdd.isEmpty() else pd.DataFrame()
+    error_logs = error_df.toPandas()
+
+    # Per-partition analysis time, to confirm the partitions are balanced
+    if args.execution == "batch":
+        partition_times = processed_df.groupBy("Partition").agg(count("*").alias("Queries"), sum_("Analysis Seconds").alias("Seconds")).toPandas()
+        print(format_task_summary(task_summary(partition_times["Seconds"].tolist())))
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("Per-partition analysis time:\n%s", partition_times.sort_values("Seconds", ascending=False).to_string(index=False))
 
     # Aggregate critical elements
-    table_counts = results_df.select(explode("Tables").alias("Table")).groupBy("Table").count().orderBy("count", ascending=False).limit(TOP_N).toPandas()
-    column_counts = results_df.select(explode("Where Columns").alias("Column")).groupBy("Column").count().orderBy("count", ascending=False).limit(TOP_N).toPandas()
-    cte_counts = results_df.select(explode(map_from_entries("CTEs")).alias("CTE")).groupBy("CTE").count().orderBy("count", ascending=False).limit(TOP_N).toPandas()
+    if args.top_n_mode == "approx":
+        critical_counts = critical_element_sketches(results_df, cte_names, TOP_N, args.sketch_capacity)
+    else:
+        critical_counts = critical_element_counts(results_df, cte_names, TOP_N)
+    table_counts, column_counts, cte_counts = (
+        critical_counts[critical_counts["Kind"] == kind].drop(columns="Kind").rename(columns={"Name": kind})
+        for kind in ("Table", "Column", "CTE"))
 
     # Save results to Excel
     with pd.ExcelWriter(OUTPUT_FILE) as writer:
@@ -352,15 +379,21 @@ if __name__ == '__main__':
         cte_counts.to_excel(writer, sheet_name="Critical CTEs", index=False)
         if not error_logs.empty:
             error_logs.to_excel(writer, sheet_name="Problematic Queries", index=False)
+        if metrics_df is not None:
+            metrics_df.to_excel(writer, sheet_name="Query Metrics", index=False)
 
         # Add a query level analysis sheet. This adds a few columns to the details sheet to make it more searchable
         if not flattened_results_df.empty:
             query_level_df = flattened_results_df.copy()
-            query_level_df['Has_Subqueries'] = flattened_results_df['Sub-Queries'].apply(lambda x: len(x) > 0)
+            if "Sub-Query Count" in flattened_results_df:
+                query_level_df['Has_Subqueries'] = flattened_results_df['Sub-Query Count'] > 0
+            else:
+                query_level_df['Has_Subqueries'] = flattened_results_df['Sub-Queries'].apply(lambda x: len(x) > 0)
             query_level_df['Has_Where_Clause'] = flattened_results_df['Where Columns'].apply(lambda x: len(x) > 0)
             query_level_df['Has_GroupBy'] = flattened_results_df['Group By'].apply(lambda x: len(x) > 0)
             query_level_df['Has_CTEs'] = flattened_results_df['CTEs'].apply(lambda x: len(x) > 0)
             query_level_df.to_excel(writer, sheet_name="Query-Level Analysis", index=False)
 
     print(f"Comprehensive parsing results saved to {OUTPUT_FILE}")
+    processed_df.unpersist()
     spark.stop()
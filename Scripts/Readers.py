@@ -0,0 +1,148 @@
+import csv
+import json
+import logging
+import os
+import sys
+from itertools import islice
+from typing import Dict, List, Any, Iterator, Optional
+
+# Streaming query readers: every reader yields one record per query without loading the whole input
+
+QUERY_COLUMN = "table_query"
+READ_CHUNK_SIZE = 1000
+JSON_BLOCK_SIZE = 1 << 20
+SQL_FILE_EXTENSIONS = (".sql",)
+
+# Tableau custom-SQL cells routinely exceed the csv module's 128KB default field limit
+csv.field_size_limit(min(sys.maxsize, 2**31 - 1))
+
+
+def read_csv(path: str, query_column: str = QUERY_COLUMN) -> Iterator[Dict[str, Any]]:
+    """Yield rows of a CSV export, one record per row."""
+    with open(path, newline="", encoding="utf-8-sig") as handle:
+        for row in csv.DictReader(handle):
+            row[QUERY_COLUMN] = row.pop(query_column, None)
+            yield row
+
+
+def read_xlsx(path: str, sheet_name: Optional[str] = None, query_column: str = QUERY_COLUMN) -> Iterator[Dict[str, Any]]:
+    """Yield rows of an Excel sheet using openpyxl's read-only mode, which streams rows instead of building the sheet."""
+    try:
+        from openpyxl import load_workbook
+    except ImportError as e:
+        raise ImportError("Reading .xlsx input requires openpyxl (pip install openpyxl)") from e
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheet_name] if sheet_name else workbook.worksheets[0]
+        rows = sheet.iter_rows(values_only=True)
+        header = [str(cell) if cell is not None else "" for cell in next(rows, ())]
+        if query_column not in header:
+            raise KeyError(f"Column '{query_column}' not found in sheet '{sheet.title}' of {path}")
+        for values in rows:
+            row = dict(zip(header, values))
+            row[QUERY_COLUMN] = row.pop(query_column, None)
+            yield row
+    finally:
+        workbook.close()
+
+
+def _iter_json_array(path: str) -> Iterator[Any]:
+    """Yield the elements of a top-level JSON array, decoding one element at a time from buffered blocks."""
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8-sig") as handle:
+        buffer, position, eof, in_array = "", 0, False, False
+        while True:
+            # Skip whitespace and the separators between elements
+            while position < len(buffer) and (buffer[position].isspace() or (in_array and buffer[position] == ",")):
+                position += 1
+            if position < len(buffer):
+                if not in_array:
+                    if buffer[position] != "[":
+                        raise ValueError(f"{path} does not contain a JSON array")
+                    in_array = True
+                    position += 1
+                    continue
+                if buffer[position] == "]":
+                    return
+                try:
+                    element, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    # The element is split across blocks unless the file has ended
+                    if eof:
+                        raise
+                else:
+                    position = end
+                    yield element
+                    continue
+            elif eof:
+                raise ValueError(f"{path}: unexpected end of JSON array")
+            # Keep only the unconsumed tail and read the next block
+            block = handle.read(JSON_BLOCK_SIZE)
+            eof = not block
+            buffer = buffer[position:] + block
+            position = 0
+
+
+def _downstream_project(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Pick the first downstream data source or workbook as the query's project and source."""
+    for key, source in (("downstreamDatasources", "datasource"), ("downstreamWorkbooks", "workbook")):
+        for downstream in item.get(key) or []:
+            return {"content_id": downstream.get("luid"), "content_name": downstream.get("name"),
+                    "project_name": downstream.get("projectName"), "source": source}
+    return {"content_id": None, "content_name": None, "project_name": None, "source": None}
+
+
+def read_tableau_json(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield records from a Tableau custom-SQL JSON export, parsed incrementally."""
+    for item in _iter_json_array(path):
+        yield {"table_id": item.get("id"), "table_name": item.get("name"), QUERY_COLUMN: item.get("query"), **_downstream_project(item)}
+
+
+def _read_sql_file(file_path: str, root: str) -> Dict[str, Any]:
+    """Build the record for one .sql file, taking its first directory below root as the project."""
+    relative_path = os.path.relpath(file_path, root)
+    parts = relative_path.split(os.sep)
+    with open(file_path, encoding="utf-8-sig", errors="replace") as handle:
+        query = handle.read()
+    return {"table_id": relative_path, "table_name": os.path.basename(file_path), QUERY_COLUMN: query,
+            "project_name": parts[0] if len(parts) > 1 else None, "source": "file"}
+
+
+def read_sql_directory(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield one record per .sql file under a directory, in a stable (sorted) order."""
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for file_name in sorted(files):
+            if file_name.lower().endswith(SQL_FILE_EXTENSIONS):
+                yield _read_sql_file(os.path.join(root, file_name), path)
+
+
+def read_queries(path: str, sheet_name: Optional[str] = None, query_column: str = QUERY_COLUMN) -> Iterator[Dict[str, Any]]:
+    """Pick a reader from the input's type and yield one record per query, with the SQL under 'table_query'."""
+    if os.path.isdir(path):
+        return read_sql_directory(path)
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return read_csv(path, query_column)
+    if extension in (".xlsx", ".xlsm"):
+        return read_xlsx(path, sheet_name, query_column)
+    if extension == ".json":
+        return read_tableau_json(path)
+    if extension in SQL_FILE_EXTENSIONS:
+        return iter([_read_sql_file(path, os.path.dirname(path))])
+    if extension == ".sqlpack":
+        from Corpus import read_packed
+        return read_packed(path)
+    raise ValueError(f"Unsupported input type for {path}; expected .csv, .xlsx, .json, .sql, .sqlpack or a directory of .sql files")
+
+
+def read_query_chunks(path: str, chunk_size: int = READ_CHUNK_SIZE, sheet_name: Optional[str] = None, query_column: str = QUERY_COLUMN) -> Iterator[List[Dict[str, Any]]]:
+    """Yield lists of at most chunk_size records so callers can start on the first chunk straight away."""
+    records = read_queries(path, sheet_name, query_column)
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            return
+        logging.debug("read_query_chunks: read %d records from %s", len(chunk), path)
+        yield chunk
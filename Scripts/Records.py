@@ -0,0 +1,233 @@
+import hashlib
+import tempfile
+from array import array
+from typing import Dict, List, Tuple, Any, Iterator, Optional
+from Identifiers import Interner
+
+# Compact storage for query results held until the end of a run: names as interned IDs, SQL text spooled to disk by offset
+
+# Result fields holding lists of names, stored as ID lists
+NAME_LIST_FIELDS = {"Tables", "Joins", "Group By", "Where Columns", "DB Links", "Hints"}
+SUB_QUERY_KEYS = ("Sub-Query Index", "Tables", "Columns", "CTEs", "Sub-Query")
+NO_TEXT = -1
+
+
+class TextSpool:
+    """Append-only store of SQL text in a temporary file, addressed by ID; identical texts are written once."""
+
+    def __init__(self):
+        self.file = tempfile.TemporaryFile(prefix="sql_results_")
+        self.offsets = array("q")
+        self.lengths = array("q")
+        self.ids: Dict[bytes, int] = {}
+        self.end = 0
+
+    def put(self, text: str) -> int:
+        data = text.encode("utf-8", "surrogatepass")
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        text_id = self.ids.get(digest)
+        if text_id is not None:
+            return text_id
+        self.file.seek(self.end)
+        self.file.write(data)
+        text_id = self.ids[digest] = len(self.offsets)
+        self.offsets.append(self.end)
+        self.lengths.append(len(data))
+        self.end += len(data)
+        return text_id
+
+    def get(self, text_id: int) -> str:
+        self.file.seek(self.offsets[text_id])
+        return self.file.read(self.lengths[text_id]).decode("utf-8", "surrogatepass")
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class CompactResult:
+    """One query's result: its index, the layout of its fields, a flat array of IDs encoding them, and any fields kept as-is."""
+
+    __slots__ = ("index", "layout", "body", "extras")
+
+    def __init__(self, index: Any, layout: int, body: array, extras: Optional[Dict[str, Any]]):
+        self.index = index
+        self.layout = layout
+        self.body = body
+        self.extras = extras
+
+
+def _is_names(value: Any) -> bool:
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
+def _is_name_map(value: Any) -> bool:
+    return isinstance(value, dict) and all(isinstance(key, str) and isinstance(item, str) for key, item in value.items())
+
+
+def _is_lineage(value: Any) -> bool:
+    return isinstance(value, dict) and all(isinstance(name, str) and isinstance(entry, dict) and list(entry) == ["Tables", "Columns"]
+                                           and _is_names(entry["Tables"]) and _is_names(entry["Columns"]) for name, entry in value.items())
+
+
+def _is_sub_queries(value: Any) -> bool:
+    return isinstance(value, list) and all(
+        isinstance(sub_query, dict) and tuple(sub_query) == SUB_QUERY_KEYS and isinstance(sub_query["Sub-Query Index"], int)
+        and _is_names(sub_query["Tables"]) and _is_names(sub_query["Columns"]) and _is_name_map(sub_query["CTEs"])
+        and isinstance(sub_query["Sub-Query"], str) for sub_query in value)
+
+
+class ResultStore:
+    """Append-only, list-like store of query results that keeps each one as a CompactResult.
+
+    Table, column, alias and join names are interned once per run; the normalized query, sub-query and CTE texts go to a
+    TextSpool, so a result costs a few arrays of integers in memory. Iterating decodes the results back into the dicts
+    analyze_query returns, in the same key order; pass text=False to skip reading the spooled texts back.
+    """
+
+    def __init__(self):
+        self.interner = Interner()
+        self.spool = TextSpool()
+        self.records: List[CompactResult] = []
+        self.layouts: List[Tuple[Tuple[str, str], ...]] = []
+        self._layout_ids: Dict[Tuple[Tuple[str, str], ...], int] = {}
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return self.iter_results()
+
+    def __bool__(self) -> bool:
+        return bool(self.records)
+
+    def extend(self, results: List[Dict[str, Any]]) -> None:
+        for query_result in results:
+            self.append(query_result)
+
+    def append(self, query_result: Dict[str, Any]) -> None:
+        self.records.append(self.encode(query_result))
+
+    def sort(self) -> None:
+        """Restore input order; results are always ordered by their query index."""
+        self.records.sort(key=lambda record: record.index)
+
+    def close(self) -> None:
+        self.spool.close()
+
+    def _text(self, text: Any) -> int:
+        return self.spool.put(text) if isinstance(text, str) else NO_TEXT
+
+    def _names(self, body: array, names: List[str]) -> None:
+        body.append(len(names))
+        body.extend(self.interner.intern(name) for name in names)
+
+    def encode(self, query_result: Dict[str, Any]) -> CompactResult:
+        """Encode a result dict; fields of an unexpected shape are kept unencoded in extras."""
+        body = array("i")
+        extras = None
+        layout = []
+        for field, value in query_result.items():
+            if field == "Query Index":
+                kind = "index"
+            elif field == "Parser Tier" and isinstance(value, str):
+                kind = "name"
+                body.append(self.interner.intern(value))
+            elif field == "Query" and (value is None or isinstance(value, str)):
+                kind = "text"
+                body.append(self._text(value))
+            elif field in NAME_LIST_FIELDS and _is_names(value):
+                kind = "names"
+                self._names(body, value)
+            elif field == "Aliases" and _is_name_map(value):
+                kind = "name map"
+                self._names(body, [part for pair in value.items() for part in pair])
+            elif field == "CTEs" and _is_name_map(value):
+                kind = "text map"
+                body.append(len(value))
+                for name, text in value.items():
+                    body.extend((self.interner.intern(name), self._text(text)))
+            elif field == "CTE Lineage" and _is_lineage(value):
+                kind = "lineage"
+                body.append(len(value))
+                for name, entry in value.items():
+                    body.append(self.interner.intern(name))
+                    self._names(body, entry["Tables"])
+                    self._names(body, entry["Columns"])
+            elif field == "Sub-Queries" and _is_sub_queries(value):
+                kind = "sub-queries"
+                body.append(len(value))
+                for sub_query in value:
+                    body.append(sub_query["Sub-Query Index"])
+                    self._names(body, sub_query["Tables"])
+                    self._names(body, sub_query["Columns"])
+                    body.append(len(sub_query["CTEs"]))
+                    for name, text in sub_query["CTEs"].items():
+                        body.extend((self.interner.intern(name), self._text(text)))
+                    body.append(self._text(sub_query["Sub-Query"]))
+            else:
+                kind = "extra"
+                if extras is None:
+                    extras = {}
+                extras[field] = value
+            layout.append((field, kind))
+        layout = tuple(layout)
+        layout_id = self._layout_ids.get(layout)
+        if layout_id is None:
+            layout_id = self._layout_ids[layout] = len(self.layouts)
+            self.layouts.append(layout)
+        return CompactResult(query_result.get("Query Index"), layout_id, body, extras)
+
+    def decode(self, record: CompactResult, text: bool = True) -> Dict[str, Any]:
+        """Rebuild the result dict of a record; with text=False, spooled texts come back as None."""
+        names = self.interner.names
+        body = record.body
+        position = 0
+
+        def take() -> int:
+            nonlocal position
+            position += 1
+            return body[position - 1]
+
+        def take_names() -> List[str]:
+            nonlocal position
+            count = body[position]
+            position += 1 + count
+            return [names[identifier] for identifier in body[position - count:position]]
+
+        def take_text() -> Optional[str]:
+            text_id = take()
+            return self.spool.get(text_id) if text and text_id != NO_TEXT else None
+
+        query_result = {}
+        for field, kind in self.layouts[record.layout]:
+            if kind == "index":
+                query_result[field] = record.index
+            elif kind == "name":
+                query_result[field] = names[take()]
+            elif kind == "text":
+                query_result[field] = take_text()
+            elif kind == "names":
+                query_result[field] = take_names()
+            elif kind == "name map":
+                flat = take_names()
+                query_result[field] = dict(zip(flat[::2], flat[1::2]))
+            elif kind == "text map":
+                query_result[field] = {names[take()]: take_text() for _ in range(take())}
+            elif kind == "lineage":
+                query_result[field] = {names[take()]: {"Tables": take_names(), "Columns": take_names()} for _ in range(take())}
+            elif kind == "sub-queries":
+                sub_queries = []
+                for _ in range(take()):
+                    sub_query = {"Sub-Query Index": take(), "Tables": take_names(), "Columns": take_names()}
+                    sub_query["CTEs"] = {names[take()]: take_text() for _ in range(take())}
+                    sub_query["Sub-Query"] = take_text()
+                    sub_queries.append(sub_query)
+                query_result[field] = sub_queries
+            else:
+                query_result[field] = record.extras[field]
+        return query_result
+
+    def iter_results(self, text: bool = True) -> Iterator[Dict[str, Any]]:
+        """Decode the results one at a time, in stored order."""
+        for record in self.records:
+            yield self.decode(record, text)
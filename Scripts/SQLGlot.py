@@ -2,13 +2,32 @@ import pandas as pd
 import re
 from collections import Counter
 import logging
-from typing import Dict, List, Tuple, Any, Set, Optional
-from functools import lru_cache
+from typing import Dict, List, Tuple, Any, Set, Optional, Iterable, Iterator
+from functools import partial
+from itertools import islice
 import argparse
+import os
+import sys
+import time
 import sqlglot
-from sqlglot import exp, parse_one
-from sqlglot.errors import ParseError
-from pyparsing import ParseResults, ParserElement, Word, alphas, alphanums, delimitedList, Optional, Keyword, Forward, Group, Suppress, Regex, ParseSyntaxException
+from Tiers import PARSER_TIERS, parse_tiered, format_tier_summary
+from FastScan import scan_query
+from Metrics import METRIC_COLUMNS, scan_metrics
+from Lexer import normalize_query
+import Identifiers
+from Identifiers import IdentifierCounter, Interner, canonical_cte_name, configure_synonyms, db_links
+from Sketches import TOP_N_MODES, SKETCH_CAPACITY, SketchCounter
+from Profiling import PROFILER, ProfileReport, configure_profiling, format_profile
+from Records import CompactResult, ResultStore
+from Memory import MEMORY, MemoryReport, configure_memory_profiling, format_memory
+from Sampling import SAMPLE_STRATA, SAMPLE_CONFIDENCE, SAMPLE_SEED, stratified_sample, stratum_key, sample_preview, strata_frame
+from Fingerprint import DEDUP_MODES, fingerprint, fan_out
+from Readers import QUERY_COLUMN, read_queries
+from Corpus import PACK_EXTENSION, PackedQuery, pack_corpus, packed_queries, configure_corpus, resolve_query, resolve_hints
+from Sinks import OUTPUT_FORMATS, ROW_GROUP_SIZE, ColumnarSink, write_excel_summary
+from Scheduler import SCHEDULES, WINDOW_CHUNKS_PER_WORKER, balanced_chunks, task_summary, format_task_summary
+from Watchdog import QUERY_TIMEOUT, QueryTimeout, SupervisedPool, cpu_budget
+from Cache import DEFAULT_MAX_MB, PARSE_CACHE_MAX_ENTRIES, PARSE_CACHE_MAX_MB, ParseCache, ParseFailures, open_cache, result_key, format_stats
 
 # Set DEBUG to True for verbose logging, False otherwise
 DEBUG = False
@@ -21,10 +40,13 @@ FILE_PATH = r"C:\Users\joshm\source\repos\PolyQx\data_raw\data.xlsx"
 SHEET_NAME = "Table Sample"
 OUTPUT_FILE = "oracle_sql_parsing_results.xlsx"
 TOP_N = 10
+WORKERS = 1
+ANALYSIS_MODES = ("full", "fast")
+CHUNK_SIZE = 64
+# Bump when the extraction logic changes so cached results from older runs are not reused
+ANALYSIS_VERSION = 6
 
 # Pre-compile regex patterns
-COMMENT_HEADER_REGEX = re.compile(r"(?s)/\*.*?\*/|--.*?\n")
-CTE_REGEX = re.compile(r"WITH\s+([a-zA-Z0-9_]+)\s+AS\s*\((.*?)\)(?=\s*[,)]|$)", re.IGNORECASE | re.DOTALL)
 TABLE_REGEX = re.compile(r"([a-zA-Z0-9_]+(\.[a-zA-Z0-9_]+)?)", re.IGNORECASE)
 ALIAS_REGEX = re.compile(r'\b(?:as\s+)?([a-zA-Z0-9_]+)\b', re.IGNORECASE)
 COLUMN_REGEX = re.compile(r'\b([a-zA-Z0-9_]+)\b', re.IGNORECASE)
@@ -36,295 +58,609 @@ WHERE_KEYWORD = "WHERE"
 GROUP_BY_KEYWORD = "GROUP BY"
 
 
-def normalize_and_strip_comments(query: str) -> str:
-    """Standardize query format and strip all comments."""
-    query = query.replace("_x000D_", "\n").strip()
-    query = re.sub(COMMENT_HEADER_REGEX, "", query)
-    return re.sub(SPACE_REGEX, " ", query)
-
-@lru_cache(maxsize=None)
-def parse_sql(query: str) -> Optional[sqlglot.Expression]:
-    """Parse SQL query using sqlglot and cache results."""
-    try:
-        return parse_one(query)
-    except ParseError as e:
-       logging.error(f"sqlglot parse error: {e}, query={query}")
-       return None
-
-
-def extract_ctes(query: str) -> Dict[str, str]:
-    """Extract CTE names and bodies from the query."""
-    logging.debug(f"extract_ctes: query={query}")
-    ctes = {}
-    for match in re.finditer(CTE_REGEX, query):
-        cte_name = match.group(1).strip()
-        cte_body = match.group(2).strip()
-        ctes[cte_name] = cte_body
-    logging.debug(f"extract_ctes: ctes={ctes}")
-    return ctes
-
-def _extract_alias(token_str: str) -> Optional[str]:
-    """Extract alias from a token string using regex."""
-    match = re.search(ALIAS_REGEX, token_str)
-    return match.group(1).strip() if match else None
-
-def _process_expression(expression: Any, tables: List[str], joins: List[str], aliases: Dict[str, str], columns: List[str], processor_type: str, query:str, depth:int = 0) -> None:
-    """Process SQL expressions for table, column, and join extraction recursively."""
-    if depth > 10:
-        logging.debug(f"_process_expression: Max depth reached, stopping recursion")
-        return
-
-    if isinstance(expression, exp.Table):
-        table_name = expression.name
-        table_alias = _extract_alias(str(expression))
-        if processor_type == "table":
-            if table_name:
-                 tables.append(table_name)
-            if table_alias:
-                  aliases[table_alias] = table_name
-    elif isinstance(expression, exp.Column):
-        column_name = expression.name
-        if processor_type == "column" and column_name:
-            columns.append(column_name)
-    elif isinstance(expression, exp.Join):
-        if processor_type == "table":
-            joins.append(str(expression.kind) + " " + str(expression.this) + " ON " + str(expression.expression))
-
-    elif isinstance(expression, exp.Alias):
-         alias = str(expression.alias)
-         aliased_name = str(expression.this)
-         if alias and aliased_name and processor_type == "table":
-             aliases[alias] = aliased_name
-         _process_expression(expression.this,tables, joins, aliases, columns, processor_type, query, depth + 1)
-
-    elif isinstance(expression, exp.Identifier):
-        if processor_type == "column":
-            columns.append(str(expression.this))
-    elif isinstance(expression, exp.Func):
-        if processor_type == "column":
-             for arg in expression.args:
-                  if isinstance(arg, exp.Identifier):
-                      columns.append(str(arg.name))
-
-    elif isinstance(expression, exp.Expression):
-        for child in expression.args.values():
-                if isinstance(child, list):
-                  for c in child:
-                    _process_expression(c, tables, joins, aliases, columns, processor_type, query, depth + 1)
-                else:
-                  _process_expression(child, tables, joins, aliases, columns, processor_type, query, depth + 1)
-
-
-def extract_tables_and_joins(parsed_statement: sqlglot.Expression, query: str) -> Dict[str, Any]:
-    """Extract tables and join conditions using sqlglot."""
-    logging.debug(f"extract_tables_and_joins: parsed_statement={parsed_statement}")
-    tables = []
-    joins = []
-    aliases = {}
-
-    if parsed_statement:
-      for expression in parsed_statement.find_all(exp.From):
-         for table in expression.args.values():
-             _process_expression(table, tables, joins, aliases, [],"table", query)
-    logging.debug(f"extract_tables_and_joins: returning tables={tables}, joins={joins}, aliases={aliases}")
-    return {"Base Tables": tables, "Joins": joins, "Aliases": aliases}
-
-def extract_where_columns(parsed_statement: sqlglot.Expression, query:str) -> List[str]:
-    """Extract columns from WHERE clause using sqlglot."""
-    logging.debug(f"extract_where_columns: parsed_statement={parsed_statement}")
-    columns = []
-
-    if parsed_statement:
-      for expression in parsed_statement.find_all(exp.Where):
-          for clause in expression.args.values():
-             _process_expression(clause, [], [], {}, columns,"column", query)
-
-
-    logging.debug(f"extract_where_columns: returning columns={columns}")
-    return columns
-
-def extract_group_by_columns(parsed_statement: sqlglot.Expression, query:str) -> List[str]:
-    """Extract columns from GROUP BY clause using sqlglot."""
-    logging.debug(f"extract_group_by_columns: parsed_statement={parsed_statement}")
-    columns = []
-
-    if parsed_statement:
-        for expression in parsed_statement.find_all(exp.Group):
-            for group in expression.args.values():
-                _process_expression(group, [], [], {}, columns,"column", query)
-
-    logging.debug(f"extract_group_by_columns: returning columns={columns}")
-    return columns
-
-def extract_sub_queries(parsed_statement: sqlglot.Expression, depth: int = 0) -> List[str]:
-    """Extract sub-queries using sqlglot."""
-    logging.debug(f"extract_sub_queries: parsed_statement={parsed_statement}, depth={depth}")
-    if depth > 10:
-        logging.debug("extract_sub_queries: max depth reached, stopping recursion")
-        return []
-    sub_queries = []
-
-    if parsed_statement:
-       for expression in parsed_statement.find_all(exp.Subquery):
-         sub_queries.append(str(expression))
-       for expression in parsed_statement.find_all(exp.Select):
-         if isinstance(expression.parent, exp.Subquery) is False and isinstance(expression.parent, exp.CTE) is False:
-           sub_queries.append(str(expression))
-    logging.debug(f"extract_sub_queries: returning sub_queries={sub_queries}")
-    return sub_queries
-
-
-def map_aliases_to_columns(parsed_statement: sqlglot.Expression, query: str, depth: int = 0) -> Dict[str, str]:
-    """Parse final SELECT and map aliases to base columns using sqlglot."""
-    logging.debug(f"map_aliases_to_columns: parsed_statement={parsed_statement}, depth={depth}")
-    if depth > 10:
-       logging.debug("map_aliases_to_columns: max depth reached, stopping recursion")
-       return {}
-    aliases = {}
-
-    if parsed_statement:
-       for expression in parsed_statement.find_all(exp.Select):
-           for select_exp in expression.expressions:
-               if isinstance(select_exp, exp.Alias):
-                  alias = str(select_exp.alias)
-                  aliased_name = str(select_exp.this)
-                  if alias and aliased_name:
-                        aliases[alias] = aliased_name
-    logging.debug(f"map_aliases_to_columns: returning aliases={aliases}")
-    return aliases
-
-
-def analyze_query(query: str, idx: int) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
-    """Analyze a single SQL query."""
-    try:
-        logging.info(f"Processing Query Index: {idx}")
-        query = normalize_and_strip_comments(query)
-        parsed_statement = parse_sql(query)
-
-        # Extract metadata
-        logging.debug(f"Main loop: Before extract_tables_and_joins")
-        tables_joins = extract_tables_and_joins(parsed_statement, query)
-        tables = tables_joins["Base Tables"]
-        joins = tables_joins["Joins"]
-        aliases = tables_joins["Aliases"]
-        logging.debug(f"Main loop: Before extract_group_by_columns")
-        group_by = extract_group_by_columns(parsed_statement, query)
-        logging.debug(f"Main loop: Before extract_where_columns")
-        where_columns = extract_where_columns(parsed_statement, query)
-        logging.debug(f"Main loop: Before extract_ctes")
-        ctes = extract_ctes(query)
-
-        # Extract sub-queries
-        logging.debug(f"Main loop: Before extract_sub_queries")
-        sub_queries = extract_sub_queries(parsed_statement)
-
-        # Analyze sub-queries
-        sub_query_metadata = []
+def normalize_and_strip_comments(query: str) -> Tuple[str, List[str]]:
+    """Standardize query format and strip all comments, leaving string literals untouched; returns the text and the hints removed."""
+    return normalize_query(query)
+
+# Bounded per-process cache of parse trees, keyed by dialect and query fingerprint
+PARSE_CACHE = ParseCache()
+# Parser tiers known to fail per query fingerprint, so repeated broken queries skip straight to a tier that works
+PARSE_FAILURES = ParseFailures()
+
+def configure_parse_cache(max_entries: int, max_mb: int) -> None:
+    """Resize this process's parse cache, dropping cached trees if the limits change."""
+    global PARSE_CACHE
+    if PARSE_CACHE.max_entries != max_entries or PARSE_CACHE.max_bytes != max_mb * 1024 * 1024:
+        PARSE_CACHE = ParseCache(max_entries, max_mb)
+
+def new_counters(top_n_mode: str = "exact", capacity: int = SKETCH_CAPACITY) -> Dict[str, Any]:
+    """Create the frequency counters filled in by analyze_query.
+
+    Exact counters share one table of interned names; "approx" counters are bounded-memory sketches of `capacity` candidates.
+    """
+    if top_n_mode == "approx":
+        return {"Tables": SketchCounter(capacity, resolve_synonyms=True), "Columns": SketchCounter(capacity), "CTEs": SketchCounter(capacity)}
+    interner = Interner()
+    return {"Tables": IdentifierCounter(interner, resolve_synonyms=True), "Columns": IdentifierCounter(interner), "CTEs": IdentifierCounter(interner)}
+
+def merge_counters(target: Dict[str, Counter], source: Dict[str, Counter]) -> None:
+    """Add the counts from one set of counters into another."""
+    for key, counter in source.items():
+        target[key].update(counter)
+
+def counted_elements(query_result: Dict[str, Any]) -> Iterator[Tuple[str, List[str]]]:
+    """Yield (counter key, names) for every list of tables, columns and CTEs a query contributes to the rankings."""
+    for sub_query in query_result["Sub-Queries"]:
+        yield "Tables", sub_query["Tables"]
+        # Sub-query columns are not counted: the statement's own WHERE/GROUP BY lists already hold every one of them, and
+        # each column also appears in every enclosing sub-query (the root SELECT included)
+        yield "CTEs", list(sub_query["CTEs"].keys())
+    yield "Tables", query_result["Tables"]
+    yield "Columns", query_result["Group By"] + query_result["Where Columns"]
+    yield "CTEs", list(query_result["CTEs"].keys())
+
+def count_query_result(query_result: Dict[str, Any], counters: Dict[str, Counter]) -> None:
+    """Add a query's tables, columns and CTEs (including its sub-queries') to the frequency counters."""
+    for key, names in counted_elements(query_result):
+        counters[key].update(names)
+
+def recount_candidates(detailed_results: Iterable[Dict[str, Any]], candidates: Dict[str, Set[str]]) -> Dict[str, Counter]:
+    """Exact counts for just the candidate names of each counter, so approximate top-N lists can be confirmed cheaply."""
+    exact = {key: Counter() for key in candidates}
+    for query_result in detailed_results:
+        for key, names in counted_elements(query_result):
+            wanted = candidates[key]
+            if key == "Tables":
+                names = [Identifiers.SYNONYMS.get(name, name) for name in names]
+            exact[key].update(name for name in names if name in wanted)
+    return exact
+
+def query_element_counts(query_result: Dict[str, Any]) -> Dict[str, Counter]:
+    """Per-query counts of the elements count_query_result would add, keyed like the run-wide counters."""
+    counts = {"Tables": Counter(), "Columns": Counter(), "CTEs": Counter()}
+    for key, names in counted_elements(query_result):
+        if key == "Tables":
+            names = [Identifiers.SYNONYMS.get(name, name) for name in names]
+        counts[key].update(names)
+    return counts
+
+def critical_frame(counter: Any, label: str, top_n: int, exact: Optional[Counter] = None) -> pd.DataFrame:
+    """Top-N rows of one counter; approximate counters also report each count's lower bound, and the exact count when recounted."""
+    if not isinstance(counter, SketchCounter):
+        return pd.DataFrame(counter.items(), columns=[label, "Frequency"]).sort_values(by="Frequency", ascending=False).head(top_n)
+    frame = pd.DataFrame(counter.top(top_n), columns=[label, "Frequency", "Min Frequency"])
+    if exact is not None:
+        frame["Exact Frequency"] = frame[label].map(lambda name: exact[name])
+        frame = frame.sort_values(by="Exact Frequency", ascending=False, kind="stable")
+    return frame
+
+def format_live_top(counters: Dict[str, Any], tasks: int, top_n: int) -> str:
+    """One-line snapshot of the current leaders, printed while a run is still going."""
+    leaders = ", ".join(f"{name} ({count})" for name, count in counters["Tables"].most_common(top_n))
+    return f"[live] after {tasks} tasks, top tables: {leaders}"
+
+def build_query_result(query: str, idx: int, hints: List[str], cache: Any = None) -> Dict[str, Any]:
+    """Parse a normalized query and extract its tables, joins, clause columns, CTEs, aliases and sub-queries, alongside the hints normalization removed."""
+    # Extract metadata in a single pass, falling back through the parser tiers until one succeeds
+    logging.debug("Main loop: Before parse_tiered")
+    tier, elements = parse_tiered(query, PARSE_CACHE, PARSE_FAILURES, cache)
+    tables = elements["Base Tables"]
+    joins = elements["Joins"]
+    aliases = elements["Aliases"]
+    group_by = elements["Group By"]
+    where_columns = elements["Where Columns"]
+    ctes = elements["CTEs"]
+    sub_queries = elements["Sub-Queries"]
+
+    # Analyze sub-queries
+    sub_query_metadata = []
+    # Sub-queries were analyzed on their AST subtrees during the walk; text is only rendered for the output
+    with PROFILER.phase("sub-queries"):
         for sub_idx, sub_query in enumerate(sub_queries, start=1):
-            sub_parser = parse_sql(sub_query)
-            sub_tables = []
-            sub_columns = []
-            sub_ctes = extract_ctes(sub_query)
-            if sub_parser:
-              _process_expression(sub_parser, sub_tables, [], {}, sub_columns, "table", sub_query)
+            sub_tables = sub_query["Tables"]
+            sub_columns = sub_query["Columns"]
+            sub_ctes = {canonical_cte_name(cte): str(cte.this) for cte in sub_query["CTEs"]}
 
             sub_query_metadata.append({
                 "Sub-Query Index": sub_idx,
                 "Tables": sub_tables,
                 "Columns": sub_columns,
                 "CTEs": sub_ctes,
-                "Sub-Query": sub_query
+                "Sub-Query": str(sub_query["Node"])
             })
-            table_counter.update(sub_tables)
-            column_counter.update(sub_columns)
-            cte_counter.update(sub_ctes)
 
-
-        # Map aliases in main query
-        logging.debug(f"Main loop: Before map_aliases_to_columns")
-        select_aliases = map_aliases_to_columns(parsed_statement, query)
+    # Map aliases in main query
+    with PROFILER.phase("aliases"):
+        select_aliases = elements["Select Aliases"]
 
         # Merge aliases dictionaries. Select aliases will take preference
         merged_aliases = aliases.copy()
         merged_aliases.update(select_aliases)
 
-        # Store main query and sub-query results
-        query_result = {
-            "Query Index": idx,
-            "Tables": tables,
-            "Joins": joins,
-            "Group By": group_by,
-            "Where Columns": where_columns,
-            "CTEs": ctes,
-            "Aliases": merged_aliases,
-            "Sub-Queries": sub_query_metadata,
-            "Query": query
-        }
-        table_counter.update(tables)
-        column_counter.update(group_by + where_columns)
-        cte_counter.update(ctes)
+    # Store main query and sub-query results
+    query_result = {
+        "Query Index": idx,
+        "Tables": tables,
+        "Joins": joins,
+        "Group By": group_by,
+        "Where Columns": where_columns,
+        "CTEs": ctes,
+        # Physical tables and columns each CTE reads, through any CTEs it references
+        "CTE Lineage": elements["CTE Lineage"],
+        "Aliases": merged_aliases,
+        "Sub-Queries": sub_query_metadata,
+        "Parser Tier": tier,
+        # Links of the remote tables, reported alongside them as in the fast scan
+        "DB Links": db_links(tables),
+        "Hints": hints,
+        "Query": query
+    }
+    return query_result
+
+def build_fast_result(query: str, idx: int, hints: List[str]) -> Dict[str, Any]:
+    """Inventory a normalized query's tables, CTE names and DB links from its tokens alone, alongside the hints normalization removed."""
+    with PROFILER.phase("fast scan"):
+        scan = scan_query(query)
+    # Names are canonical on both sides, so a CTE reference matches its definition exactly
+    cte_names = set(scan["CTEs"])
+    return {
+        "Query Index": idx,
+        "Tables": [table for table in scan["Tables"] if table not in cte_names],
+        "Joins": [],
+        "Group By": [],
+        "Where Columns": [],
+        # Only CTE names are known without a parse, so their bodies are left empty
+        "CTEs": {name: "" for name in scan["CTEs"]},
+        "CTE Lineage": {},
+        "Aliases": {},
+        "Sub-Queries": [],
+        "Parser Tier": "fast",
+        "DB Links": scan["DB Links"],
+        "Hints": hints,
+        "Query": query
+    }
+
+def analyze_query(query: str, idx: int, counters: Dict[str, Counter], cache: Any = None, time_budget: Optional[float] = None, mode: str = "full",
+                  normalized: bool = False, hints: Optional[List[str]] = None) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Analyze a single SQL query, reusing a cached result for the same normalized SQL when a cache is given.
+
+    Parsing and extraction are abandoned with an error entry once they use more than time_budget seconds of CPU.
+    In "fast" mode only the token stream is scanned, for tables, CTE names, DB links and hints.
+    When profiling is on, the time spent in each phase is recorded for the query.
+    Pass normalized=True for text that is already normalized (e.g. read from a pack) to skip normalization, with the
+    hints that normalization removed from it.
+    """
+    PROFILER.begin(idx)
+    MEMORY.begin(idx)
+    try:
+        logging.info("Processing Query Index: %s", idx)
+        if not normalized:
+            with PROFILER.phase("normalize"):
+                query, hints = normalize_query(query)
+        hints = hints or []
+        key = None
+        if cache is not None:
+            with PROFILER.phase("cache"):
+                key = result_key(query, sqlglot.__version__, "fast" if mode == "fast" else ",".join(PARSER_TIERS), ANALYSIS_VERSION, hints)
+                query_result = cache.get(key)
+            if query_result is not None:
+                query_result = {"Query Index": idx, **query_result, "Query": query}
+                count_query_result(query_result, counters)
+                return query_result, []
+
+        with cpu_budget(time_budget):
+            query_result = build_fast_result(query, idx, hints) if mode == "fast" else build_query_result(query, idx, hints, cache)
+        with PROFILER.phase("output"):
+            count_query_result(query_result, counters)
+            if cache is not None:
+                # The index and query text come from the current run, so only the analysis is stored
+                cache.put(key, {field: value for field, value in query_result.items() if field not in ("Query Index", "Query")})
         return query_result, []
 
+    except QueryTimeout as e:
+        logging.error(f"Timed out processing query {idx}: {e}")
+        return {}, [{"Query Index": idx, "Error": str(e), "Query": query}]
     except Exception as e:
         logging.error(f"Error processing query {idx}: {e}, query='{query}'")
         return {}, [{"Query Index": idx, "Error": str(e), "Query": query}]
+    finally:
+        MEMORY.end()
+        PROFILER.end()
+
+def analyze_chunk(chunk: List[Tuple[int, str]], settings: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], Dict[str, Counter], Counter]:
+    """Analyze a chunk of (index, query) pairs with counters local to the chunk."""
+    started = time.perf_counter()
+    counters = new_counters()
+    configure_parse_cache(settings["parse_cache_entries"], settings["parse_cache_mb"])
+    configure_synonyms(settings["synonyms"])
+    configure_profiling(settings["profile"])
+    configure_memory_profiling(settings["memory_profile"])
+    configure_corpus(settings["corpus"])
+    cache = open_cache(settings["cache_dir"], settings["cache_max_mb"])
+    detailed_results = []
+    error_logs = []
+    for idx, query in chunk:
+        # Queries from a pack are read from the mapped file here rather than sent with the chunk, already normalized and with their hints
+        packed = isinstance(query, PackedQuery)
+        hints = resolve_hints(query)
+        query = resolve_query(query)
+        query_result, query_error_logs = analyze_query(query, idx, counters, cache, settings["query_timeout"], settings["mode"], packed and query is not None, hints)
+        if query_result:
+            detailed_results.append(query_result)
+        if query_error_logs:
+            error_logs.extend(query_error_logs)
+    stats = PARSE_CACHE.take_stats()
+    stats.update(PARSE_FAILURES.take_stats())
+    if cache is not None:
+        # One write per chunk rather than per query, so pool workers rarely wait on each other's SQLite locks
+        cache.flush()
+        stats.update(cache.take_stats())
+    stats["Task Seconds"] = time.perf_counter() - started
+    stats["Profile Samples"] = PROFILER.take()
+    stats["Memory Samples"] = MEMORY.take()
+    return detailed_results, error_logs, counters, stats
+
+def failed_chunk(chunk: List[Tuple[int, str]], reason: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], Dict[str, Counter], Counter]:
+    """Chunk output recording each query of a chunk whose worker had to be killed as a problematic query."""
+    error_logs = [{"Query Index": idx, "Error": reason, "Query": normalize_and_strip_comments(query)[0] if isinstance(query, str) else query}
+                  for idx, query in ((idx, resolve_query(query)) for idx, query in chunk)]
+    for error_log in error_logs:
+        logging.error(f"Error processing query {error_log['Query Index']}: {reason}")
+    return [], error_logs, new_counters(), Counter({"Killed Queries": len(error_logs)})
+
+def iter_chunks(queries: Any, chunk_size: int) -> Any:
+    """Yield lists of (index, query) pairs of at most chunk_size entries."""
+    iterator = iter(queries)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+# Run options read by analyze_chunk; keys match the command-line argument names
+DEFAULT_SETTINGS = {
+    "cache_dir": None,
+    "cache_max_mb": DEFAULT_MAX_MB,
+    "parse_cache_entries": PARSE_CACHE_MAX_ENTRIES,
+    "parse_cache_mb": PARSE_CACHE_MAX_MB,
+    "dedup": "exact",
+    "schedule": "balanced",
+    "query_timeout": QUERY_TIMEOUT,
+    "mode": "full",
+    "metrics": False,
+    "synonyms": None,
+    "top_n_mode": "exact",
+    "sketch_capacity": SKETCH_CAPACITY,
+    "live_top_n": 0,
+    "profile": True,
+    "memory_profile": False,
+    "corpus": None,
+}
+
+def run_analysis(queries: Any, workers: int = WORKERS, chunk_size: int = CHUNK_SIZE, settings: Optional[Dict[str, Any]] = None, sink: Any = None) -> Tuple[ResultStore, List[Dict[str, Any]], Dict[str, Counter], Counter]:
+    """Analyze (index, query) pairs serially or on a process pool, merging chunk results in input order.
+
+    Queries are fingerprinted before parsing (settings["dedup"]): only the first query of each fingerprint
+    is analyzed, and its result is copied to every later duplicate and counted once per copy.
+    When a sink is given, results and errors are written to it as they arrive instead of being returned; otherwise results are
+    kept compactly in a ResultStore (names interned, SQL text spooled to disk) that decodes them again when iterated.
+    With settings["schedule"] == "balanced", pool chunks are bin-packed by estimated cost and submitted heaviest first.
+    With settings["metrics"], each query's lexical metrics are scanned from its raw text and attached to its result as "Metrics".
+    With settings["profile"], per-phase timings are aggregated into a ProfileReport returned as stats["Profile"].
+    With settings["memory_profile"], each query's peak traced allocation is collected into a MemoryReport returned as stats["Memory"].
+    The number of results each parser tier produced is returned as stats["Parser Tiers"].
+    With settings["top_n_mode"] == "approx", the run-wide counters are mergeable sketches of bounded size; workers still count
+    their chunk exactly, and settings["live_top_n"] seconds apart the current leaders are printed to stderr.
+    With settings["corpus"] set to a pack, queries may be PackedQuery stand-ins: workers map the pack and read each query by
+    position, so chunks carry positions instead of SQL text and packed queries are never normalized again.
+    """
+    settings = {**DEFAULT_SETTINGS, **(settings or {})}
+    configure_synonyms(settings["synonyms"])
+    configure_corpus(settings["corpus"])
+    counters = new_counters(settings["top_n_mode"], settings["sketch_capacity"])
+    stats = Counter()
+    # Also encodes the representative results kept for later duplicates, so they are held compactly in either mode
+    detailed_results = ResultStore()
+    error_logs = []
+    groups = {}
+    # Representative index -> group still waiting for its analysis to come back
+    waiting = {}
+    task_seconds = []
+    # Query index -> lexical metrics of the raw text, held until that query's result is emitted
+    query_metrics = {}
+    reordered = workers > 1 and settings["schedule"] == "balanced"
+    last_live_report = time.monotonic()
+    profile = ProfileReport()
+    memory = MemoryReport()
+    # Results per parser tier, counted as they are emitted so the summary also covers runs written to a sink
+    tier_counts = Counter()
+
+    def emit(results, errors):
+        tier_counts.update(query_result.get("Parser Tier") for query_result in results)
+        if settings["metrics"]:
+            for query_result in results:
+                query_result["Metrics"] = query_metrics.pop(query_result["Query Index"], None)
+            for error_log in errors:
+                query_metrics.pop(error_log["Query Index"], None)
+        if sink is None:
+            detailed_results.extend(results)
+            error_logs.extend(errors)
+            return
+        for query_result in results:
+            sink.write_result(query_result)
+        for error_log in errors:
+            sink.write_error(error_log)
+
+    def resolve(group, members):
+        copies = fan_out_all(group["Results"], members)
+        for query_result in copies:
+            count_query_result(query_result, counters)
+        emit(copies, fan_out_all(group["Errors"], members))
+
+    def fan_out_all(entries, members):
+        return [copy for entry in entries for copy in fan_out(detailed_results.decode(entry) if isinstance(entry, CompactResult) else entry, members)]
+
+    def admit(pairs):
+        # Yield only the first query of each fingerprint; later copies reuse or wait for its result
+        for idx, query in pairs:
+            if isinstance(query, PackedQuery):
+                # Yielded as the stand-in so the SQL text stays in the pack; only the fingerprint needs it here
+                normalized, hints = resolve_query(query), resolve_hints(query)
+            else:
+                if settings["metrics"]:
+                    # Scanned before normalization, which drops the comments and line breaks the metrics count
+                    query_metrics[idx] = scan_metrics(query)
+                normalized, hints = normalize_query(query) if isinstance(query, str) else (query, [])
+            if settings["dedup"] == "none" or not isinstance(normalized, str):
+                yield idx, query
+                continue
+            key = fingerprint(normalized, settings["dedup"], hints)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = {"Results": None, "Errors": None, "Members": []}
+                waiting[idx] = group
+                stats["Distinct Queries"] += 1
+                yield idx, query
+                continue
+            stats["Duplicate Queries"] += 1
+            if group["Results"] is None:
+                group["Members"].append((idx, normalized))
+            else:
+                resolve(group, [(idx, normalized)])
+
+    def collect(chunk_output):
+        nonlocal last_live_report
+        chunk_results, chunk_errors, chunk_counters, chunk_stats = chunk_output
+        task_seconds.append(chunk_stats.pop("Task Seconds", 0.0))
+        profile.add(chunk_stats.pop("Profile Samples", []))
+        memory.add(chunk_stats.pop("Memory Samples", []))
+        emit(chunk_results, chunk_errors)
+        merge_counters(counters, chunk_counters)
+        stats.update(chunk_stats)
+        if settings["live_top_n"] and time.monotonic() - last_live_report >= settings["live_top_n"]:
+            last_live_report = time.monotonic()
+            print(format_live_top(counters, len(task_seconds), TOP_N), file=sys.stderr, flush=True)
+        for entry, failed in [(query_result, False) for query_result in chunk_results] + [(error_log, True) for error_log in chunk_errors]:
+            group = waiting.pop(entry["Query Index"], None)
+            if group is not None:
+                # Kept for duplicates still to come, so the result is stored encoded rather than as a dict
+                group["Results"] = [] if failed else [detailed_results.encode(entry)]
+                group["Errors"] = [entry] if failed else []
+                resolve(group, group["Members"])
+                group["Members"] = []
+
+    def finish():
+        # Eviction runs once, in the parent, after every worker has written its results
+        cache = open_cache(settings["cache_dir"], settings["cache_max_mb"])
+        if cache is not None:
+            cache.evict()
+            stats.update(cache.take_stats())
+        # Duplicates are filled in as their representative completes, so restore input order
+        detailed_results.sort()
+        error_logs.sort(key=lambda error_log: error_log["Query Index"])
+        if reordered and sink is None:
+            # Recount in input order so ties in the top-N lists break the same way as a serial run
+            counters.update(new_counters(settings["top_n_mode"], settings["sketch_capacity"]))
+            for query_result in detailed_results.iter_results(text=False):
+                count_query_result(query_result, counters)
+        stats.update(task_summary(task_seconds))
+        stats["Profile"] = profile
+        stats["Memory"] = memory
+        stats["Parser Tiers"] = tier_counts
+        return detailed_results, error_logs, counters, stats
+
+    queries = admit(queries)
+    if workers <= 1:
+        for chunk in iter_chunks(queries, chunk_size):
+            collect(analyze_chunk(chunk, settings))
+        return finish()
+
+    # Skewed inputs: even out chunk costs so one chunk of giant queries does not hold up the pool
+    chunks = balanced_chunks(queries, chunk_size, workers * chunk_size * WINDOW_CHUNKS_PER_WORKER) if reordered else iter_chunks(queries, chunk_size)
+
+    # Keep a bounded number of chunks in flight so the input is not materialised up front;
+    # the pool kills and respawns workers stuck past the hard time limit or crashed by a query
+    pool = SupervisedPool(workers, partial(analyze_chunk, settings=settings), settings["query_timeout"], failed_chunk)
+    try:
+        for chunk in chunks:
+            pool.submit(chunk)
+            if len(pool) >= workers * 2:
+                collect(pool.next_result())
+        while len(pool):
+            collect(pool.next_result())
+    finally:
+        pool.shutdown()
+    stats["Worker Restarts"] += pool.restarts
+    return finish()
 
 if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description="Analyze SQL queries from an Excel file.")
-    parser.add_argument("--file_path", type=str, required=True, help="Path to the Excel file.")
-    parser.add_argument("--sheet_name", type=str, required=True, help="Name of the sheet containing SQL queries.")
+    parser = argparse.ArgumentParser(description="Analyze SQL queries from an Excel, CSV or Tableau JSON export, or a directory of .sql files.")
+    parser.add_argument("--file_path", type=str, required=True, help="Path to the .xlsx, .csv or .json file, a directory of .sql files, or a .sqlpack written by --pack_corpus.")
+    parser.add_argument("--sheet_name", type=str, default=None, help="Name of the sheet containing SQL queries (Excel only, default: first sheet).")
+    parser.add_argument("--query_column", type=str, default=QUERY_COLUMN, help="Column holding the SQL text (Excel and CSV only, default: table_query).")
     parser.add_argument("--output_file", type=str, default=OUTPUT_FILE, help="Output file name (default: oracle_sql_parsing_results.xlsx).")
+    parser.add_argument("--output_format", "--output-format", type=str, choices=OUTPUT_FORMATS, default="excel", help="Write a full Excel workbook, or Parquet/Arrow tables to --output_dir (default: excel).")
+    parser.add_argument("--output_dir", type=str, default="oracle_sql_parsing_results", help="Directory for Parquet/Arrow tables (default: oracle_sql_parsing_results).")
+    parser.add_argument("--row_group_size", type=int, default=ROW_GROUP_SIZE, help="Rows per Parquet row group / Arrow record batch (default: 10000).")
+    parser.add_argument("--excel_summary", action="store_true", help="With Parquet/Arrow output, also write an Excel summary built from the tables to --output_file.")
+    parser.add_argument("--mode", type=str, choices=ANALYSIS_MODES, default="full", help="Parse every query fully, or only scan tokens for a table/CTE inventory (default: full).")
+    parser.add_argument("--metrics", action="store_true", help="Also scan each query for the summary metrics (CTE, DB link, table, column, wildcard, hint, date and line counts).")
+    parser.add_argument("--synonyms", type=str, default=None, help="JSON file mapping synonyms to the tables they stand for, e.g. {\"PATIENT\": \"CLARITY.PATIENT\"}, merged when ranking tables.")
+    parser.add_argument("--top_n_mode", type=str, choices=TOP_N_MODES, default="exact", help="Rank critical elements with exact counters, or with bounded-memory sketches for very large corpora (default: exact).")
+    parser.add_argument("--sketch_capacity", type=int, default=SKETCH_CAPACITY, help="Candidates tracked per sketch with --top_n_mode approx (default: 1000).")
+    parser.add_argument("--recount_candidates", action="store_true", help="With --top_n_mode approx, recount the top-N candidates exactly from the collected results.")
+    parser.add_argument("--live_top_n", type=float, default=0, help="Print the current top tables to stderr every this many seconds while running (default: 0, off).")
+    parser.add_argument("--sample", type=int, default=0, help="Preview mode: analyze a stratified random sample of at most this many queries and write estimated frequencies with confidence intervals (default: 0, full run).")
+    parser.add_argument("--sample_strata", type=str, default=",".join(SAMPLE_STRATA), help="Comma-separated input columns to stratify the sample by (default: project_name,source).")
+    parser.add_argument("--sample_confidence", type=float, default=SAMPLE_CONFIDENCE, help="Confidence level of the sample intervals (default: 0.95).")
+    parser.add_argument("--sample_seed", type=int, default=SAMPLE_SEED, help="Random seed for the sample (default: 0).")
+    parser.add_argument("--no_profile", dest="profile", action="store_false", help="Skip the per-phase timers and the profile report written with each run.")
+    parser.add_argument("--memory_profile", action="store_true", help="Trace allocations: peak memory per stage, top allocation sites and the most memory-hungry queries, written with the results (slows the run).")
+    parser.add_argument("--pack_corpus", type=str, default=None, help="Normalize the input once into a memory-mapped .sqlpack at this path and analyze from it; later runs pass the pack as --file_path.")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Number of worker processes (default: 1, runs serially).")
+    parser.add_argument("--schedule", type=str, choices=SCHEDULES, default="balanced", help="With several workers, bin-pack chunks by estimated query cost, or keep input order (default: balanced).")
+    parser.add_argument("--chunk_size", type=int, default=CHUNK_SIZE, help="Queries submitted to a worker at a time (default: 64).")
+    parser.add_argument("--query_timeout", type=float, default=QUERY_TIMEOUT, help="CPU seconds allowed per query before it is reported as timed out; worker processes stuck well past it are killed (default: 60, 0 disables).")
+    parser.add_argument("--cache_dir", "--cache-dir", type=str, default=None, help="Directory for the persistent result cache (default: no cache).")
+    parser.add_argument("--cache_max_mb", type=int, default=DEFAULT_MAX_MB, help="Size budget for the result cache in MB (default: 512).")
+    parser.add_argument("--parse_cache_entries", type=int, default=PARSE_CACHE_MAX_ENTRIES, help="Parse trees kept in memory per process (default: 1024, 0 disables).")
+    parser.add_argument("--dedup", type=str, choices=DEDUP_MODES, default="exact", help="Analyze each distinct query once: exact text, literal-insensitive, or none (default: exact).")
+    parser.add_argument("--parse_cache_mb", type=int, default=PARSE_CACHE_MAX_MB, help="Estimated memory budget for cached parse trees per process in MB (default: 256).")
 
     args = parser.parse_args()
     FILE_PATH = args.file_path
     SHEET_NAME = args.sheet_name
     OUTPUT_FILE = args.output_file
 
-    # Load SQL queries from Excel file
-    data = pd.ExcelFile(FILE_PATH)
-    df = data.parse(SHEET_NAME)
-    sql_queries = df['table_query']
-
-    # Initialize counters and storage
-    table_counter = Counter()
-    column_counter = Counter()
-    cte_counter = Counter()
-    detailed_results = []
-    error_logs = []
-
-    # Analyze each query
-    for idx, query in enumerate(sql_queries, start=1):
-        query_result, query_error_logs = analyze_query(query, idx)
-        if query_result:
-            detailed_results.append(query_result)
-        if query_error_logs:
-           error_logs.extend(query_error_logs)
-
-    # Convert results to DataFrames
-    detailed_df = pd.DataFrame(detailed_results)
-    error_df = pd.DataFrame(error_logs)
-
-    # Aggregate critical elements
-    critical_tables = pd.DataFrame(table_counter.items(), columns=["Table", "Frequency"]).sort_values(by="Frequency", ascending=False).head(TOP_N)
-    critical_columns = pd.DataFrame(column_counter.items(), columns=["Column", "Frequency"]).sort_values(by="Frequency", ascending=False).head(TOP_N)
-    critical_ctes = pd.DataFrame(cte_counter.items(), columns=["CTE", "Frequency"]).sort_values(by="Frequency", ascending=False).head(TOP_N)
-
-    # Save results to Excel
-    with pd.ExcelWriter(OUTPUT_FILE) as writer:
-        detailed_df.to_excel(writer, sheet_name="Detailed Results", index=False)
-        critical_tables.to_excel(writer, sheet_name="Critical Tables", index=False)
-        critical_columns.to_excel(writer, sheet_name="Critical Columns", index=False)
-        critical_ctes.to_excel(writer, sheet_name="Critical CTEs", index=False)
-        if not error_df.empty:
-            error_df.to_excel(writer, sheet_name="Problematic Queries", index=False)
-
-        # Add a query level analysis sheet. This adds a few columns to the details sheet to make it more searchable
-        if not detailed_df.empty:
-            query_level_df = detailed_df.copy()
-            query_level_df['Has_Subqueries'] = detailed_df['Sub-Queries'].apply(lambda x: len(x) > 0)
-            query_level_df['Has_Where_Clause'] = detailed_df['Where Columns'].apply(lambda x: len(x) > 0)
-            query_level_df['Has_GroupBy'] = detailed_df['Group By'].apply(lambda x: len(x) > 0)
-            query_level_df['Has_CTEs'] = detailed_df['CTEs'].apply(lambda x: len(x) > 0)
-            query_level_df.to_excel(writer, sheet_name="Query-Level Analysis", index=False)
-
-    print(f"Comprehensive parsing results saved to {OUTPUT_FILE}")
+    if args.pack_corpus:
+        if not args.pack_corpus.endswith(PACK_EXTENSION):
+            parser.error(f"--pack_corpus must name a {PACK_EXTENSION} file")
+        packed_count = pack_corpus(read_queries(FILE_PATH, SHEET_NAME, args.query_column), args.pack_corpus)
+        print(f"Packed {packed_count} queries into {args.pack_corpus}")
+        FILE_PATH = args.pack_corpus
+    # Runs over a pack send workers query positions rather than SQL text
+    args.corpus = FILE_PATH if FILE_PATH.endswith(PACK_EXTENSION) else None
+    if args.corpus and args.metrics:
+        parser.error("--metrics scans the raw query text, which a pack does not keep; run it on the original input")
+
+    if args.sample > 0:
+        # Preview: read the whole input twice, for stratum sizes and then for the sample, but analyze only the sample
+        strata = [column.strip() for column in args.sample_strata.split(",") if column.strip()]
+        sample, populations, groups = stratified_sample(lambda: read_queries(FILE_PATH, SHEET_NAME, args.query_column), args.sample, strata, args.sample_seed)
+        sample_strata = {index: stratum_key(record, strata) for index, record in sample}
+        detailed_results, error_logs, counters, stats = run_analysis(((index, record[QUERY_COLUMN]) for index, record in sample), args.workers, args.chunk_size, vars(args))
+        previews = sample_preview(detailed_results.iter_results(text=False), sample_strata, populations, groups, query_element_counts, TOP_N, args.sample_confidence)
+        with pd.ExcelWriter(OUTPUT_FILE) as writer:
+            for kind, label in (("Tables", "Table"), ("Columns", "Column"), ("CTEs", "CTE")):
+                previews.get(kind, pd.DataFrame()).rename(columns={"Name": label}).to_excel(writer, sheet_name=f"Estimated {kind}", index=False)
+            strata_frame(populations, Counter(sample_strata.values()), groups, strata).to_excel(writer, sheet_name="Sample Strata", index=False)
+            if error_logs:
+                pd.DataFrame(error_logs).to_excel(writer, sheet_name="Problematic Queries", index=False)
+        print(f"Sampled {len(sample)} of {sum(populations.values())} queries from {len(populations)} strata ({len(error_logs)} failed)")
+        print(f"Sample preview saved to {OUTPUT_FILE}")
+        sys.exit(0)
+
+    # Trace from before the input is opened so reading it counts towards the analysis stage
+    configure_memory_profiling(args.memory_profile)
+
+    # Stream SQL queries from the input so analysis starts on the first chunk; a pack is mapped rather than read
+    if args.corpus:
+        sql_queries = packed_queries(args.corpus)
+    else:
+        sql_queries = enumerate((record[QUERY_COLUMN] for record in read_queries(FILE_PATH, SHEET_NAME, args.query_column)), start=1)
+
+    # Columnar output is written as results arrive; Excel output is built from the collected results
+    sink = None if args.output_format == "excel" else ColumnarSink(args.output_dir, args.output_format, args.row_group_size)
+
+    # Analyze each query, in chunks spread over the worker processes
+    with MEMORY.stage("analysis"):
+        try:
+            detailed_results, error_logs, counters, stats = run_analysis(sql_queries, args.workers, args.chunk_size, vars(args), sink)
+        finally:
+            if sink is not None:
+                sink.close()
+
+    if sink is not None:
+        print(f"Columnar results saved to {args.output_dir}")
+        if args.profile:
+            stats["Profile"].phase_frame().to_csv(os.path.join(args.output_dir, "phase_profile.csv"), index=False)
+            stats["Profile"].slowest_frame().to_csv(os.path.join(args.output_dir, "slowest_queries.csv"), index=False)
+        if args.memory_profile:
+            stats["Memory"].stage_frame().to_csv(os.path.join(args.output_dir, "memory_stages.csv"), index=False)
+            stats["Memory"].site_frame().to_csv(os.path.join(args.output_dir, "allocation_sites.csv"), index=False)
+            stats["Memory"].query_frame().to_csv(os.path.join(args.output_dir, "memory_heavy_queries.csv"), index=False)
+        if args.excel_summary:
+            write_excel_summary(args.output_dir, args.output_format, OUTPUT_FILE, TOP_N)
+            print(f"Excel summary saved to {OUTPUT_FILE}")
+    else:
+        with MEMORY.stage("result frames"):
+            table_counter = counters["Tables"]
+            column_counter = counters["Columns"]
+            cte_counter = counters["CTEs"]
+
+            # Convert results to DataFrames; metrics go to their own sheet rather than a column of dicts
+            metrics_rows = []
+            detailed_rows = []
+            for query_result in detailed_results:
+                metrics = query_result.pop("Metrics", None)
+                if metrics:
+                    metrics_rows.append({"Query Index": query_result["Query Index"], **metrics})
+                detailed_rows.append(query_result)
+            detailed_df = pd.DataFrame(detailed_rows)
+            del detailed_rows
+            error_df = pd.DataFrame(error_logs)
+
+            # Aggregate critical elements
+            exact = {"Tables": None, "Columns": None, "CTEs": None}
+            if args.top_n_mode == "approx" and args.recount_candidates:
+                candidates = {key: {name for name, _ in counter.most_common(TOP_N)} for key, counter in counters.items()}
+                exact = recount_candidates(detailed_results.iter_results(text=False), candidates)
+            critical_tables = critical_frame(table_counter, "Table", TOP_N, exact["Tables"])
+            critical_columns = critical_frame(column_counter, "Column", TOP_N, exact["Columns"])
+            critical_ctes = critical_frame(cte_counter, "CTE", TOP_N, exact["CTEs"])
+
+        # Save results to Excel
+        with MEMORY.stage("excel output"):
+            with pd.ExcelWriter(OUTPUT_FILE) as writer:
+                detailed_df.to_excel(writer, sheet_name="Detailed Results", index=False)
+                critical_tables.to_excel(writer, sheet_name="Critical Tables", index=False)
+                critical_columns.to_excel(writer, sheet_name="Critical Columns", index=False)
+                critical_ctes.to_excel(writer, sheet_name="Critical CTEs", index=False)
+                if not error_df.empty:
+                    error_df.to_excel(writer, sheet_name="Problematic Queries", index=False)
+                if args.profile:
+                    stats["Profile"].phase_frame().to_excel(writer, sheet_name="Phase Profile", index=False)
+                    stats["Profile"].slowest_frame().to_excel(writer, sheet_name="Slowest Queries", index=False)
+                if metrics_rows:
+                    metrics_df = pd.DataFrame(metrics_rows, columns=["Query Index", *METRIC_COLUMNS])
+                    metrics_df["Columns in Final SELECT"] = metrics_df["Columns in Final SELECT"].astype(str)
+                    metrics_df.to_excel(writer, sheet_name="Query Metrics", index=False)
+
+                # Add a query level analysis sheet. This adds a few columns to the details sheet to make it more searchable
+                if not detailed_df.empty:
+                    query_level_df = detailed_df.copy()
+                    query_level_df['Has_Subqueries'] = detailed_df['Sub-Queries'].apply(lambda x: len(x) > 0)
+                    query_level_df['Has_Where_Clause'] = detailed_df['Where Columns'].apply(lambda x: len(x) > 0)
+                    query_level_df['Has_GroupBy'] = detailed_df['Group By'].apply(lambda x: len(x) > 0)
+                    query_level_df['Has_CTEs'] = detailed_df['CTEs'].apply(lambda x: len(x) > 0)
+                    query_level_df.to_excel(writer, sheet_name="Query-Level Analysis", index=False)
+        if args.memory_profile:
+            # Written after the Excel stage has been measured, so the report includes it
+            with pd.ExcelWriter(OUTPUT_FILE, mode="a", engine="openpyxl") as writer:
+                stats["Memory"].stage_frame().to_excel(writer, sheet_name="Memory Stages", index=False)
+                stats["Memory"].site_frame().to_excel(writer, sheet_name="Allocation Sites", index=False)
+                stats["Memory"].query_frame().to_excel(writer, sheet_name="Memory-Heavy Queries", index=False)
+
+        print(f"Comprehensive parsing results saved to {OUTPUT_FILE}")
+    print(f"{stats['Distinct Queries']} distinct queries analyzed, {stats['Duplicate Queries']} duplicates reused")
+    print(format_stats(stats, "Parse"))
+    print(format_tier_summary(stats["Parser Tiers"], stats))
+    print(format_task_summary(stats))
+    if args.profile:
+        print(format_profile(stats["Profile"]))
+    if args.memory_profile:
+        print(format_memory(stats["Memory"]))
+    if stats["Worker Restarts"]:
+        print(f"Watchdog: {stats['Worker Restarts']} worker restarts, {stats['Killed Queries']} queries killed")
+    if args.cache_dir:
+        print(format_stats(stats, "Result"))
@@ -2,13 +2,15 @@ import pandas as pd
 import re
 from collections import Counter
 import logging
-from typing import Dict, List, Tuple, Any, Set, Optional
-from functools import lru_cache
+from typing import Dict, List, Tuple, Any, Optional
 import argparse
 import sqlglot
-from sqlglot import exp, parse_one
+from sqlglot import parse_one
 from sqlglot.errors import ParseError
-from pyparsing import ParseResults, ParserElement, Word, alphas, alphanums, delimitedList, Optional, Keyword, Forward, Group, Suppress, Regex, ParseSyntaxException
+from Lexer import normalize_query
+from Visitor import visit_statement
+from Identifiers import canonical_cte_name, db_links
+from Cache import ParseCache, format_stats
 
 # Set DEBUG to True for verbose logging, False otherwise
 DEBUG = False
@@ -23,8 +25,6 @@ OUTPUT_FILE = "oracle_sql_parsing_results.xlsx"
 TOP_N = 10
 
 # Pre-compile regex patterns
-COMMENT_HEADER_REGEX = re.compile(r"(?s)/\*.*?\*/|--.*?\n")
-CTE_REGEX = re.compile(r"WITH\s+([a-zA-Z0-9_]+)\s+AS\s*\((.*?)\)(?=\s*[,)]|$)", re.IGNORECASE | re.DOTALL)
 TABLE_REGEX = re.compile(r"([a-zA-Z0-9_]+(\.[a-zA-Z0-9_]+)?)", re.IGNORECASE)
 ALIAS_REGEX = re.compile(r'\b(?:as\s+)?([a-zA-Z0-9_]+)\b', re.IGNORECASE)
 COLUMN_REGEX = re.compile(r'\b([a-zA-Z0-9_]+)\b', re.IGNORECASE)
@@ -36,213 +36,65 @@ WHERE_KEYWORD = "WHERE"
 GROUP_BY_KEYWORD = "GROUP BY"
 
 
-def normalize_and_strip_comments(query: str) -> str:
-    """Standardize query format and strip all comments."""
-    query = query.replace("_x000D_", "\n").strip()
-    query = re.sub(COMMENT_HEADER_REGEX, "", query)
-    return re.sub(SPACE_REGEX, " ", query)
+def normalize_and_strip_comments(query: str) -> Tuple[str, List[str]]:
+    """Standardize query format and strip all comments, leaving string literals untouched; returns the text and the hints removed."""
+    return normalize_query(query)
 
-@lru_cache(maxsize=None)
-def parse_sql(query: str) -> Optional[sqlglot.Expression]:
-    """Parse SQL query using sqlglot and cache results."""
+# Bounded per-process cache of parse trees, keyed by query fingerprint
+PARSE_CACHE = ParseCache()
+
+def _parse_uncached(query: str) -> Optional[sqlglot.Expression]:
+    """Parse SQL query using sqlglot."""
     try:
         return parse_one(query)
     except ParseError as e:
        logging.error(f"sqlglot parse error: {e}, query={query}")
        return None
 
-
-def extract_ctes(query: str) -> Dict[str, str]:
-    """Extract CTE names and bodies from the query."""
-    logging.debug(f"extract_ctes: query={query}")
-    ctes = {}
-    for match in re.finditer(CTE_REGEX, query):
-        cte_name = match.group(1).strip()
-        cte_body = match.group(2).strip()
-        ctes[cte_name] = cte_body
-    logging.debug(f"extract_ctes: ctes={ctes}")
-    return ctes
-
-def _extract_alias(token_str: str) -> Optional[str]:
-    """Extract alias from a token string using regex."""
-    match = re.search(ALIAS_REGEX, token_str)
-    return match.group(1).strip() if match else None
-
-def _process_expression(expression: Any, tables: List[str], joins: List[str], aliases: Dict[str, str], columns: List[str], processor_type: str, query:str, depth:int = 0) -> None:
-    """Process SQL expressions for table, column, and join extraction recursively."""
-    if depth > 10:
-        logging.debug(f"_process_expression: Max depth reached, stopping recursion")
-        return
-
-    if isinstance(expression, exp.Table):
-        table_name = expression.name
-        table_alias = _extract_alias(str(expression))
-        if processor_type == "table":
-            if table_name:
-                 tables.append(table_name)
-            if table_alias:
-                  aliases[table_alias] = table_name
-    elif isinstance(expression, exp.Column):
-        column_name = expression.name
-        if processor_type == "column" and column_name:
-            columns.append(column_name)
-    elif isinstance(expression, exp.Join):
-        if processor_type == "table":
-            joins.append(str(expression.kind) + " " + str(expression.this) + " ON " + str(expression.expression))
-
-    elif isinstance(expression, exp.Alias):
-         alias = str(expression.alias)
-         aliased_name = str(expression.this)
-         if alias and aliased_name and processor_type == "table":
-             aliases[alias] = aliased_name
-         _process_expression(expression.this,tables, joins, aliases, columns, processor_type, query, depth + 1)
-
-    elif isinstance(expression, exp.Identifier):
-        if processor_type == "column":
-            columns.append(str(expression.this))
-    elif isinstance(expression, exp.Func):
-        if processor_type == "column":
-             for arg in expression.args:
-                  if isinstance(arg, exp.Identifier):
-                      columns.append(str(arg.name))
-
-    elif isinstance(expression, exp.Expression):
-        for child in expression.args.values():
-                if isinstance(child, list):
-                  for c in child:
-                    _process_expression(c, tables, joins, aliases, columns, processor_type, query, depth + 1)
-                else:
-                  _process_expression(child, tables, joins, aliases, columns, processor_type, query, depth + 1)
-
-
-def extract_tables_and_joins(parsed_statement: sqlglot.Expression, query: str) -> Dict[str, Any]:
-    """Extract tables and join conditions using sqlglot."""
-    logging.debug(f"extract_tables_and_joins: parsed_statement={parsed_statement}")
-    tables = []
-    joins = []
-    aliases = {}
-
-    if parsed_statement:
-      for expression in parsed_statement.find_all(exp.From):
-         for table in expression.args.values():
-             _process_expression(table, tables, joins, aliases, [],"table", query)
-    logging.debug(f"extract_tables_and_joins: returning tables={tables}, joins={joins}, aliases={aliases}")
-    return {"Base Tables": tables, "Joins": joins, "Aliases": aliases}
-
-def extract_where_columns(parsed_statement: sqlglot.Expression, query:str) -> List[str]:
-    """Extract columns from WHERE clause using sqlglot."""
-    logging.debug(f"extract_where_columns: parsed_statement={parsed_statement}")
-    columns = []
-
-    if parsed_statement:
-      for expression in parsed_statement.find_all(exp.Where):
-          for clause in expression.args.values():
-             _process_expression(clause, [], [], {}, columns,"column", query)
-
-
-    logging.debug(f"extract_where_columns: returning columns={columns}")
-    return columns
-
-def extract_group_by_columns(parsed_statement: sqlglot.Expression, query:str) -> List[str]:
-    """Extract columns from GROUP BY clause using sqlglot."""
-    logging.debug(f"extract_group_by_columns: parsed_statement={parsed_statement}")
-    columns = []
-
-    if parsed_statement:
-        for expression in parsed_statement.find_all(exp.Group):
-            for group in expression.args.values():
-                _process_expression(group, [], [], {}, columns,"column", query)
-
-    logging.debug(f"extract_group_by_columns: returning columns={columns}")
-    return columns
-
-def extract_sub_queries(parsed_statement: sqlglot.Expression, depth: int = 0) -> List[str]:
-    """Extract sub-queries using sqlglot."""
-    logging.debug(f"extract_sub_queries: parsed_statement={parsed_statement}, depth={depth}")
-    if depth > 10:
-        logging.debug("extract_sub_queries: max depth reached, stopping recursion")
-        return []
-    sub_queries = []
-
-    if parsed_statement:
-       for expression in parsed_statement.find_all(exp.Subquery):
-         sub_queries.append(str(expression))
-       for expression in parsed_statement.find_all(exp.Select):
-         if isinstance(expression.parent, exp.Subquery) is False and isinstance(expression.parent, exp.CTE) is False:
-           sub_queries.append(str(expression))
-    logging.debug(f"extract_sub_queries: returning sub_queries={sub_queries}")
-    return sub_queries
-
-
-def map_aliases_to_columns(parsed_statement: sqlglot.Expression, query: str, depth: int = 0) -> Dict[str, str]:
-    """Parse final SELECT and map aliases to base columns using sqlglot."""
-    logging.debug(f"map_aliases_to_columns: parsed_statement={parsed_statement}, depth={depth}")
-    if depth > 10:
-       logging.debug("map_aliases_to_columns: max depth reached, stopping recursion")
-       return {}
-    aliases = {}
-
-    if parsed_statement:
-       for expression in parsed_statement.find_all(exp.Select):
-           for select_exp in expression.expressions:
-               if isinstance(select_exp, exp.Alias):
-                  alias = str(select_exp.alias)
-                  aliased_name = str(select_exp.this)
-                  if alias and aliased_name:
-                        aliases[alias] = aliased_name
-    logging.debug(f"map_aliases_to_columns: returning aliases={aliases}")
-    return aliases
+def parse_sql(query: str) -> Optional[sqlglot.Expression]:
+    """Parse SQL query using sqlglot, reusing trees held in the bounded parse cache."""
+    return PARSE_CACHE.get_or_parse(query, _parse_uncached)
 
 
 def analyze_query(query: str, idx: int) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
     """Analyze a single SQL query."""
     try:
-        logging.info(f"Processing Query Index: {idx}")
-        query = normalize_and_strip_comments(query)
+        logging.info("Processing Query Index: %s", idx)
+        query, hints = normalize_and_strip_comments(query)
         parsed_statement = parse_sql(query)
 
-        # Extract metadata
-        logging.debug(f"Main loop: Before extract_tables_and_joins")
-        tables_joins = extract_tables_and_joins(parsed_statement, query)
-        tables = tables_joins["Base Tables"]
-        joins = tables_joins["Joins"]
-        aliases = tables_joins["Aliases"]
-        logging.debug(f"Main loop: Before extract_group_by_columns")
-        group_by = extract_group_by_columns(parsed_statement, query)
-        logging.debug(f"Main loop: Before extract_where_columns")
-        where_columns = extract_where_columns(parsed_statement, query)
-        logging.debug(f"Main loop: Before extract_ctes")
-        ctes = extract_ctes(query)
-
-        # Extract sub-queries
-        logging.debug(f"Main loop: Before extract_sub_queries")
-        sub_queries = extract_sub_queries(parsed_statement)
+        # Extract metadata in a single pass over the tree
+        logging.debug("Main loop: Before visit_statement")
+        elements = visit_statement(parsed_statement)
+        tables = elements["Base Tables"]
+        joins = elements["Joins"]
+        aliases = elements["Aliases"]
+        group_by = elements["Group By"]
+        where_columns = elements["Where Columns"]
+        ctes = elements["CTEs"]
+        sub_queries = elements["Sub-Queries"]
 
         # Analyze sub-queries
         sub_query_metadata = []
+        # Sub-queries were analyzed on their AST subtrees during the walk; text is only rendered for the output
         for sub_idx, sub_query in enumerate(sub_queries, start=1):
-            sub_parser = parse_sql(sub_query)
-            sub_tables = []
-            sub_columns = []
-            sub_ctes = extract_ctes(sub_query)
-            if sub_parser:
-              _process_expression(sub_parser, sub_tables, [], {}, sub_columns, "table", sub_query)
+            sub_tables = sub_query["Tables"]
+            sub_columns = sub_query["Columns"]
+            sub_ctes = {canonical_cte_name(cte): str(cte.this) for cte in sub_query["CTEs"]}
 
             sub_query_metadata.append({
                 "Sub-Query Index": sub_idx,
                 "Tables": sub_tables,
                 "Columns": sub_columns,
                 "CTEs": sub_ctes,
-                "Sub-Query": sub_query
+                "Sub-Query": str(sub_query["Node"])
             })
             table_counter.update(sub_tables)
-            column_counter.update(sub_columns)
-            cte_counter.update(sub_ctes)
+            cte_counter.update(sub_ctes.keys())
 
 
         # Map aliases in main query
-        logging.debug(f"Main loop: Before map_aliases_to_columns")
-        select_aliases = map_aliases_to_columns(parsed_statement, query)
+        select_aliases = elements["Select Aliases"]
 
         # Merge aliases dictionaries. Select aliases will take preference
         merged_aliases = aliases.copy()
@@ -256,13 +108,17 @@ def analyze_query(query: str, idx: int) -> Tuple[Dict[str, Any], List[Dict[str,
             "Group By": group_by,
             "Where Columns": where_columns,
             "CTEs": ctes,
+            # Physical tables and columns each CTE reads, through any CTEs it references
+            "CTE Lineage": elements["CTE Lineage"],
             "Aliases": merged_aliases,
             "Sub-Queries": sub_query_metadata,
+            "DB Links": db_links(tables),
+            "Hints": hints,
             "Query": query
         }
         table_counter.update(tables)
         column_counter.update(group_by + where_columns)
-        cte_counter.update(ctes)
+        cte_counter.update(ctes.keys())
         return query_result, []
 
     except Exception as e:
@@ -328,3 +184,4 @@ if __name__ == '__main__':
             query_level_df.to_excel(writer, sheet_name="Query-Level Analysis", index=False)
 
     print(f"Comprehensive parsing results saved to {OUTPUT_FILE}")
+    print(format_stats(PARSE_CACHE.take_stats(), "Parse"))
@@ -0,0 +1,173 @@
+import logging
+import math
+import random
+from collections import Counter
+from statistics import NormalDist
+from typing import Dict, List, Tuple, Any, Callable, Iterable, Sequence
+
+import pandas as pd
+
+# Stratified sampling preview: estimate run-wide element frequencies, with confidence intervals, from a small random sample
+
+# Input columns the sample is stratified by (Table_Data_Sample.csv layout); missing columns count as one stratum
+SAMPLE_STRATA = ("project_name", "source")
+SAMPLE_CONFIDENCE = 0.95
+SAMPLE_SEED = 0
+# Strata whose proportional share of the sample is below this are pooled and sampled as one, so each stratum's variance
+# is estimated from at least this many queries wherever the sample size allows
+MIN_STRATUM_SAMPLE = 2
+POOLED_STRATUM = ("(pooled)",)
+
+
+def stratum_key(record: Dict[str, Any], strata: Sequence[str]) -> Tuple[Any, ...]:
+    return tuple(record.get(column) for column in strata)
+
+
+def allocate(populations: Dict[Tuple[Any, ...], int], sample_size: int) -> Tuple[Dict[Tuple[Any, ...], Tuple[Any, ...]], Dict[Tuple[Any, ...], int]]:
+    """Map each stratum to the group it is sampled in, pooling the small ones, and split sample_size among the groups.
+
+    Groups get shares in proportion to their size by largest remainder, so the shares sum to exactly
+    min(sample_size, population). The pool gets at least one query when it exists.
+    """
+    total = sum(populations.values())
+    if not total:
+        return {}, {}
+    groups = {key: key if sample_size * population / total >= MIN_STRATUM_SAMPLE else POOLED_STRATUM for key, population in populations.items()}
+    sizes: Counter = Counter()
+    for key, group in groups.items():
+        sizes[group] += populations[key]
+    budget = min(sample_size, total)
+    quotas = {group: budget * size / total for group, size in sizes.items()}
+    allocation = {group: math.floor(quota) for group, quota in quotas.items()}
+    remaining = budget - sum(allocation.values())
+    for group in sorted(quotas, key=lambda group: quotas[group] - allocation[group], reverse=True)[:remaining]:
+        allocation[group] += 1
+    if allocation.get(POOLED_STRATUM) == 0 and budget > 0:
+        # Every other group holds at least MIN_STRATUM_SAMPLE, so the largest can spare one
+        largest = max(allocation, key=allocation.get)
+        allocation[largest] -= 1
+        allocation[POOLED_STRATUM] = 1
+    return groups, allocation
+
+
+def stratified_sample(read_records: Callable[[], Iterable[Dict[str, Any]]], sample_size: int, strata: Sequence[str] = SAMPLE_STRATA,
+                      seed: int = SAMPLE_SEED) -> Tuple[List[Tuple[int, Dict[str, Any]]], Dict[Tuple[Any, ...], int], Dict[Tuple[Any, ...], Tuple[Any, ...]]]:
+    """Draw at most sample_size (index, record) pairs, allocated to strata in proportion to their size.
+
+    read_records is called twice: once to count every stratum, then to fill one reservoir per group of exactly its
+    allocation, so no more than sample_size records are ever held. Strata too small for MIN_STRATUM_SAMPLE queries are
+    pooled (see allocate). Returns the sample in input order, the population of every stratum and its sampling group.
+    """
+    populations: Counter = Counter(stratum_key(record, strata) for record in read_records())
+    groups, allocation = allocate(populations, sample_size)
+    rng = random.Random(seed)
+    reservoirs: Dict[Tuple[Any, ...], List[Tuple[int, Dict[str, Any]]]] = {group: [] for group in allocation}
+    seen: Counter = Counter()
+    for index, record in enumerate(read_records(), start=1):
+        group = groups.get(stratum_key(record, strata))
+        if group is None:
+            # A record the first pass did not see, e.g. an input changed between passes
+            continue
+        seen[group] += 1
+        reservoir, size = reservoirs[group], allocation[group]
+        if len(reservoir) < size:
+            reservoir.append((index, record))
+        else:
+            slot = rng.randrange(seen[group])
+            if slot < size:
+                reservoir[slot] = (index, record)
+
+    sample = sorted((pair for reservoir in reservoirs.values() for pair in reservoir), key=lambda pair: pair[0])
+    pooled = sum(1 for group in groups.values() if group == POOLED_STRATUM)
+    logging.info(f"stratified_sample: {len(sample)} of {sum(populations.values())} queries from {len(populations)} strata ({pooled} pooled)")
+    return sample, dict(populations), groups
+
+
+def estimate_totals(sample_counts: Dict[Tuple[Any, ...], List[Counter]], populations: Dict[Tuple[Any, ...], int],
+                    confidence: float = SAMPLE_CONFIDENCE) -> pd.DataFrame:
+    """Stratified estimate of each name's run-wide frequency, with a normal-approximation confidence interval.
+
+    sample_counts maps each stratum to one Counter per sampled query (name -> occurrences in that query). The estimate is
+    the sum over strata of N_h * mean_h, and its variance sum N_h^2 (1 - n_h/N_h) s_h^2 / n_h. A stratum with a single
+    sampled query has no s_h^2 of its own, so it is given the largest of the other strata's and the whole sample's, rather
+    than none.
+    """
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    names = set()
+    for query_counts in sample_counts.values():
+        for counts in query_counts:
+            names.update(counts)
+
+    rows = []
+    for name in names:
+        estimate = variance = 0.0
+        strata_values = [(populations[key], [counts.get(name, 0) for counts in query_counts]) for key, query_counts in sample_counts.items() if query_counts]
+        spreads = [_spread(values) for _, values in strata_values if len(values) > 1]
+        every_value = [value for _, values in strata_values for value in values]
+        # Conservative stand-in for strata sampled once; with a single query in the whole sample, its value squared
+        fallback = max([*spreads, _spread(every_value)]) if len(every_value) > 1 else max(every_value, default=0) ** 2
+        for population, values in strata_values:
+            sampled = len(values)
+            estimate += population * sum(values) / sampled
+            spread = _spread(values) if sampled > 1 else fallback
+            variance += population ** 2 * (1 - sampled / population) * spread / sampled
+        observed = sum(every_value)
+        margin = z * math.sqrt(variance)
+        rows.append((name, estimate, max(estimate - margin, float(observed)), estimate + margin, observed))
+    frame = pd.DataFrame(rows, columns=["Name", "Estimated Frequency", "CI Lower", "CI Upper", "Sample Frequency"])
+    return frame.sort_values(by=["Estimated Frequency", "Name"], ascending=[False, True], ignore_index=True)
+
+
+def _spread(values: List[int]) -> float:
+    """Sample variance of at least two values."""
+    mean = sum(values) / len(values)
+    return sum((value - mean) ** 2 for value in values) / (len(values) - 1)
+
+
+def rank_stability(estimates: pd.DataFrame, top_n: int) -> pd.DataFrame:
+    """Top-N rows with the range of ranks each name could hold given every interval, and whether it is surely in the top N.
+
+    A name's best rank counts the names whose lower bound beats its upper bound; its worst rank counts the names whose
+    upper bound reaches its lower bound. A rank range of one value means the sample already settles that position.
+    """
+    lowers = estimates["CI Lower"].tolist()
+    uppers = estimates["CI Upper"].tolist()
+    top = estimates.head(top_n).copy()
+    best_ranks, worst_ranks = [], []
+    for position in range(len(top)):
+        best_ranks.append(1 + sum(1 for other, lower in enumerate(lowers) if other != position and lower > uppers[position]))
+        worst_ranks.append(1 + sum(1 for other, upper in enumerate(uppers) if other != position and upper >= lowers[position]))
+    top.insert(0, "Rank", range(1, len(top) + 1))
+    top["Rank Range"] = [f"{best}-{worst}" if best != worst else str(best) for best, worst in zip(best_ranks, worst_ranks)]
+    top["Surely Top N"] = [worst <= top_n for worst in worst_ranks]
+    return top
+
+
+def strata_frame(populations: Dict[Tuple[Any, ...], int], sampled: Dict[Tuple[Any, ...], int], groups: Dict[Tuple[Any, ...], Tuple[Any, ...]],
+                 strata: Sequence[str]) -> pd.DataFrame:
+    """One row per stratum: its key columns, population, sample size and whether it was sampled in the pool."""
+    rows = [(*key, population, sampled.get(key, 0), groups[key] == POOLED_STRATUM) for key, population in populations.items()]
+    frame = pd.DataFrame(rows, columns=[*strata, "Queries", "Sampled", "Pooled"])
+    return frame.sort_values(by="Queries", ascending=False, ignore_index=True)
+
+
+def sample_preview(results: List[Dict[str, Any]], sample_strata: Dict[int, Tuple[Any, ...]], populations: Dict[Tuple[Any, ...], int],
+                   groups: Dict[Tuple[Any, ...], Tuple[Any, ...]], element_counts: Any, top_n: int,
+                   confidence: float = SAMPLE_CONFIDENCE) -> Dict[str, pd.DataFrame]:
+    """Ranked estimates per element kind from the analyzed sample; queries that failed to parse count as contributing nothing.
+
+    Strata are estimated by sampling group, so pooled strata count as one. element_counts(query_result) returns
+    {kind: Counter} for one query, the same elements a full run would count.
+    """
+    group_populations: Counter = Counter()
+    for key, group in groups.items():
+        group_populations[group] += populations[key]
+    per_query: Dict[int, Dict[str, Counter]] = {result["Query Index"]: element_counts(result) for result in results}
+    kinds = sorted({kind for counts in per_query.values() for kind in counts})
+    previews = {}
+    for kind in kinds:
+        sample_counts: Dict[Tuple[Any, ...], List[Counter]] = {group: [] for group in group_populations}
+        for index, key in sample_strata.items():
+            sample_counts[groups[key]].append(per_query.get(index, {}).get(kind, Counter()))
+        previews[kind] = rank_stability(estimate_totals(sample_counts, group_populations, confidence), top_n)
+    return previews
@@ -0,0 +1,99 @@
+import heapq
+import logging
+import math
+import re
+from itertools import islice
+from typing import Dict, List, Tuple, Any, Iterable, Iterator
+
+# Cost-based scheduling: spread a skewed mix of query sizes evenly over pool tasks and Spark partitions
+
+SCHEDULES = ("balanced", "input")
+# Queries buffered per packing window, as a multiple of workers * chunk_size
+WINDOW_CHUNKS_PER_WORKER = 4
+# Cost weights, in characters of SQL: each CTE and each level of parenthesis nesting adds parser work beyond its length
+CTE_COST = 2000
+NESTING_COST = 500
+
+CTE_DEFINITION_REGEX = re.compile(r"\b\w+\s+AS\s*\(", re.IGNORECASE)
+
+
+def max_nesting_depth(query: str) -> int:
+    """Deepest parenthesis nesting in the query text."""
+    depth = deepest = 0
+    for char in query:
+        if char == "(":
+            depth += 1
+            deepest = max(deepest, depth)
+        elif char == ")":
+            depth = max(depth - 1, 0)
+    return deepest
+
+
+def estimate_cost(query: Any) -> float:
+    """Estimate the analysis cost of a query from its length, CTE count and nesting depth."""
+    if not isinstance(query, str):
+        # Queries read from a pack carry the cost estimated when it was packed
+        return getattr(query, "cost", 1.0)
+    cte_count = len(CTE_DEFINITION_REGEX.findall(query)) if "with" in query.lower() else 0
+    return len(query) + CTE_COST * cte_count + NESTING_COST * max_nesting_depth(query)
+
+
+class BinPacker:
+    """Largest-first assignment of items to the least-loaded of a fixed set of bins, keeping the loads between calls.
+
+    Packing a stream one window at a time with the same packer evens the bins out over the whole stream, while only
+    one window of items is ever held.
+    """
+
+    def __init__(self, bins: int):
+        self.loads = [(0.0, index) for index in range(max(bins, 1))]
+
+    def assign(self, items: Iterable[Tuple[Any, float]]) -> List[Tuple[Any, int]]:
+        """Return (item, bin index) for each (item, cost) pair, largest cost first."""
+        assigned = []
+        for item, cost in sorted(items, key=lambda entry: entry[1], reverse=True):
+            load, index = heapq.heappop(self.loads)
+            assigned.append((item, index))
+            heapq.heappush(self.loads, (load + cost, index))
+        return assigned
+
+
+def pack_bins(items: Iterable[Tuple[Any, float]], bins: int) -> List[Tuple[float, List[Any]]]:
+    """Assign (item, cost) pairs largest-first to the least-loaded of `bins` bins; return (load, items) heaviest first."""
+    packer = BinPacker(bins)
+    contents: List[List[Any]] = [[] for _ in packer.loads]
+    for item, index in packer.assign(items):
+        contents[index].append(item)
+    packed = sorted(((load, contents[index]) for load, index in packer.loads), key=lambda entry: entry[0], reverse=True)
+    return [(load, bin_items) for load, bin_items in packed if bin_items]
+
+
+def balanced_chunks(pairs: Iterable[Tuple[int, Any]], chunk_size: int, window: int) -> Iterator[List[Tuple[int, Any]]]:
+    """Bin-pack each window of (index, query) pairs into chunks of similar cost, yielding the heaviest chunk first."""
+    iterator = iter(pairs)
+    while True:
+        block = list(islice(iterator, window))
+        if not block:
+            return
+        bins = math.ceil(len(block) / chunk_size)
+        packed = pack_bins(((pair, estimate_cost(pair[1])) for pair in block), bins)
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("balanced_chunks: packed %d queries into %d chunks, loads=%s", len(block), len(packed), [round(load) for load, _ in packed])
+        for _, chunk in packed:
+            yield chunk
+
+
+def task_summary(task_seconds: List[float]) -> Dict[str, float]:
+    """Count, mean and max of per-task wall times, plus the max/mean skew ratio."""
+    if not task_seconds:
+        return {"Tasks": 0, "Task Seconds Mean": 0.0, "Task Seconds Max": 0.0, "Task Skew": 0.0}
+    mean = sum(task_seconds) / len(task_seconds)
+    longest = max(task_seconds)
+    return {"Tasks": len(task_seconds), "Task Seconds Mean": mean, "Task Seconds Max": longest,
+            "Task Skew": longest / mean if mean else 0.0}
+
+
+def format_task_summary(summary: Dict[str, float]) -> str:
+    """Render a task_summary as a one-line report."""
+    return (f"Tasks: {summary['Tasks']}, mean {summary['Task Seconds Mean']:.3f}s, "
+            f"max {summary['Task Seconds Max']:.3f}s (max/mean skew {summary['Task Skew']:.2f}x)")
@@ -0,0 +1,207 @@
+import logging
+import os
+from typing import Dict, List, Any
+from Metrics import METRIC_COLUMNS
+
+# Columnar (Parquet / Arrow IPC) output written incrementally as query results arrive
+
+OUTPUT_FORMATS = ("excel", "parquet", "arrow")
+ROW_GROUP_SIZE = 10000
+FILE_EXTENSIONS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+
+def _import_pyarrow():
+    """Import pyarrow on first use so Excel-only runs do not need it."""
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Parquet/Arrow output requires pyarrow (pip install pyarrow)") from e
+    return pyarrow
+
+
+def output_schemas() -> Dict[str, Any]:
+    """Arrow schemas of the tables written for every run."""
+    pa = _import_pyarrow()
+    string_list = pa.list_(pa.string())
+    cte_list = pa.list_(pa.struct([("name", pa.string()), ("body", pa.string())]))
+    return {
+        "queries": pa.schema([
+            ("query_index", pa.int64()),
+            ("query", pa.string()),
+            ("parser_tier", pa.string()),
+            ("db_links", string_list),
+            ("hints", string_list),
+            ("ctes", cte_list),
+            ("aliases", pa.list_(pa.struct([("alias", pa.string()), ("target", pa.string())]))),
+            ("table_count", pa.int32()),
+            ("join_count", pa.int32()),
+            ("sub_query_count", pa.int32()),
+            ("has_where_clause", pa.bool_()),
+            ("has_group_by", pa.bool_()),
+        ]),
+        "tables": pa.schema([("query_index", pa.int64()), ("sub_query_index", pa.int32()), ("table", pa.string())]),
+        "columns": pa.schema([("query_index", pa.int64()), ("sub_query_index", pa.int32()), ("clause", pa.string()), ("column", pa.string())]),
+        "ctes": pa.schema([("query_index", pa.int64()), ("sub_query_index", pa.int32()), ("cte", pa.string())]),
+        "cte_tables": pa.schema([("query_index", pa.int64()), ("cte", pa.string()), ("table", pa.string())]),
+        "joins": pa.schema([("query_index", pa.int64()), ("join", pa.string())]),
+        "sub_queries": pa.schema([
+            ("query_index", pa.int64()),
+            ("sub_query_index", pa.int32()),
+            ("sub_query", pa.string()),
+            ("tables", string_list),
+            ("columns", string_list),
+            ("ctes", cte_list),
+        ]),
+        "metrics": pa.schema([
+            ("query_index", pa.int64()),
+            *[(column.lower().replace(" ", "_"), pa.int32()) for column in METRIC_COLUMNS[:-1]],
+            ("columns_in_final_select", string_list),
+        ]),
+        "errors": pa.schema([("query_index", pa.int64()), ("error", pa.string()), ("query", pa.string())]),
+    }
+
+
+def _cte_entries(ctes: Dict[str, str]) -> List[Dict[str, str]]:
+    """Turn a CTE name -> body mapping into list<struct> entries."""
+    return [{"name": name, "body": body} for name, body in ctes.items()]
+
+
+class ColumnarSink:
+    """Buffer result rows per table and flush them as Parquet row groups or Arrow record batches."""
+
+    def __init__(self, output_dir: str, output_format: str = "parquet", row_group_size: int = ROW_GROUP_SIZE):
+        if output_format not in FILE_EXTENSIONS:
+            raise ValueError(f"Unsupported columnar format '{output_format}'")
+        self.pa = _import_pyarrow()
+        self.output_dir = output_dir
+        self.output_format = output_format
+        self.row_group_size = row_group_size
+        self.schemas = output_schemas()
+        self.buffers: Dict[str, List[Dict[str, Any]]] = {name: [] for name in self.schemas}
+        self.writers: Dict[str, Any] = {}
+        os.makedirs(output_dir, exist_ok=True)
+
+    def path(self, table: str) -> str:
+        """File holding one output table."""
+        return os.path.join(self.output_dir, table + FILE_EXTENSIONS[self.output_format])
+
+    def write_result(self, query_result: Dict[str, Any]) -> None:
+        """Split one analyze_query result into rows of the output tables."""
+        idx = query_result["Query Index"]
+        self._add("queries", {
+            "query_index": idx,
+            "query": query_result["Query"],
+            "parser_tier": query_result["Parser Tier"],
+            "db_links": query_result["DB Links"],
+            "hints": query_result["Hints"],
+            "ctes": _cte_entries(query_result["CTEs"]),
+            "aliases": [{"alias": alias, "target": target} for alias, target in query_result["Aliases"].items()],
+            "table_count": len(query_result["Tables"]),
+            "join_count": len(query_result["Joins"]),
+            "sub_query_count": len(query_result["Sub-Queries"]),
+            "has_where_clause": len(query_result["Where Columns"]) > 0,
+            "has_group_by": len(query_result["Group By"]) > 0,
+        })
+        if query_result.get("Metrics"):
+            self._add("metrics", {"query_index": idx, **{column.lower().replace(" ", "_"): value for column, value in query_result["Metrics"].items()}})
+        for table in query_result["Tables"]:
+            self._add("tables", {"query_index": idx, "sub_query_index": None, "table": table})
+        for clause, field in (("where", "Where Columns"), ("group by", "Group By")):
+            for column in query_result[field]:
+                self._add("columns", {"query_index": idx, "sub_query_index": None, "clause": clause, "column": column})
+        for cte in query_result["CTEs"]:
+            self._add("ctes", {"query_index": idx, "sub_query_index": None, "cte": cte})
+        for cte, lineage in query_result["CTE Lineage"].items():
+            for table in lineage["Tables"]:
+                self._add("cte_tables", {"query_index": idx, "cte": cte, "table": table})
+        for join in query_result["Joins"]:
+            self._add("joins", {"query_index": idx, "join": join})
+        for sub_query in query_result["Sub-Queries"]:
+            sub_idx = sub_query["Sub-Query Index"]
+            self._add("sub_queries", {
+                "query_index": idx,
+                "sub_query_index": sub_idx,
+                "sub_query": sub_query["Sub-Query"],
+                "tables": sub_query["Tables"],
+                "columns": sub_query["Columns"],
+                "ctes": _cte_entries(sub_query["CTEs"]),
+            })
+            for table in sub_query["Tables"]:
+                self._add("tables", {"query_index": idx, "sub_query_index": sub_idx, "table": table})
+            for column in sub_query["Columns"]:
+                self._add("columns", {"query_index": idx, "sub_query_index": sub_idx, "clause": "sub-query", "column": column})
+            for cte in sub_query["CTEs"]:
+                self._add("ctes", {"query_index": idx, "sub_query_index": sub_idx, "cte": cte})
+
+    def write_error(self, error_log: Dict[str, Any]) -> None:
+        """Record a query that could not be analyzed."""
+        query = error_log.get("Query")
+        self._add("errors", {"query_index": error_log["Query Index"], "error": error_log["Error"],
+                             "query": query if isinstance(query, str) else None})
+
+    def _add(self, table: str, row: Dict[str, Any]) -> None:
+        buffer = self.buffers[table]
+        buffer.append(row)
+        if len(buffer) >= self.row_group_size:
+            self._flush(table)
+
+    def _flush(self, table: str) -> None:
+        """Write a table's buffered rows as one row group / record batch."""
+        buffer = self.buffers[table]
+        if not buffer:
+            return
+        self._writer(table).write_batch(self.pa.RecordBatch.from_pylist(buffer, schema=self.schemas[table]))
+        self.buffers[table] = []
+
+    def _writer(self, table: str) -> Any:
+        """Open a table's file on first write."""
+        if table not in self.writers:
+            if self.output_format == "parquet":
+                self.writers[table] = self.pa.parquet.ParquetWriter(self.path(table), self.schemas[table])
+            else:
+                self.writers[table] = self.pa.ipc.new_file(self.path(table), self.schemas[table])
+        return self.writers[table]
+
+    def close(self) -> None:
+        """Flush what is left and close every file; empty tables are still written so readers find them."""
+        for table in self.schemas:
+            self._flush(table)
+            self._writer(table).close()
+        logging.info(f"ColumnarSink: wrote {len(self.schemas)} tables to {self.output_dir}")
+
+
+def read_table(output_dir: str, table: str, output_format: str = "parquet") -> Any:
+    """Load one output table back as a pyarrow Table."""
+    pa = _import_pyarrow()
+    path = os.path.join(output_dir, table + FILE_EXTENSIONS[output_format])
+    if output_format == "parquet":
+        return pa.parquet.read_table(path)
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def write_excel_summary(output_dir: str, output_format: str, output_file: str, top_n: int) -> None:
+    """Build the Excel summary (critical elements, problem queries, per-query flags) from the columnar files."""
+    import pandas as pd
+    import pyarrow.compute as pc
+
+    def top(table: str, column: str, label: str, rows: Any = None) -> Any:
+        rows = read_table(output_dir, table, output_format) if rows is None else rows
+        counts = rows.group_by(column).aggregate([(column, "count")])
+        frame = counts.to_pandas().rename(columns={column: label, f"{column}_count": "Frequency"})
+        return frame.sort_values(by="Frequency", ascending=False, kind="stable").head(top_n)
+
+    queries = read_table(output_dir, "queries", output_format).drop_columns(["query", "db_links", "hints", "ctes", "aliases"]).to_pandas()
+    errors = read_table(output_dir, "errors", output_format).to_pandas()
+    with pd.ExcelWriter(output_file) as writer:
+        top("tables", "table", "Table").to_excel(writer, sheet_name="Critical Tables", index=False)
+        # Sub-query rows repeat the statement's own clause columns, so only the latter are ranked
+        columns = read_table(output_dir, "columns", output_format)
+        columns = columns.filter(pc.field("clause") != "sub-query")
+        top("columns", "column", "Column", columns).to_excel(writer, sheet_name="Critical Columns", index=False)
+        top("ctes", "cte", "CTE").to_excel(writer, sheet_name="Critical CTEs", index=False)
+        if not errors.empty:
+            errors.to_excel(writer, sheet_name="Problematic Queries", index=False)
+        queries.sort_values(by="query_index").to_excel(writer, sheet_name="Query-Level Analysis", index=False)
@@ -0,0 +1,148 @@
+import hashlib
+import math
+from array import array
+from typing import Dict, List, Tuple, Any, Optional
+import Identifiers
+
+# Bounded-memory, mergeable frequency summaries for approximate top-N rankings over very large corpora
+
+TOP_N_MODES = ("exact", "approx")
+# Items tracked by each Space-Saving summary; top-N lists are exact for items far above the error floor
+SKETCH_CAPACITY = 1000
+# Count-Min dimensions: estimates exceed the true count by at most e/width of the total with probability 1 - e^-depth
+COUNT_MIN_WIDTH = 2048
+COUNT_MIN_DEPTH = 4
+
+
+class SpaceSaving:
+    """Space-Saving heavy-hitter summary with batched eviction.
+
+    Every tracked item's count overestimates its true count by at most its recorded error, and any item whose
+    true count exceeds `floor` is guaranteed to be tracked. Summaries built on separate workers merge into one.
+    """
+
+    def __init__(self, capacity: int = SKETCH_CAPACITY):
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        # Largest count evicted so far: the most an untracked item can have been seen
+        self.floor = 0
+        self.total = 0
+
+    def add(self, item: str, count: int = 1) -> None:
+        self.total += count
+        if item in self.counts:
+            self.counts[item] += count
+            return
+        self.counts[item] = self.floor + count
+        self.errors[item] = self.floor
+        # Evict in batches so each addition stays O(1) amortized
+        if len(self.counts) > 2 * self.capacity:
+            self._prune()
+
+    def _prune(self) -> None:
+        """Keep the `capacity` largest counters, raising the floor to the largest one dropped."""
+        if len(self.counts) <= self.capacity:
+            return
+        ranked = sorted(self.counts, key=self.counts.__getitem__, reverse=True)
+        for item in ranked[self.capacity:]:
+            self.floor = max(self.floor, self.counts.pop(item))
+            del self.errors[item]
+
+    def merge(self, other: "SpaceSaving") -> None:
+        """Fold another summary in; items missing from one side may have been seen up to that side's floor."""
+        for item in set(self.counts) | set(other.counts):
+            self.counts[item] = self.counts.get(item, self.floor) + other.counts.get(item, other.floor)
+            self.errors[item] = self.errors.get(item, self.floor) + other.errors.get(item, other.floor)
+        self.floor += other.floor
+        self.total += other.total
+        self._prune()
+
+    def top(self, n: Optional[int] = None) -> List[Tuple[str, int, int]]:
+        """(item, estimated count, maximum overcount) for the n largest counters, largest first."""
+        ranked = sorted(self.counts.items(), key=lambda entry: entry[1], reverse=True)[:n]
+        return [(item, count, self.errors[item]) for item, count in ranked]
+
+
+class CountMin:
+    """Count-Min sketch: a fixed depth x width grid of counters whose row minimum upper-bounds each item's count."""
+
+    def __init__(self, width: int = COUNT_MIN_WIDTH, depth: int = COUNT_MIN_DEPTH):
+        self.width = width
+        self.depth = depth
+        self.table = array("q", bytes(8 * width * depth))
+        self.total = 0
+
+    def _cells(self, item: str) -> List[int]:
+        """One cell per row, from two halves of one stable digest (Python's own hash differs between processes)."""
+        digest = hashlib.blake2b(item.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return [row * self.width + (first + row * second) % self.width for row in range(self.depth)]
+
+    def add(self, item: str, count: int = 1) -> None:
+        self.total += count
+        for cell in self._cells(item):
+            self.table[cell] += count
+
+    def estimate(self, item: str) -> int:
+        return min(self.table[cell] for cell in self._cells(item))
+
+    def error_bound(self) -> float:
+        """Overestimate that holds for any one item with probability 1 - e^-depth."""
+        return math.e / self.width * self.total
+
+    def merge(self, other: "CountMin") -> None:
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise ValueError("Count-Min sketches with different dimensions cannot be merged")
+        for cell, value in enumerate(other.table):
+            self.table[cell] += value
+        self.total += other.total
+
+
+class SketchCounter:
+    """Approximate drop-in for IdentifierCounter: a Space-Saving summary for candidates plus a Count-Min sketch for tighter bounds.
+
+    With resolve_synonyms, names are mapped through the loaded synonyms before counting, as in IdentifierCounter.
+    """
+
+    def __init__(self, capacity: int = SKETCH_CAPACITY, resolve_synonyms: bool = False):
+        self.heavy_hitters = SpaceSaving(capacity)
+        self.count_min = CountMin()
+        self.resolve_synonyms = resolve_synonyms
+
+    def __len__(self) -> int:
+        return len(self.heavy_hitters.counts)
+
+    def _add(self, name: str, count: int) -> None:
+        if self.resolve_synonyms:
+            name = Identifiers.SYNONYMS.get(name, name)
+        self.heavy_hitters.add(name, count)
+        self.count_min.add(name, count)
+
+    def update(self, names: Any) -> None:
+        """Count an iterable of names, add a mapping's counts, or merge another SketchCounter."""
+        if isinstance(names, SketchCounter):
+            self.heavy_hitters.merge(names.heavy_hitters)
+            self.count_min.merge(names.count_min)
+            return
+        if hasattr(names, "items"):
+            for name, count in names.items():
+                self._add(name, count)
+            return
+        for name in names:
+            self._add(name, 1)
+
+    def top(self, n: Optional[int] = None) -> List[Tuple[str, int, int]]:
+        """(name, upper bound, lower bound) for the n heaviest candidates, ranked by upper bound."""
+        rows = []
+        for name, count, error in self.heavy_hitters.top():
+            upper = min(count, self.count_min.estimate(name))
+            rows.append((name, upper, max(count - error, 0)))
+        rows.sort(key=lambda row: row[1], reverse=True)
+        return rows[:n]
+
+    def most_common(self, n: Optional[int] = None) -> List[Tuple[str, int]]:
+        return [(name, upper) for name, upper, _ in self.top(n)]
+
+    def items(self) -> List[Tuple[str, int]]:
+        return self.most_common()
@@ -0,0 +1,200 @@
+import hashlib
+import logging
+import re
+from collections import Counter
+from typing import Dict, List, Tuple, Any
+import sqlglot
+from sqlglot import parse_one
+from Visitor import visit_statement
+from Fingerprint import strip_literals
+from FastScan import scan_query
+from Identifiers import canonical_reference
+from Profiling import PROFILER
+
+try:
+    import sqlparse
+    from sqlparse import sql as sqlparse_sql, tokens as sqlparse_tokens
+except ImportError:
+    sqlparse = None
+
+# Parser fallback chain: each tier is tried in order until one can extract the statement's elements
+
+PARSER_TIERS = ("oracle", "generic", "sqlparse", "regex")
+# Tiers reported in the summary: the parser tiers, plus the token scan of --mode fast
+SUMMARY_TIERS = (*PARSER_TIERS, "fast")
+SQLGLOT_DIALECTS = {"oracle": "oracle", "generic": None}
+
+# Last-resort extraction of FROM/JOIN targets, with an optional alias
+REGEX_TABLE = re.compile(r"\b(?:FROM|JOIN)\s+([\w$#]+(?:\.[\w$#]+)*(?:@[\w$#.]+)?)(?:\s+(?:AS\s+)?([\w$#]+))?", re.IGNORECASE)
+REGEX_JOIN = re.compile(r"\b((?:(?:LEFT|RIGHT|FULL|INNER|CROSS|NATURAL)\s+)?(?:OUTER\s+)?JOIN)\s+([\w$#]+(?:\.[\w$#]+)*(?:@[\w$#.]+)?)", re.IGNORECASE)
+REGEX_NOT_ALIAS = {"WHERE", "JOIN", "INNER", "LEFT", "RIGHT", "FULL", "CROSS", "NATURAL", "OUTER", "ON", "USING", "GROUP",
+                   "ORDER", "HAVING", "UNION", "INTERSECT", "MINUS", "EXCEPT", "CONNECT", "START", "WITH", "FETCH", "FOR"}
+
+
+def empty_elements() -> Dict[str, Any]:
+    """Elements of a statement nothing could be extracted from, shaped like visit_statement's output."""
+    return {"Base Tables": [], "Joins": [], "Aliases": {}, "Where Columns": [], "Group By": [], "Sub-Queries": [], "Select Aliases": {},
+            "CTEs": {}, "CTE Lineage": {}}
+
+
+def failure_key(query: str) -> str:
+    """Key for remembering failed tiers: literal-insensitive, and tied to the parser versions that failed."""
+    versions = f"{sqlglot.__version__}:{sqlparse.__version__ if sqlparse else ''}"
+    return hashlib.blake2b(f"{versions}\0{strip_literals(query)}".encode("utf-8", "surrogatepass"), digest_size=16).hexdigest()
+
+
+def sqlglot_elements(query: str, tier: str, parse_cache: Any) -> Dict[str, Any]:
+    """Parse with sqlglot in the tier's dialect and walk the tree."""
+    dialect = SQLGLOT_DIALECTS[tier]
+    with PROFILER.phase("parse"):
+        tree = parse_cache.get_or_parse(query, lambda sql: parse_one(sql, dialect=dialect), namespace=tier)
+    if tree is None:
+        raise ValueError(f"sqlglot ({tier}) returned no statement")
+    with PROFILER.phase("walk"):
+        return visit_statement(tree)
+
+
+def _is_select(parenthesis: Any) -> bool:
+    return any(token.ttype in sqlparse_tokens.DML and token.normalized == "SELECT" for token in parenthesis.tokens)
+
+
+def _clause_columns(tokens: List[Any], stack: List[Any]) -> List[str]:
+    """Column names referenced in a WHERE/GROUP BY clause; nested SELECTs are pushed onto stack to be walked on their own."""
+    columns = []
+    pending = list(reversed(tokens))
+    while pending:
+        token = pending.pop()
+        if isinstance(token, sqlparse_sql.Parenthesis) and _is_select(token):
+            stack.append(token)
+        elif isinstance(token, sqlparse_sql.Identifier) and not any(isinstance(child, (sqlparse_sql.Parenthesis, sqlparse_sql.Function)) for child in token.tokens):
+            if token.get_real_name():
+                columns.append(canonical_reference(token.get_real_name()))
+        elif isinstance(token, sqlparse_sql.Function):
+            # Only the arguments hold columns, not the function name
+            pending.extend(reversed([child for child in token.tokens if isinstance(child, sqlparse_sql.Parenthesis)]))
+        elif token.is_group:
+            pending.extend(reversed(token.tokens))
+    return columns
+
+
+def sqlparse_elements(query: str) -> Dict[str, Any]:
+    """Token-level pass over sqlparse's grouping: FROM/JOIN targets, aliases, join conditions and clause columns."""
+    if sqlparse is None:
+        raise ImportError("sqlparse is not installed")
+    statements = [statement for statement in sqlparse.parse(query) if statement.tokens]
+    if not statements:
+        raise ValueError("sqlparse found no statement")
+    elements = empty_elements()
+
+    # Explicit stack of token groups still to walk, as in visit_statement
+    stack = [statements[0]]
+    while stack:
+        group = stack.pop()
+        expect = None
+        join_keyword = None
+        for token in group.tokens:
+            if token.is_whitespace or token.ttype in sqlparse_tokens.Comment or token.ttype in sqlparse_tokens.Punctuation:
+                continue
+            if token.is_keyword:
+                keyword = token.normalized
+                if keyword == "FROM" or keyword.endswith("JOIN"):
+                    expect = "table"
+                    join_keyword = keyword if keyword.endswith("JOIN") else None
+                elif keyword == "GROUP BY":
+                    expect = "group"
+                elif keyword == "ON" and join_keyword:
+                    expect = "on"
+                else:
+                    expect = None
+                continue
+            if isinstance(token, sqlparse_sql.Where):
+                elements["Where Columns"].extend(_clause_columns(token.tokens, stack))
+            elif expect == "table":
+                targets = token.get_identifiers() if isinstance(token, sqlparse_sql.IdentifierList) else [token]
+                for target in targets:
+                    derived = next((child for child in target.tokens if isinstance(child, sqlparse_sql.Parenthesis)), None) if target.is_group else None
+                    if isinstance(target, sqlparse_sql.Identifier) and derived is None and target.get_real_name():
+                        schema = target.get_parent_name()
+                        table_name = canonical_reference(f"{schema}.{target.get_real_name()}" if schema else target.get_real_name())
+                        elements["Base Tables"].append(table_name)
+                        if target.get_alias():
+                            elements["Aliases"][target.get_alias()] = table_name
+                    elif target.is_group:
+                        stack.append(target)
+                if join_keyword:
+                    elements["Joins"].append(f"{join_keyword} {token}")
+            elif expect == "on":
+                elements["Joins"][-1] += f" ON {token}"
+                join_keyword = None
+            elif expect == "group":
+                elements["Group By"].extend(_clause_columns([token], stack))
+            elif token.is_group:
+                stack.append(token)
+            expect = None
+    return elements
+
+
+def _regex_table_name(reference: str) -> str:
+    """Canonical name of a [schema.]table[@dblink] reference."""
+    return canonical_reference(reference)
+
+
+def regex_elements(query: str) -> Dict[str, Any]:
+    """Last resort: FROM/JOIN targets and join types found by regular expressions."""
+    elements = empty_elements()
+    for match in REGEX_TABLE.finditer(query):
+        table_name = _regex_table_name(match.group(1))
+        elements["Base Tables"].append(table_name)
+        alias = match.group(2)
+        if alias and alias.upper() not in REGEX_NOT_ALIAS:
+            elements["Aliases"][alias] = table_name
+    elements["Joins"] = [f"{join_type.upper()} {target}" for join_type, target in REGEX_JOIN.findall(query)]
+    return elements
+
+
+def _with_scanned_ctes(query: str, elements: Dict[str, Any]) -> Dict[str, Any]:
+    """Fill in CTE names from the token stream for tiers without an AST, and drop references to them from the base tables.
+
+    Only names are known this way, so bodies are left empty and no lineage is resolved.
+    """
+    try:
+        cte_names = scan_query(query)["CTEs"]
+    except Exception as e:
+        logging.debug("parse_tiered: CTE scan failed: %s", e)
+        return elements
+    defined = {name.upper() for name in cte_names}
+    elements["CTEs"] = {name: "" for name in cte_names}
+    elements["Base Tables"] = [table for table in elements["Base Tables"] if table.upper() not in defined]
+    return elements
+
+
+def parse_tiered(query: str, parse_cache: Any, failures: Any, store: Any = None) -> Tuple[str, Dict[str, Any]]:
+    """Extract a query's elements with the first tier that succeeds, skipping tiers already known to fail for its fingerprint.
+
+    Returns the tier name with the elements; failed tiers are recorded in failures (and store, when given).
+    """
+    key = failure_key(query)
+    known_failures = failures.failed_tiers(key, store)
+    for tier in PARSER_TIERS:
+        if tier in known_failures:
+            continue
+        try:
+            if tier in SQLGLOT_DIALECTS:
+                return tier, sqlglot_elements(query, tier, parse_cache)
+            if tier == "sqlparse":
+                if sqlparse is None:
+                    continue
+                with PROFILER.phase("fallback"):
+                    return tier, _with_scanned_ctes(query, sqlparse_elements(query))
+            with PROFILER.phase("fallback"):
+                return tier, _with_scanned_ctes(query, regex_elements(query))
+        except Exception as e:
+            logging.debug("parse_tiered: %s failed: %s", tier, e)
+            failures.record_failure(key, tier, store)
+    return "none", empty_elements()
+
+
+def format_tier_summary(tier_counts: Counter, stats: Counter) -> str:
+    """Render how many results each tier produced, and the negative cache's failures and skips, as one line."""
+    produced = ", ".join(f"{tier} {tier_counts[tier]}" for tier in SUMMARY_TIERS)
+    return f"Parser tiers: {produced} ({stats['Tier Failures']} failed parses, {stats['Tier Skips']} skipped as known failures)"
@@ -0,0 +1,151 @@
+import logging
+from typing import Dict, List, Any, Optional, Set
+import sqlglot
+from sqlglot import exp
+from Identifiers import canonical_table, canonical_column, canonical_cte_name
+from Profiling import PROFILER
+
+# Single-pass extraction over a sqlglot tree, shared by SQLGlot.py, SQLParse.py and PySpark.py
+
+# Clauses whose columns are collected, keyed by the result field they feed
+COLUMN_CLAUSES = {exp.Where: "Where Columns", exp.Group: "Group By"}
+
+
+def _is_sub_query(expression: exp.Expression) -> bool:
+    """Match the nodes reported as sub-queries: every Subquery plus any Select not wrapped by a Subquery or CTE."""
+    if isinstance(expression, exp.Subquery):
+        return True
+    return isinstance(expression, exp.Select) and not isinstance(expression.parent, (exp.Subquery, exp.CTE))
+
+
+def _format_join(join: exp.Join) -> str:
+    """Render a join as '<side> <kind> JOIN <table> ON <condition>'."""
+    join_type = " ".join(part for part in (join.side, join.kind, "JOIN") if part)
+    condition = join.args.get("on")
+    return f"{join_type} {join.this} ON {condition}" if condition else f"{join_type} {join.this}"
+
+
+def resolve_cte_lineage(ctes: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, List[str]]]:
+    """Resolve each CTE to the physical tables and columns it reads, directly or through the CTEs it references.
+
+    ctes maps upper-cased CTE names to records with the CTE's "Name", its physical "Tables", "Columns" and the
+    upper-cased names of the CTEs it "References". Each CTE is resolved once and reused by every CTE that
+    references it; references back into a CTE still being resolved (recursive CTEs, cycles) are skipped.
+    """
+    resolved: Dict[str, Dict[str, Set[str]]] = {}
+    for root in ctes:
+        # Explicit DFS stack of (CTE key, whether its references have been pushed)
+        stack = [(root, False)]
+        in_progress: Set[str] = set()
+        while stack:
+            key, expanded = stack.pop()
+            if key in resolved:
+                continue
+            record = ctes[key]
+            if not expanded:
+                in_progress.add(key)
+                stack.append((key, True))
+                for reference in record["References"]:
+                    if reference not in resolved and reference not in in_progress:
+                        stack.append((reference, False))
+                continue
+            lineage = {"Tables": set(record["Tables"]), "Columns": set(record["Columns"])}
+            for reference in record["References"]:
+                if reference in resolved:
+                    lineage["Tables"] |= resolved[reference]["Tables"]
+                    lineage["Columns"] |= resolved[reference]["Columns"]
+            resolved[key] = lineage
+            in_progress.discard(key)
+    return {ctes[key]["Name"]: {"Tables": sorted(lineage["Tables"]), "Columns": sorted(lineage["Columns"])} for key, lineage in resolved.items()}
+
+
+def visit_statement(parsed_statement: Optional[sqlglot.Expression]) -> Dict[str, Any]:
+    """Collect tables, joins, aliases, WHERE/GROUP BY columns, sub-queries, CTEs and select aliases in one traversal.
+
+    Each sub-query is returned as a record holding its AST node plus the tables, clause columns and
+    CTE nodes found beneath it, so callers never have to re-serialise and re-parse the sub-query text.
+    References to a CTE are not base tables: they become edges of the statement's CTE graph, which is
+    resolved into each CTE's transitive base tables and columns ("CTE Lineage").
+    """
+    tables: List[str] = []
+    joins: List[str] = []
+    aliases: Dict[str, str] = {}
+    select_aliases: Dict[str, str] = {}
+    clause_columns: Dict[str, List[str]] = {field: [] for field in COLUMN_CLAUSES.values()}
+    sub_queries: List[Dict[str, Any]] = []
+    # Upper-cased CTE name -> record; CTE names are only known once the walk is over, so table references wait in table_refs
+    ctes: Dict[str, Dict[str, Any]] = {}
+    table_refs = []
+
+    # Explicit stack of (node, enclosing clause field, enclosing sub-query records, innermost enclosing CTE record)
+    # so deep nesting never hits the recursion limit
+    stack = [(parsed_statement, None, (), None)] if parsed_statement is not None else []
+    while stack:
+        expression, clause, owners, cte = stack.pop()
+
+        if isinstance(expression, exp.Select):
+            # A nested SELECT starts its own clauses; its columns belong to its own WHERE/GROUP BY
+            clause = None
+            for select_exp in expression.expressions:
+                if isinstance(select_exp, exp.Alias) and select_exp.alias:
+                    select_aliases[select_exp.alias] = str(select_exp.this)
+        elif type(expression) in COLUMN_CLAUSES:
+            clause = COLUMN_CLAUSES[type(expression)]
+
+        if _is_sub_query(expression):
+            record = {"Node": expression, "Tables": [], "Columns": [], "CTEs": []}
+            sub_queries.append(record)
+            owners = owners + (record,)
+
+        if isinstance(expression, exp.Table):
+            if expression.name:
+                table_refs.append((expression, owners, cte))
+                if expression.alias:
+                    aliases[expression.alias] = canonical_table(expression)
+        elif isinstance(expression, exp.Join):
+            joins.append(_format_join(expression))
+        elif isinstance(expression, exp.CTE):
+            for owner in owners:
+                owner["CTEs"].append(expression)
+            if expression.alias:
+                record = {"Name": canonical_cte_name(expression), "Node": expression, "Tables": [], "Columns": [], "References": []}
+                # A CTE defined inside another CTE's body is read by it
+                if cte is not None:
+                    cte["References"].append(expression.alias.upper())
+                ctes[expression.alias.upper()] = record
+                cte = record
+        elif isinstance(expression, exp.Column):
+            column_name = canonical_column(expression) if expression.name else None
+            if cte is not None and column_name:
+                cte["Columns"].append(column_name)
+            if clause and column_name:
+                clause_columns[clause].append(column_name)
+                for owner in owners:
+                    owner["Columns"].append(column_name)
+            # Nothing below a column reference needs visiting
+            continue
+
+        children = list(expression.iter_expressions())
+        for child in reversed(children):
+            stack.append((child, clause, owners, cte))
+
+    for table, owners, cte in table_refs:
+        # An unqualified name matching a CTE reads that CTE, not a physical table
+        if not table.db and table.name.upper() in ctes:
+            if cte is not None:
+                cte["References"].append(table.name.upper())
+            continue
+        table_name = canonical_table(table)
+        tables.append(table_name)
+        for owner in owners:
+            owner["Tables"].append(table_name)
+        if cte is not None:
+            cte["Tables"].append(table_name)
+
+    logging.debug("visit_statement: tables=%s, joins=%s, sub_queries=%d, ctes=%d", tables, joins, len(sub_queries), len(ctes))
+    with PROFILER.phase("ctes"):
+        cte_bodies = {record["Name"]: str(record["Node"].this) for record in ctes.values()}
+        cte_lineage = resolve_cte_lineage(ctes)
+    return {"Base Tables": tables, "Joins": joins, "Aliases": aliases, "Where Columns": clause_columns["Where Columns"],
+            "Group By": clause_columns["Group By"], "Sub-Queries": sub_queries, "Select Aliases": select_aliases,
+            "CTEs": cte_bodies, "CTE Lineage": cte_lineage}
@@ -0,0 +1,167 @@
+import logging
+import signal
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import List, Tuple, Any, Callable, Optional, Iterator
+
+# Time budgets for pathological SQL: a soft per-query CPU limit inside workers, and a hard limit enforced by killing workers
+
+QUERY_TIMEOUT = 60
+# A chunk may run this many times its summed soft budgets before its worker is killed
+HARD_TIMEOUT_FACTOR = 2
+HARD_TIMEOUT_GRACE = 10
+
+
+class QueryTimeout(BaseException):
+    """Raised inside a query's analysis when it runs out of CPU budget.
+
+    Derives from BaseException so broad `except Exception` handlers in the parser cannot swallow it.
+    """
+
+    def __init__(self, seconds: float):
+        super().__init__(f"Timed out: analysis exceeded the {seconds:g}s CPU budget")
+
+
+@contextmanager
+def cpu_budget(seconds: Optional[float]) -> Iterator[None]:
+    """Raise QueryTimeout once the block has used `seconds` of CPU time.
+
+    Uses the SIGPROF interval timer, so it only applies on POSIX in a process's main thread; elsewhere
+    the block runs unbounded and only the hard limit in SupervisedPool applies.
+    """
+    if not seconds or not hasattr(signal, "setitimer") or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def expire(signum, frame):
+        raise QueryTimeout(seconds)
+
+    previous = signal.signal(signal.SIGPROF, expire)
+    signal.setitimer(signal.ITIMER_PROF, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, previous)
+
+
+def hard_timeout(chunk_length: int, query_timeout: Optional[float]) -> Optional[float]:
+    """Wall-clock limit for a chunk before its worker is killed; None when budgets are off."""
+    if not query_timeout:
+        return None
+    return query_timeout * chunk_length * HARD_TIMEOUT_FACTOR + HARD_TIMEOUT_GRACE
+
+
+class SupervisedPool:
+    """Process pool whose chunks are watched: a chunk that overruns its hard limit or crashes its worker restarts the pool.
+
+    A chunk that times out is bisected and its halves re-run alongside the other chunks, so the runaway query is
+    narrowed down while the rest of the batch keeps the pool busy; chunks merely interrupted by the restart are re-run
+    whole. A crash breaks every chunk in flight without saying which one caused it, so those chunks are bisected one
+    at a time, alone in the pool, until the query responsible is found. A single query that times out or crashes on its
+    own is handed to on_failure instead of being retried again.
+    """
+
+    def __init__(self, workers: int, task: Callable[[List[Tuple[int, Any]]], Any], query_timeout: Optional[float],
+                 on_failure: Callable[[List[Tuple[int, Any]], str], Any]):
+        self.workers = workers
+        self.task = task
+        self.query_timeout = query_timeout
+        self.on_failure = on_failure
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        # (chunk, future, isolated) in submission order
+        self.pending = deque()
+        # Chunks in flight during a crash, to re-run alone
+        self.suspects = deque()
+        # Chunks held back while suspects are being re-run
+        self.deferred = deque()
+        # on_failure outputs for queries given up on, returned before any further chunk
+        self.failed = deque()
+        self.restarts = 0
+
+    def __len__(self) -> int:
+        return len(self.pending) + len(self.suspects) + len(self.deferred) + len(self.failed)
+
+    def submit(self, chunk: List[Tuple[int, Any]]) -> None:
+        """Queue a chunk, holding it back while crash suspects are still being isolated."""
+        if self.suspects or self.deferred:
+            self.deferred.append(chunk)
+        else:
+            self._start(chunk, False)
+
+    def _start(self, chunk: List[Tuple[int, Any]], isolated: bool) -> None:
+        self.pending.append((chunk, self.executor.submit(self.task, chunk), isolated))
+
+    def _refill(self) -> None:
+        """Start the next crash suspect alone, or resume deferred chunks once every suspect is cleared."""
+        if self.pending:
+            return
+        if self.suspects:
+            self._start(self.suspects.popleft(), True)
+            return
+        while self.deferred and len(self.pending) < self.workers * 2:
+            self._start(self.deferred.popleft(), False)
+
+    def next_result(self) -> Any:
+        """Return the output of the oldest chunk, or on_failure's output for a query that had to be killed."""
+        while True:
+            if self.failed:
+                return self.failed.popleft()
+            self._refill()
+            chunk, future, isolated = self.pending[0]
+            limit = hard_timeout(len(chunk), self.query_timeout)
+            try:
+                output = future.result(timeout=limit)
+            except FutureTimeoutError:
+                self._recover(f"Timed out: exceeded the {limit:g}s hard limit; worker process killed", True)
+            except BrokenProcessPool:
+                self._recover("Worker process crashed (e.g. stack overflow) while analyzing this query", False)
+            else:
+                self.pending.popleft()
+                return output
+
+    def _recover(self, reason: str, timed_out: bool) -> None:
+        """Restart the pool after the oldest chunk failed, keeping finished chunks and re-running the others."""
+        # Which chunks had finished cleanly, taken before the restart breaks every chunk still running
+        finished = [future.done() and not future.cancelled() and future.exception() is None for _, future, _ in self.pending]
+        self._restart()
+        entries, self.pending = list(self.pending), deque()
+        (chunk, _, isolated), others = entries[0], list(zip(entries[1:], finished[1:]))
+        if timed_out or isolated:
+            # The oldest chunk is known to be responsible
+            if len(chunk) == 1:
+                self.failed.append(self.on_failure(chunk, reason))
+            else:
+                middle = len(chunk) // 2
+                halves = [chunk[:middle], chunk[middle:]]
+                if isolated:
+                    self.suspects.extendleft(reversed(halves))
+                else:
+                    for half in halves:
+                        self._start(half, False)
+        else:
+            self.suspects.append(chunk)
+        for (other, future, other_isolated), done in others:
+            if done:
+                self.pending.append((other, future, other_isolated))
+            elif timed_out:
+                self._start(other, other_isolated)
+            else:
+                self.suspects.append(other)
+        logging.warning(f"SupervisedPool: {reason.lower()}; {len(self.suspects)} chunks to re-run alone, {len(self.failed)} queries given up")
+
+    def _restart(self) -> None:
+        """Kill every worker and start a fresh pool."""
+        # ProcessPoolExecutor cannot cancel a running task, so its worker processes are killed directly
+        for process in list(self.executor._processes.values()):
+            process.kill()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        self.restarts += 1
+
+    def shutdown(self) -> None:
+        """Wait for the workers to exit."""
+        self.executor.shutdown(wait=True)